@@ -0,0 +1,30 @@
+set -g fish_greeting ""
+set -gx PATH /usr/local/bin /usr/local/sbin /usr/bin /usr/sbin /bin /sbin $PATH
+set -g fish_color_command green
+set -g fish_color_param normal
+set -g fish_color_error red --bold
+set -g fish_color_quote yellow
+set -g fish_color_autosuggestion 555555
+set -g fish_color_cwd red
+function fish_prompt
+    set_color red
+    echo -n (whoami)
+    set_color 555555
+    echo -n '@'
+    set_color brred
+    echo -n (hostname -s)
+    set_color 555555
+    echo -n ':'
+    set_color blue
+    echo -n (prompt_pwd)
+    set_color 555555
+    echo -n ' > '
+    set_color normal
+end
+alias ll='ls -la'
+alias la='ls -A'
+alias ..='cd ..'
+alias q='exit'
+alias c='clear'
+alias t='tmux'
+alias ta='tmux attach'
@@ -0,0 +1,42 @@
+#!/bin/sh
+# Golden rectangle: A (left 62%) | B (top right 62%) / C (bottom right 38%)
+#
+# i3 builds the layout from golden-3term.json (append_layout): three empty
+# placeholders, each swallowing the terminal whose instance name it matches
+# the moment that window maps.  No fixed sleeps: the terminals start as
+# soon as i3 has acknowledged the window event subscription, and the
+# script exits once all three have been placed.
+TERM_CMD="${TERMINAL:-urxvtc}"
+# Terminal A
+A_CMD="fish"
+# Terminal B
+B_CMD="fish"
+# Terminal C
+C_CMD="fish"
+
+dir=$(dirname "$0")
+fifo=$(mktemp -u /tmp/golden.XXXXXX) && mkfifo "$fifo" || exit 1
+trap 'rm -f "$fifo"' EXIT
+
+i3-msg "workspace 1; append_layout $dir/golden-3term.json" >/dev/null || exit 1
+i3-msg -t subscribe -m '[ "window" ]' > "$fifo" &
+sub=$!
+
+placed=0
+while [ "$placed" -lt 3 ] && read -r event; do
+    case "$event" in
+    *'"success":true'*)
+        $TERM_CMD -name golden-a -e $A_CMD &
+        $TERM_CMD -name golden-b -e $B_CMD &
+        $TERM_CMD -name golden-c -e $C_CMD &
+        ;;
+    *'"change":"new"'*'"instance":"golden-'[abc]'"'*)
+        placed=$((placed + 1))
+        ;;
+    esac
+done < "$fifo"
+kill "$sub" 2>/dev/null
+
+i3-msg '[instance="^golden-a$"] focus' >/dev/null
+# On the serial console, for save-state.mjs
+[ "$placed" -eq 3 ] && logger -p user.err -t golden-3term WEBBSD_LAYOUT_READY
@@ -0,0 +1,3 @@
+#!/bin/sh
+# i3bar status: one long-lived process (scripts/guest/webbsd-status.c).
+exec /usr/local/bin/webbsd-status
@@ -0,0 +1,4 @@
+# Auto-start X if on console ttyv0
+if [ "$(tty)" = "/dev/ttyv0" ]; then
+    exec startx
+fi
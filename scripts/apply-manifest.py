@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Bring the image in line with the declarative desktop manifest.
+
+Diffs desktop/manifest.json (files, packages, sysrc settings, rc.local
+hooks) against images/freebsd.img, read offline, and applies only what
+differs:
+
+  - nothing to do: exits without touching the image
+  - no packages missing: writes the changes offline, no boot at all
+  - otherwise: one boot, one tar stream of every changed file plus one
+    batched script (pkg install, sysrc, rc.local), run as one command
+
+PACKAGES from webbsd.conf are part of the manifest's package list.  Packages
+are installed with the persistent pkg cache attached (see
+webbsd/qemu/pkgcache.py).  DESKTOP_PROFILE drops what a lite or minimal
+desktop leaves out (see webbsd/desktop.py).
+
+Usage:
+    python3 scripts/apply-manifest.py [manifest.json] [--image PATH] [--config CONF] [--dry-run] [--boot]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+from webbsd import BASE, IMAGE, desktop
+from webbsd.config import CONF, load_config
+from webbsd.manifest import (SCRIPT_PATH, PartialApply, apply_offline, build_tar,
+                             extract_command, load_manifest, plan)
+from webbsd.qemu import QEMU, QEMUError
+from webbsd.qemu.transfer import put_file
+from webbsd.ufs import UFS2, UFSError
+
+MANIFEST = os.path.join(BASE, "desktop", "manifest.json")
+
+
+def describe(p):
+    for e in p.files:
+        print(f"  file   {e.path}{'/' if e.is_dir else ''}  {e.mode:04o} {e.owner}")
+    for k, v in p.sysrc.items():
+        print(f"  sysrc  {k}=\"{v}\"")
+    if p.rc_local:
+        print(f"  rc     {len(p.rc_local)} rc.local hook(s)")
+    if p.packages:
+        print(f"  pkg    {' '.join(p.packages)}")
+
+
+async def apply_booted(image, p):
+    tgz = build_tar(p)
+    print(f"\nApplying in one boot: {len(tgz)} byte tar stream + batched script")
+    net = ["-net", "nic,model=e1000", "-net", "user"] if p.packages else None
+    vm = QEMU(image=image, net=net, overlay=True, pkg_cache=bool(p.packages))
+    async with vm:
+        print("Waiting for FreeBSD to boot...")
+        await vm.login()
+        await vm.quiesce()
+        if p.packages:
+            await vm.run("/sbin/dhclient em0 >/dev/null 2>&1", timeout=60)
+        print("  " + str(await put_file(vm, tgz, "/tmp/wbapply.tgz")))
+        result = await vm.run(f"{extract_command('/tmp/wbapply.tgz')} && sh -x {SCRIPT_PATH}",
+                              timeout=3600,
+                              on_output=lambda text: print(text, end="", flush=True))
+        if not result.ok:
+            print(result.stderr[-2000:])
+            raise QEMUError(f"batched apply script failed (exit {result.status})")
+        await vm.shutdown()
+        await vm.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the desktop manifest to the disk image")
+    parser.add_argument("manifest", nargs="?", default=MANIFEST)
+    parser.add_argument("--image", default=IMAGE, help="raw disk image (default: images/freebsd.img)")
+    parser.add_argument("--config", default=CONF, help="build configuration (default: webbsd.conf)")
+    parser.add_argument("--dry-run", action="store_true", help="show the diff and exit")
+    parser.add_argument("--boot", action="store_true", help="apply in a boot even without packages")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    profile = desktop.desktop_profile(cfg.get("DESKTOP_PROFILE", ""))
+    manifest = desktop.adjust(load_manifest(args.manifest, cfg.get("PACKAGES", "").split()), profile)
+    print(f"Desktop profile: {profile.name}")
+
+    try:
+        with UFS2(args.image) as fs:
+            p = plan(manifest, fs)
+    except (UFSError, OSError) as e:
+        print(f"Cannot read image offline ({e}); applying the whole manifest")
+        p = plan(manifest)
+
+    if p.empty:
+        print("Image already matches the manifest.")
+        return 0
+    print("Changes:")
+    describe(p)
+    if args.dry_run:
+        return 0
+
+    if not p.packages and not p.rc_local and not args.boot:
+        try:
+            with UFS2(args.image, writable=True) as fs:
+                print("\nApplying offline:")
+                apply_offline(fs, p)
+            print("Done.")
+            return 0
+        except PartialApply:
+            raise
+        except UFSError as e:
+            print(f"Offline apply not possible ({e}); booting instead")
+
+    asyncio.run(apply_booted(args.image, p))
+    print("Done.")
+    return 0
+
+
+try:
+    sys.exit(main())
+except (QEMUError, UFSError, desktop.ProfileError) as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
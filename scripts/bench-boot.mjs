@@ -0,0 +1,167 @@
+#!/usr/bin/env node
+/**
+ * Measure boot-to-desktop time and idle host CPU of an image in v86.
+ *
+ * Boots the image cold (no saved state; v86 keeps disk writes in memory)
+ * with the same emulator settings as save-state.mjs and records, from
+ * emulator start: the serial login prompt, the switch to graphics mode and
+ * WEBBSD_LAYOUT_READY (the desktop is up).  After a short settle it samples
+ * this process's CPU time, which is the emulator's, for IDLE seconds:
+ * 100% is one host core busy while the guest sits at an idle desktop.
+ *
+ * Each run appends a line to images/logs/bench-boot.jsonl with the
+ * EMULATOR_TUNING, KERN_HZ and DESKTOP_PROFILE in webbsd.conf, so an
+ * untuned and a tuned build can be compared side by side.
+ *
+ * Usage: node scripts/bench-boot.mjs [image] [idle-seconds]
+ */
+
+import path from "node:path";
+import fs from "node:fs";
+import url from "node:url";
+import { V86 } from "../v86/build/libv86.mjs";
+
+const __dirname = url.fileURLToPath(new URL(".", import.meta.url));
+const BASE = path.join(__dirname, "..");
+
+function loadConfig(configPath) {
+    const config = {};
+    const content = fs.readFileSync(configPath, "utf-8");
+    for (const line of content.split("\n")) {
+        const trimmed = line.trim();
+        if (!trimmed || trimmed.startsWith("#")) continue;
+        const eq = trimmed.indexOf("=");
+        if (eq === -1) continue;
+        const key = trimmed.slice(0, eq).trim();
+        let val = trimmed.slice(eq + 1).trim();
+        val = val.replace(/^["']|["']$/g, "");
+        config[key] = val;
+    }
+    return config;
+}
+
+const cfg = loadConfig(path.join(BASE, "webbsd.conf"));
+const V86_MEMORY = parseInt(cfg.V86_MEMORY || "512");
+const V86_VGA_MEMORY = parseInt(cfg.V86_VGA_MEMORY || "32");
+
+const IMAGE_PATH = path.resolve(process.argv[2] || path.join(BASE, "images/freebsd.img"));
+const IDLE_SECONDS = parseInt(process.argv[3] || "60");
+const LOG_PATH = path.join(BASE, "images/logs/bench-boot.jsonl");
+
+var LAYOUT_READY = "WEBBSD_LAYOUT_READY";
+var SETTLE_MS = 10000;
+var TIMEOUT_MS = 10 * 60 * 1000;
+
+if (!fs.existsSync(IMAGE_PATH)) {
+    console.error("Error: disk image not found at " + IMAGE_PATH);
+    process.exit(1);
+}
+
+const imageSize = fs.statSync(IMAGE_PATH).size;
+console.log(`Image: ${IMAGE_PATH} (${Math.round(imageSize / 1048576)} MB)`);
+console.log(`Memory: ${V86_MEMORY} MB, VGA: ${V86_VGA_MEMORY} MB, idle sample: ${IDLE_SECONDS}s`);
+
+var emulator = new V86({
+    wasm_path: path.join(BASE, "v86/build/v86.wasm"),
+    bios: { url: path.join(BASE, "v86/bios/seabios.bin") },
+    vga_bios: { url: path.join(BASE, "v86/bios/vgabios.bin") },
+    hda: { url: IMAGE_PATH, async: true, size: imageSize },
+    memory_size: V86_MEMORY * 1024 * 1024,
+    vga_memory_size: V86_VGA_MEMORY * 1024 * 1024,
+    autostart: true,
+    acpi: true,
+    net_device: { type: "virtio", relay_url: "fetch" },
+    uart1: true,
+});
+
+var startTime = Date.now();
+var serialOutput = "";
+var marks = { login: null, graphics: null, desktop: null };
+
+function seconds(ms) {
+    return Math.round(ms / 100) / 10;
+}
+
+function mark(name) {
+    if (marks[name] === null) {
+        marks[name] = seconds(Date.now() - startTime);
+        console.log(`  ${name.padEnd(9)} ${marks[name]}s`);
+    }
+}
+
+function checkVgaMode() {
+    try {
+        return !!emulator.v86.cpu.devices.vga.graphical_mode;
+    } catch(e) {
+        return false;
+    }
+}
+
+function instructions() {
+    return typeof emulator.get_instruction_counter === "function"
+        ? emulator.get_instruction_counter() : null;
+}
+
+function finish(idle) {
+    var result = {
+        time: new Date().toISOString(),
+        image: path.relative(BASE, IMAGE_PATH),
+        emulator_tuning: cfg.EMULATOR_TUNING || "yes",
+        kern_hz: cfg.KERN_HZ || "",
+        desktop_profile: cfg.DESKTOP_PROFILE || "full",
+        login_s: marks.login,
+        graphics_s: marks.graphics,
+        desktop_s: marks.desktop,
+        ...idle,
+    };
+    fs.mkdirSync(path.dirname(LOG_PATH), { recursive: true });
+    fs.appendFileSync(LOG_PATH, JSON.stringify(result) + "\n");
+    console.log(`\nResult appended to ${path.relative(BASE, LOG_PATH)}`);
+    emulator.destroy();
+    process.exit(marks.desktop === null ? 1 : 0);
+}
+
+function sampleIdle() {
+    console.log(`\nSampling idle for ${IDLE_SECONDS}s...`);
+    var cpu0 = process.cpuUsage();
+    var wall0 = Date.now();
+    var insn0 = instructions();
+    setTimeout(function() {
+        var cpu = process.cpuUsage(cpu0);
+        var wall = (Date.now() - wall0) / 1000;
+        var busy = (cpu.user + cpu.system) / 1e6 / wall * 100;
+        var insn1 = instructions();
+        var idle = { idle_host_cpu_pct: Math.round(busy * 10) / 10 };
+        console.log(`  host CPU  ${idle.idle_host_cpu_pct}% of one core`);
+        if (insn0 !== null && insn1 !== null) {
+            idle.idle_guest_mips = Math.round((insn1 - insn0) / wall / 1e5) / 10;
+            console.log(`  guest     ${idle.idle_guest_mips} M instructions/s`);
+        }
+        finish(idle);
+    }, IDLE_SECONDS * 1000);
+}
+
+emulator.add_listener("serial0-output-byte", function(byte) {
+    // Only a short tail is kept: scanning the whole log per byte would be
+    // measured along with the guest.
+    serialOutput = (serialOutput + String.fromCharCode(byte)).slice(-64);
+    if (serialOutput.includes("login:")) mark("login");
+    if (marks.desktop === null && serialOutput.includes(LAYOUT_READY)) {
+        mark("desktop");
+        clearTimeout(timeout);
+        setTimeout(sampleIdle, SETTLE_MS);
+    }
+});
+
+console.log("Booting...");
+var poll = setInterval(function() {
+    if (checkVgaMode()) {
+        mark("graphics");
+        clearInterval(poll);
+    }
+}, 250);
+
+var timeout = setTimeout(function() {
+    console.log(`\nTIMEOUT: no ${LAYOUT_READY} after ${TIMEOUT_MS / 60000} minutes.`);
+    finish({});
+}, TIMEOUT_MS);
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Measure serial file-transfer throughput into the guest.
+
+Boots the image with snapshot=on (nothing is written back), pushes random
+payloads of a few sizes with webbsd.qemu.transfer.put_file and prints the
+MB/s and SHA-256 result for each.  Transfers go through the guest agent
+when the image has it; --console forces the serial console.
+
+Usage:
+    python3 scripts/bench-transfer.py [--console] [size_kb ...]
+"""
+
+import asyncio, os, sys
+
+from webbsd.qemu import QEMU, QEMUError
+from webbsd.qemu.transfer import put_file
+
+
+async def main(sizes_kb, console):
+    async with QEMU(drive="format=raw,snapshot=on", echo=False, agent=not console) as vm:
+        print("Waiting for FreeBSD to boot...")
+        await vm.login()
+        await vm.quiesce()
+        for kb in sizes_kb:
+            stats = await put_file(vm, os.urandom(kb * 1024), f"/tmp/bench-{kb}k.bin")
+            print(f"  {stats}")
+        await vm.close()
+
+
+console = "--console" in sys.argv
+sizes = [int(a) for a in sys.argv[1:] if a != "--console"] or [64, 512, 2048]
+try:
+    asyncio.run(main(sizes, console))
+except QEMUError as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
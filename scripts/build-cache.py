@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Layered build cache for build-desktop.sh (see webbsd/cache.py).
+
+Usage:
+    python3 scripts/build-cache.py begin
+    python3 scripts/build-cache.py run NAME [--input PATH ...] [--output PATH ...] -- CMD ...
+    python3 scripts/build-cache.py finish
+    python3 scripts/build-cache.py list
+    python3 scripts/build-cache.py clear
+
+``run`` skips CMD when a result with the same input hash is cached.  Its
+script is always an input: the first CMD argument ending in .py/.mjs/.sh.
+Stages without --output produce images/freebsd.img.  Set WEBBSD_NO_CACHE=1
+to run every stage unconditionally.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+from webbsd import BASE
+from webbsd import cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="webBSD layered build cache")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("begin")
+    sub.add_parser("finish")
+    sub.add_parser("list")
+    sub.add_parser("clear")
+    run = sub.add_parser("run")
+    run.add_argument("name")
+    run.add_argument("--input", action="append", default=[], help="extra input file or directory")
+    run.add_argument("--output", action="append", default=[], help="output file (default: the image)")
+    argv = sys.argv[1:]
+    command = []
+    if "--" in argv:
+        command = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv)
+
+    if args.cmd == "begin":
+        cache.begin()
+    elif args.cmd == "finish":
+        cache.finish()
+    elif args.cmd == "list":
+        for name, size, _ in cache.entries():
+            print(f"  {size / 1048576:9.1f} MB  {name}")
+    elif args.cmd == "clear":
+        shutil.rmtree(cache.CACHE_DIR, ignore_errors=True)
+    else:
+        if not command:
+            parser.error("run needs a command after --")
+        scripts = [a for a in command if a.endswith((".py", ".mjs", ".sh"))][:1]
+        inputs = [os.path.relpath(os.path.abspath(p), BASE) for p in scripts + args.input]
+        return cache.run(args.name, inputs, command, args.output)
+    return 0
+
+
+try:
+    sys.exit(main())
+except cache.CacheError as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
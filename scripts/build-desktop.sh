@@ -9,32 +9,54 @@ echo "  webBSD Desktop Builder"
 echo "=============================================="
 echo ""
 echo "This will build a complete FreeBSD desktop image."
-echo "Estimated time: 30-60 minutes"
+echo "Estimated time: 30-60 minutes (stages with unchanged inputs are"
+echo "restored from images/cache/; WEBBSD_NO_CACHE=1 rebuilds everything)"
 echo ""
 
+# Every stage and driver operation is timed into this trace.
+export WEBBSD_TRACE="${WEBBSD_TRACE:-$PROJECT_DIR/images/logs/build-trace.jsonl}"
+
+stage() { python3 "$SCRIPT_DIR/build-cache.py" run "$@"; }
+python3 "$SCRIPT_DIR/build-cache.py" begin
+
 # Step 1: Build base image
-echo ">>> [1/5] Building base FreeBSD image..."
-python3 "$SCRIPT_DIR/build-image.py" "$@"
+echo ">>> [1/7] Building base FreeBSD image..."
+stage base -- python3 "$SCRIPT_DIR/build-image.py" "$@"
 
 # Step 2: Fix image config
 echo ""
-echo ">>> [2/5] Configuring image (hostname, root, SSH, serial)..."
-python3 "$SCRIPT_DIR/fix-image.py"
+echo ">>> [2/7] Configuring image (hostname, root, SSH, serial)..."
+stage fix-image --input scripts/guest -- python3 "$SCRIPT_DIR/fix-image.py"
+
+# Step 3: Slim kernel (KERNEL_BUILD="yes" only; otherwise a no-op)
+echo ""
+echo ">>> [3/7] Building the slim v86 kernel (if KERNEL_BUILD=yes)..."
+stage kernel --input scripts/webbsd/kernel.py -- python3 "$SCRIPT_DIR/build-kernel.py"
+
+# Step 4: Network config
+echo ""
+echo ">>> [4/7] Configuring networking (DNS, DHCP watchdog)..."
+stage network --input scripts/guest/net-watchdog.sh -- python3 "$SCRIPT_DIR/fix-network.py"
+
+# Step 5: Emulator tuning
+echo ""
+echo ">>> [5/7] Tuning the guest for v86 (kern.hz, services, tmpfs)..."
+stage tune --input scripts/webbsd/tuning.py -- python3 "$SCRIPT_DIR/tune-guest.py"
 
-# Step 3: Network config
+# Step 6: Install X11 desktop
 echo ""
-echo ">>> [3/5] Configuring networking (DNS, auto-DHCP)..."
-python3 "$SCRIPT_DIR/fix-network.py"
+echo ">>> [6/7] Installing X11 desktop environment..."
+stage x11 -- python3 "$SCRIPT_DIR/install-x11.py"
 
-# Step 4: Install X11 desktop
+# Step 7: Generate saved state
 echo ""
-echo ">>> [4/5] Installing X11 desktop environment..."
-python3 "$SCRIPT_DIR/install-x11.py"
+echo ">>> [7/7] Generating saved state for instant boot..."
+stage state --output images/freebsd_state.bin --output images/freebsd_state.bin.zst \
+    -- node "$SCRIPT_DIR/save-state.mjs"
+python3 "$SCRIPT_DIR/build-cache.py" finish
 
-# Step 5: Generate saved state
 echo ""
-echo ">>> [5/5] Generating saved state for instant boot..."
-node "$SCRIPT_DIR/save-state.mjs"
+python3 "$SCRIPT_DIR/profile-report.py"
 
 echo ""
 echo "=============================================="
@@ -19,6 +19,9 @@ import signal
 import argparse
 import re
 
+from webbsd import profile
+from webbsd.qemu.matcher import Matcher
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
 IMAGES_DIR = os.path.join(PROJECT_DIR, "images")
@@ -46,7 +49,9 @@ class QEMUAutomator:
     def __init__(self, config):
         self.config = config
         self.proc = None
-        self.buffer = ""
+        self.serial = Matcher()
+        # Stream offset after the last match; older output never matches again.
+        self.cursor = 0
 
     def start_qemu(self, iso_path, img_path):
         """Start QEMU with serial console."""
@@ -71,51 +76,43 @@ class QEMUAutomator:
             stderr=subprocess.PIPE,
         )
 
+    def _pump(self, tick):
+        """Feed whatever QEMU printed within tick seconds to the matcher."""
+        ready, _, _ = select.select([self.proc.stdout], [], [], tick)
+        if ready:
+            try:
+                data = os.read(self.proc.stdout.fileno(), 8192)
+                if data:
+                    sys.stdout.write(data.decode("utf-8", errors="replace"))
+                    sys.stdout.flush()
+                    self.serial.feed(data)
+            except OSError:
+                pass
+
     def wait_for(self, text, timeout=300):
         """Wait for text in output. Returns True if found."""
-        start = time.time()
-        while time.time() - start < timeout:
-            if self.proc.poll() is not None:
-                return False
-            ready, _, _ = select.select([self.proc.stdout], [], [], 0.5)
-            if ready:
-                try:
-                    data = os.read(self.proc.stdout.fileno(), 8192)
-                    if data:
-                        decoded = data.decode("utf-8", errors="replace")
-                        sys.stdout.write(decoded)
-                        sys.stdout.flush()
-                        self.buffer += decoded
-                        if text in self.buffer:
-                            # Keep only recent buffer
-                            self.buffer = self.buffer[-10000:]
-                            return True
-                except OSError:
-                    pass
-        return False
+        return self.wait_for_any([text], timeout) is not None
 
     def wait_for_any(self, texts, timeout=300):
-        """Wait for any of the texts. Returns which one matched or None."""
+        """Wait for any of the texts. Returns which one matched or None.
+
+        Only output after the previous match counts, and each byte is
+        scanned once for all texts together.
+        """
+        found = []
+        watch = self.serial.watch(texts, self.cursor, found.append)
         start = time.time()
-        while time.time() - start < timeout:
-            if self.proc.poll() is not None:
-                return None
-            ready, _, _ = select.select([self.proc.stdout], [], [], 0.5)
-            if ready:
-                try:
-                    data = os.read(self.proc.stdout.fileno(), 8192)
-                    if data:
-                        decoded = data.decode("utf-8", errors="replace")
-                        sys.stdout.write(decoded)
-                        sys.stdout.flush()
-                        self.buffer += decoded
-                        for t in texts:
-                            if t in self.buffer:
-                                self.buffer = self.buffer[-10000:]
-                                return t
-                except OSError:
-                    pass
-        return None
+        with profile.span(" | ".join(texts), "wait") as span:
+            while not found and time.time() - start < timeout:
+                if self.proc.poll() is not None:
+                    break
+                self._pump(0.5)
+            span["matched"] = bool(found and found[0])
+        self.serial.cancel(watch)
+        if not found or found[0] is None:
+            return None
+        self.cursor = found[0].end
+        return texts[found[0].index]
 
     def send(self, text, delay=0.3):
         """Send text to QEMU serial console."""
@@ -141,21 +138,10 @@ class QEMUAutomator:
         self.send("\x1b[A", delay)
 
     def drain(self, seconds=2):
-        """Read and discard output for a few seconds."""
+        """Read and echo output for a few seconds."""
         start = time.time()
         while time.time() - start < seconds:
-            ready, _, _ = select.select([self.proc.stdout], [], [], 0.1)
-            if ready:
-                try:
-                    data = os.read(self.proc.stdout.fileno(), 8192)
-                    if data:
-                        decoded = data.decode("utf-8", errors="replace")
-                        sys.stdout.write(decoded)
-                        sys.stdout.flush()
-                        self.buffer += decoded
-                except OSError:
-                    pass
-        self.buffer = self.buffer[-5000:]
+            self._pump(0.1)
 
     def run_install(self):
         """Drive the FreeBSD installer."""
@@ -509,7 +495,8 @@ def main():
     if not args.use_installer:
         print("Using pre-built FreeBSD VM image (recommended)")
         if not args.skip_download:
-            raw_xz_path = download_vm_image(config)
+            with profile.span("download VM image", "download"):
+                raw_xz_path = download_vm_image(config)
         else:
             raw_xz_path = os.path.join(IMAGES_DIR, f"FreeBSD-{version}-RELEASE-{arch}.raw.xz")
 
@@ -521,7 +508,8 @@ def main():
         print(f"\nDecompressing to {img_path}...")
         if os.path.exists(img_path):
             os.remove(img_path)
-        subprocess.run(["xz", "-dk", raw_xz_path], check=True)
+        with profile.span("xz -d", "disk"):
+            subprocess.run(["xz", "-dk", raw_xz_path], check=True)
         # xz decompresses to same name without .xz
         decompressed = raw_xz_path.rsplit(".xz", 1)[0]
         os.rename(decompressed, img_path)
@@ -569,7 +557,8 @@ def main():
 
     automator.start_qemu(iso_path, img_path)
 
-    success = automator.run_install()
+    with profile.span("install", "install"):
+        success = automator.run_install()
     automator.cleanup()
 
     if success:
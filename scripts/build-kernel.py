@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Build and install the slim WEBBSD kernel (webbsd/kernel.py) in the image.
+
+Optional: does nothing unless KERNEL_BUILD="yes".  usr/src/sys comes from
+the host-side source cache in images/src/ (src.txz is downloaded once);
+the build VM gets KERNEL_JOBS vCPUs (default: the host's, at most 8) and
+runs ``make -j`` with as many jobs.  The kernel is built the
+traditional way in sys/i386/compile/WEBBSD, installed to /boot/webbsd next
+to the release's /boot/kernel and selected with kernel="webbsd" in
+loader.conf; the sources and objects are removed again.  Only
+FREEBSD_ARCH="i386" is supported: v86 and the build VM are 32-bit x86.
+
+A second boot, on a snapshot, checks that the image comes up on the new
+kernel with the agent's port, and compares the loaded kernel and modules
+(kldstat) with GENERIC's.  If it does not come up, the loader.conf line is
+taken out again offline, so the image boots GENERIC as before; "boot
+kernel" at the loader prompt does the same by hand.
+
+Usage:
+    python3 scripts/build-kernel.py [--image PATH] [--config CONF]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+from webbsd import IMAGE, desktop, kernel
+from webbsd.config import CONF, load_config
+from webbsd.qemu import QEMU, QEMUError
+from webbsd.qemu.agent import PORT_NAME
+from webbsd.qemu.transfer import put_file, put_path
+from webbsd.ufs import UFS2, UFSError
+
+BUILD_MEMORY = 2048
+LOADER_CONF = "/boot/loader.conf"
+SRC_TARBALL = "/var/tmp/src-sys.tgz"
+# v86 and the qemu-system-i386 build VM only run 32-bit x86.
+ARCH = "i386"
+CONF_DIR = f"/usr/src/sys/{ARCH}/conf"
+COMPILE_DIR = f"/usr/src/sys/{ARCH}/compile/{kernel.KERNCONF}"
+
+
+def loaded_kb(kldstat: str) -> int:
+    """Total size of the kernel and modules in kldstat output, in KB."""
+    total = 0
+    for line in kldstat.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) >= 5:
+            total += int(fields[3], 16)
+    return total // 1024
+
+
+async def build(image, cfg, jobs, audio):
+    mods = kernel.modules(audio, cfg.get("KERNEL_MODULES", "").split())
+    make = f"make -j{jobs} MODULES_OVERRIDE='{' '.join(mods)}'"
+    tgz = kernel.sys_tarball(cfg.get("FREEBSD_VERSION", "13.5"), ARCH)
+    vm = QEMU(image=image, memory=BUILD_MEMORY, overlay=True, extra_args=["-smp", str(jobs)])
+    async with vm:
+        print("Waiting for FreeBSD to boot...")
+        await vm.login()
+        await vm.quiesce()
+        generic_kb = loaded_kb((await vm.run("kldstat", check=True)).stdout)
+
+        print(f"Copying {os.path.basename(tgz)} ({os.path.getsize(tgz) // 1048576} MB)...")
+        print("  " + str(await put_path(vm, tgz, SRC_TARBALL)))
+        await vm.run(f"rm -rf /usr/src/sys && mkdir -p /usr/src && "
+                     f"tar -xzf {SRC_TARBALL} -C / && rm -f {SRC_TARBALL}",
+                     timeout=1800, check=True)
+
+        generic = (await vm.run(f"cat {CONF_DIR}/GENERIC", check=True)).stdout
+        await put_file(vm, kernel.kernconf(generic, audio).encode(), f"{CONF_DIR}/{kernel.KERNCONF}")
+
+        print(f"Building {kernel.KERNCONF} with {jobs} jobs...")
+        result = await vm.run(
+            f"cd {CONF_DIR} && config {kernel.KERNCONF} && cd {COMPILE_DIR} && "
+            f"make cleandepend && make depend && {make} && "
+            f"{make} install KODIR=/boot/{kernel.KERNEL_DIR}",
+            timeout=4 * 3600, on_output=lambda text: print(text, end="", flush=True))
+        if not result.ok:
+            print(result.stderr[-2000:])
+            raise QEMUError(f"kernel build failed (exit {result.status})")
+        await vm.run(f"rm -rf /usr/src/sys /boot/{kernel.KERNEL_DIR}.old", timeout=600)
+
+        current = (await vm.run(f"cat {LOADER_CONF}")).stdout
+        await put_file(vm, kernel.loader_conf(current).encode(), LOADER_CONF)
+        sizes = (await vm.run(f"ls -l /boot/kernel/kernel /boot/{kernel.KERNEL_DIR}/kernel",
+                              check=True)).stdout
+        await vm.shutdown()
+        await vm.commit()
+    print(sizes.rstrip())
+    return generic_kb
+
+
+async def verify(image):
+    async with QEMU(image=image, drive="format=raw,snapshot=on", echo=False) as vm:
+        print("Booting the new kernel...")
+        await vm.login()
+        ident = (await vm.run("sysctl -n kern.ident", check=True)).stdout.strip()
+        if ident != kernel.KERNCONF:
+            raise QEMUError(f"booted {ident!r}, not {kernel.KERNCONF}")
+        if not (await vm.run(f"test -c /dev/vtcon/{PORT_NAME}")).ok:
+            raise QEMUError(f"no /dev/vtcon/{PORT_NAME} on {kernel.KERNCONF}")
+        loaded = loaded_kb((await vm.run("kldstat", check=True)).stdout)
+        await vm.close()
+    return loaded
+
+
+def revert(image):
+    with UFS2(image, writable=True) as fs:
+        current = fs.read_file(LOADER_CONF).decode(errors="replace")
+        st = fs.stat(LOADER_CONF)
+        fs.write_file(LOADER_CONF, kernel.loader_conf(current, enabled=False).encode(),
+                      0o644, st.uid, st.gid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the slim v86 kernel into the image")
+    parser.add_argument("--image", default=IMAGE, help="raw disk image (default: images/freebsd.img)")
+    parser.add_argument("--config", default=CONF, help="build configuration (default: webbsd.conf)")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    if cfg.get("KERNEL_BUILD", "no") != "yes":
+        print("KERNEL_BUILD is off; the image keeps GENERIC.")
+        return 0
+    arch = cfg.get("FREEBSD_ARCH", ARCH)
+    if arch != ARCH:
+        print(f"ERROR: KERNEL_BUILD needs FREEBSD_ARCH={ARCH!r}, not {arch!r}")
+        return 1
+    try:
+        jobs = int(cfg.get("KERNEL_JOBS", "") or min(os.cpu_count() or 1, 8))
+    except ValueError:
+        print(f"ERROR: KERNEL_JOBS must be a number, not {cfg['KERNEL_JOBS']!r}")
+        return 1
+    audio = desktop.desktop_profile(cfg.get("DESKTOP_PROFILE", "")).audio
+
+    generic_kb = asyncio.run(build(args.image, cfg, jobs, audio))
+    try:
+        loaded_kb = asyncio.run(verify(args.image))
+    except QEMUError as e:
+        print(f"ERROR: {e}")
+        print("Taking kernel= out of loader.conf; the image boots GENERIC again.")
+        revert(args.image)
+        return 1
+    print(f"\nKernel and modules loaded at boot: GENERIC {generic_kb} KB, "
+          f"{kernel.KERNCONF} {loaded_kb} KB")
+    print("Done.")
+    return 0
+
+
+try:
+    sys.exit(main())
+except (QEMUError, UFSError, desktop.ProfileError) as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
@@ -3,6 +3,9 @@
 
 import subprocess, time, sys, os, socket
 
+from webbsd.qemu import statusbar
+from webbsd.qemu.pkgcache import PkgCache
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
 
@@ -10,98 +13,21 @@ SERIAL_PORT = 45480
 MONITOR_PORT = 45481
 HOME = "/home/bsduser"
 
-# Updated status.sh with terminal + browser + wallpaper buttons
-STATUS_SH_LINES = [
-    '#!/bin/sh',
-    "S0=$(printf '\\342\\226\\201')",
-    "S1=$(printf '\\342\\226\\202')",
-    "S2=$(printf '\\342\\226\\203')",
-    "S3=$(printf '\\342\\226\\204')",
-    "S4=$(printf '\\342\\226\\205')",
-    "S5=$(printf '\\342\\226\\206')",
-    "S6=$(printf '\\342\\226\\207')",
-    "S7=$(printf '\\342\\226\\210')",
-    '_spark=""',
-    'build_spark() {',
-    '    _spark=""',
-    '    for v in $1; do',
-    '        idx=$((v * 7 / 100))',
-    '        [ "$idx" -lt 0 ] && idx=0',
-    '        [ "$idx" -gt 7 ] && idx=7',
-    '        case $idx in',
-    '            0) _spark="${_spark}${S0}" ;; 1) _spark="${_spark}${S1}" ;;',
-    '            2) _spark="${_spark}${S2}" ;; 3) _spark="${_spark}${S3}" ;;',
-    '            4) _spark="${_spark}${S4}" ;; 5) _spark="${_spark}${S5}" ;;',
-    '            6) _spark="${_spark}${S6}" ;; *) _spark="${_spark}${S7}" ;;',
-    '        esac',
-    '    done',
-    '}',
-    'echo \'{"version":1,"click_events":true}\'',
-    'echo \'[\'',
-    'echo \'[]\'',
-    'cpu_hist=""; mem_hist=""; cpu_n=0; mem_n=0; prev=""',
-    'while true; do',
-    '    cp=$(sysctl -n kern.cp_time)',
-    '    if [ -n "$prev" ]; then',
-    '        set -- $prev; pu=$1; pn=$2; ps=$3; pi=$4; pid=$5',
-    '        set -- $cp; cu=$1; cn=$2; cs=$3; ci=$4; cid=$5',
-    '        du=$((cu-pu)); dn=$((cn-pn)); ds=$((cs-ps)); di=$((ci-pi)); did=$((cid-pid))',
-    '        t=$((du+dn+ds+di+did))',
-    '        [ "$t" -gt 0 ] && cpu=$((100*(t-did)/t)) || cpu=0',
-    '    else',
-    '        cpu=0',
-    '    fi',
-    '    prev="$cp"',
-    '    tp=$(sysctl -n vm.stats.vm.v_page_count)',
-    '    fp=$(sysctl -n vm.stats.vm.v_free_count)',
-    '    ip=$(sysctl -n vm.stats.vm.v_inactive_count)',
-    '    used=$((tp-fp-ip))',
-    '    [ "$tp" -gt 0 ] && mem=$((100*used/tp)) || mem=0',
-    '    [ "$mem" -lt 0 ] && mem=0; [ "$mem" -gt 100 ] && mem=100',
-    '    if [ -z "$cpu_hist" ]; then cpu_hist="$cpu"; else cpu_hist="$cpu_hist $cpu"; fi',
-    '    if [ -z "$mem_hist" ]; then mem_hist="$mem"; else mem_hist="$mem_hist $mem"; fi',
-    '    cpu_n=$((cpu_n+1)); mem_n=$((mem_n+1))',
-    '    [ "$cpu_n" -gt 20 ] && { cpu_hist="${cpu_hist#* }"; cpu_n=20; }',
-    '    [ "$mem_n" -gt 20 ] && { mem_hist="${mem_hist#* }"; mem_n=20; }',
-    '    build_spark "$cpu_hist"; cpu_spark="$_spark"',
-    '    build_spark "$mem_hist"; mem_spark="$_spark"',
-    '    [ $cpu -ge 85 ] && cc="#ff3333" || { [ $cpu -ge 60 ] && cc="#ccaa00" || cc="#8899aa"; }',
-    '    [ $mem -ge 90 ] && mc="#ff3333" || { [ $mem -ge 70 ] && mc="#ccaa00" || mc="#8899aa"; }',
-    '    dt=$(date \'+%a %b %d  %H:%M\')',
-    "    printf ','",
-    "    printf '[{\"name\":\"terminal\",\"full_text\":\" >_ \",\"color\":\"#87afd7\",\"separator\":false,\"separator_block_width\":6},'",
-    "    printf '{\"name\":\"browser\",\"full_text\":\" www \",\"color\":\"#87afd7\",\"separator\":false,\"separator_block_width\":6},'",
-    "    printf '{\"name\":\"wallpaper\",\"full_text\":\" \\u21bb WP \",\"color\":\"#5f87af\",\"separator\":false,\"separator_block_width\":12},'",
-    '    printf \'{"full_text":" CPU %s %d%% ","color":"%s","separator":false,"separator_block_width":18},\' "$cpu_spark" "$cpu" "$cc"',
-    '    printf \'{"full_text":" MEM %s %d%% ","color":"%s","separator":false,"separator_block_width":18},\' "$mem_spark" "$mem" "$mc"',
-    "    printf '{\"full_text\":\" %s \",\"color\":\"#555555\",\"separator\":false}' \"$dt\"",
-    "    printf ']\\n'",
-    '    sleep 2',
-    'done &',
-    '',
-    '# Read click events from i3bar',
-    'while read line; do',
-    '    case "$line" in',
-    '        *terminal*)',
-    '            i3-msg "exec urxvt -e fish" &',
-    '            ;;',
-    '        *browser*)',
-    '            i3-msg "exec netsurf" &',
-    '            ;;',
-    '        *wallpaper*)',
-    '            /home/bsduser/.config/i3/cycle-wp.sh &',
-    '            ;;',
-    '    esac',
-    'done',
-]
+# status.sh just execs the status daemon (scripts/guest/webbsd-status.c),
+# which has the terminal, browser and wallpaper buttons built in
+STATUS_SH_LINES = statusbar.STATUS_SH.rstrip("\n").split("\n")
 
 print("=== Install apps + toolbar buttons ===")
 
+pkg_cache = PkgCache()
+pkg_cache.lock_sync()
+
 proc = subprocess.Popen(
     [
         "qemu-system-i386",
         "-m", "512",
         "-drive", f"file={IMAGE},format=raw,cache=writethrough",
+        *pkg_cache.drive_args(),
         "-display", "none",
         "-serial", f"tcp:127.0.0.1:{SERIAL_PORT},server=on,wait=off",
         "-monitor", f"tcp:127.0.0.1:{MONITOR_PORT},server=on,wait=off",
@@ -188,6 +114,7 @@ send("/bin/sh\n", 1)
 drain()
 send_cmd("service cron stop", timeout=10)
 send_cmd("killall dhclient 2>/dev/null; true", timeout=5)
+send_cmd(pkg_cache.attach_command(), timeout=600)
 
 # ══════════════════════════════════════════════════════════════
 # NETWORKING
@@ -225,6 +152,7 @@ send_cmd(f"chown -R bsduser:bsduser {HOME}/.config")
 # SHUTDOWN
 # ══════════════════════════════════════════════════════════════
 print("\n=== Syncing and shutting down ===")
+send_cmd(pkg_cache.detach_command(), timeout=600)
 send("sync\n", 3)
 send("sync\n", 3)
 send("mount -ur /\n", 2)
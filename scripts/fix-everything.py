@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 """Comprehensive fix:
-1. Clone freebsd-wallpapers repo + cycle wallpapers every 5 min
-2. Fix golden-3term.sh layout (robust, long sleeps for v86)
+1. Cycle wallpapers every 5 min (pre-scaled on the host by
+   prepare-wallpapers.py, run after the VM is down)
+2. Golden-3term layout from an i3 append_layout tree (webbsd/layout.py),
+   placed as the terminals map instead of after fixed sleeps
 3. Fix fish OMF __original_fish_user_key_bindings error
-4. Fix i3 config for proper layout + wallpaper cycling
+4. Fix i3 config for proper layout + wallpaper cycling, with the
+   terminals as urxvtc clients of one urxvtd started from .xinitrc
 """
 
 import subprocess, time, sys, os, socket, base64
 
+from webbsd import layout, wallpapers
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
 
@@ -17,81 +22,11 @@ HOME = "/home/bsduser"
 I3CFG = f"{HOME}/.config/i3/config"
 
 # ══════════════════════════════════════════════════════════════
-# Golden-3term with generous sleeps for v86 speed
-# ══════════════════════════════════════════════════════════════
-GOLDEN_3TERM = r"""#!/bin/sh
-# Golden ratio layout: A(left 62%) | B(top-right 62%) / C(bottom-right 38%)
-# Launches terminals directly (not via i3-msg exec) for reliability.
-TERM_CMD="${TERMINAL:-urxvt}"
-
-sleep 4
-i3-msg 'workspace 1'
-sleep 1
-
-# Terminal A — fills workspace
-$TERM_CMD -e fish &
-sleep 4
-
-# Split container horizontally so next window goes RIGHT
-i3-msg 'split horizontal'
-sleep 0.5
-
-# Terminal B — right of A
-$TERM_CMD -e fish &
-sleep 4
-
-# B is focused. Split vertically so next window goes BELOW
-i3-msg 'split vertical'
-sleep 0.5
-
-# Terminal C — below B
-$TERM_CMD -e fish &
-sleep 4
-
-# Resize A to 62% width
-i3-msg 'focus left'
-sleep 0.5
-i3-msg 'resize set width 62 ppt'
-sleep 0.5
-
-# Resize B to 62% of right column height
-i3-msg 'focus right'
-sleep 0.3
-i3-msg 'focus up'
-sleep 0.3
-i3-msg 'resize set height 62 ppt'
-sleep 0.5
-
-# Return focus to Terminal A
-i3-msg 'focus left'
-""".lstrip()
-
-# ══════════════════════════════════════════════════════════════
-# Wallpaper cycling script
+# Wallpaper cycling scripts (the wallpapers themselves are injected by
+# prepare-wallpapers.py)
 # ══════════════════════════════════════════════════════════════
-WALLPAPER_CYCLE = r"""#!/bin/sh
-# Cycle through FreeBSD wallpapers every 5 minutes
-WP_DIR="/usr/local/share/wallpapers/freebsd-wallpapers"
-
-# Wait for X and wallpapers dir
-sleep 5
-
-set_random_wp() {
-    wp=$(find "$WP_DIR" -type f \( -name '*.jpg' -o -name '*.png' -o -name '*.jpeg' -o -name '*.JPG' -o -name '*.PNG' \) 2>/dev/null | sort -R | head -1)
-    if [ -n "$wp" ]; then
-        feh --bg-fill "$wp" 2>/dev/null
-    fi
-}
-
-# Set initial wallpaper
-set_random_wp
-
-# Cycle every 5 minutes
-while true; do
-    sleep 300
-    set_random_wp
-done
-""".lstrip()
+CYCLE_WP = wallpapers.pick_script()
+WALLPAPER_CYCLE = wallpapers.cycle_script(f"{HOME}/.config/i3/cycle-wp.sh")
 
 # ══════════════════════════════════════════════════════════════
 # Fish key bindings stub (fixes OMF __original_fish_user_key_bindings error)
@@ -200,52 +135,19 @@ drain()
 send_cmd("service cron stop", timeout=10)
 send_cmd("killall dhclient 2>/dev/null; true", timeout=5)
 
-# ══════════════════════════════════════════════════════════════
-# NETWORKING (for git clone)
-# ══════════════════════════════════════════════════════════════
-print("\n=== Setting up networking ===")
-send_cmd("dhclient em0", timeout=30)
-time.sleep(3)
-drain()
-
-if send_cmd("host github.com", timeout=15):
-    print("  DNS works!")
-else:
-    print("  DNS check failed, trying manual resolv.conf...")
-    send_cmd("echo 'nameserver 10.0.2.3' > /etc/resolv.conf", timeout=5)
-
-# ══════════════════════════════════════════════════════════════
-# 1. CLONE FREEBSD WALLPAPERS
-# ══════════════════════════════════════════════════════════════
-print("\n=== Cloning FreeBSD wallpapers repo ===")
-send_cmd("rm -rf /usr/local/share/wallpapers/freebsd-wallpapers", timeout=10)
-if send_cmd("git clone --depth 1 https://github.com/fuzzy/freebsd-wallpapers /usr/local/share/wallpapers/freebsd-wallpapers", timeout=300):
-    print("  Wallpapers cloned!")
-else:
-    print("  WARN: Git clone may have timed out, checking...")
-
-# Check what we got
-send("ls /usr/local/share/wallpapers/freebsd-wallpapers/ | head -20\n", 3)
-drain()
-send("find /usr/local/share/wallpapers/freebsd-wallpapers -type f \\( -name '*.jpg' -o -name '*.png' \\) | wc -l\n", 3)
-drain()
-decoded = serial_buf.decode(errors="replace")
-for line in decoded.split("\n")[-15:]:
-    stripped = line.strip()
-    if stripped and not stripped.startswith("#") and not stripped.startswith("$"):
-        print(f"  {stripped}")
-
 # ══════════════════════════════════════════════════════════════
 # 2. GOLDEN-3TERM LAYOUT SCRIPT
 # ══════════════════════════════════════════════════════════════
 print("\n=== Writing golden-3term.sh ===")
 send_cmd(f"mkdir -p {HOME}/.config/i3")
-write_text_file(GOLDEN_3TERM, f"{HOME}/.config/i3/golden-3term.sh", executable=True)
+for name, text in layout.files().items():
+    write_text_file(text, f"{HOME}/.config/i3/{name}", executable=name == layout.SCRIPT)
 
 # ══════════════════════════════════════════════════════════════
 # 3. WALLPAPER CYCLING SCRIPT
 # ══════════════════════════════════════════════════════════════
 print("\n=== Writing wallpaper-cycle.sh ===")
+write_text_file(CYCLE_WP, f"{HOME}/.config/i3/cycle-wp.sh", executable=True)
 write_text_file(WALLPAPER_CYCLE, f"{HOME}/.config/i3/wallpaper-cycle.sh", executable=True)
 
 # ══════════════════════════════════════════════════════════════
@@ -271,6 +173,13 @@ send_cmd(f"sed -i '' '/golden-3term/d' {I3CFG}")
 # Remove old startup.sh lines
 send_cmd(f"sed -i '' '/startup\\.sh/d' {I3CFG}")
 
+# Terminals are urxvtc clients of one urxvtd started from .xinitrc
+send_cmd(f"sed -i '' -e 's/ urxvt -e / urxvtc -e /g' -e 's/^set \\$term urxvt$/set $term urxvtc/' {I3CFG}")
+XINITRC = f"{HOME}/.xinitrc"
+send_cmd(f"grep -q urxvtd {XINITRC} || {{ grep -v '^exec i3' {XINITRC} > {XINITRC}.new; "
+         f"echo 'urxvtd -q -o -f' >> {XINITRC}.new; echo 'exec i3' >> {XINITRC}.new; "
+         f"mv {XINITRC}.new {XINITRC}; chmod +x {XINITRC}; }}")
+
 # Add wallpaper cycling and golden layout
 send_cmd(f"echo 'exec --no-startup-id {HOME}/.config/i3/wallpaper-cycle.sh' >> {I3CFG}")
 send_cmd(f"echo 'exec --no-startup-id {HOME}/.config/i3/golden-3term.sh' >> {I3CFG}")
@@ -307,7 +216,6 @@ send("echo '---FINAL---'\n", 0.3)
 send(f"ls -la {HOME}/.config/i3/golden-3term.sh && echo 'GOLDEN: OK'\n", 1)
 send(f"ls -la {HOME}/.config/i3/wallpaper-cycle.sh && echo 'CYCLE: OK'\n", 1)
 send(f"ls {HOME}/.config/fish/functions/fish_user_key_bindings.fish && echo 'KEYBIND: OK'\n", 1)
-send("find /usr/local/share/wallpapers/freebsd-wallpapers -type f \\( -name '*.jpg' -o -name '*.png' \\) | wc -l\n", 2)
 send(f"head -5 {HOME}/.config/i3/golden-3term.sh\n", 1)
 send("echo '---FEND---'\n", 2)
 time.sleep(3)
@@ -337,4 +245,7 @@ except subprocess.TimeoutExpired:
 
 mon.close()
 ser.close()
+
+print("\n=== Injecting pre-scaled wallpapers ===")
+subprocess.run([sys.executable, os.path.join(BASE, "scripts", "prepare-wallpapers.py")])
 print("\n=== Comprehensive fix done! ===")
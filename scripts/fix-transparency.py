@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
-"""Ensure .Xresources has transparency settings and xrdb loads them."""
+"""Ensure .Xresources has transparency settings and xrdb loads them.
+
+Does nothing unless DESKTOP_PROFILE has a compositor (see webbsd/desktop.py).
+"""
 import subprocess, time, sys, os, socket
 
+from webbsd import desktop
+from webbsd.config import load_config
+
+if not desktop.desktop_profile(load_config().get("DESKTOP_PROFILE", "")).compositor:
+    print("No compositor in this DESKTOP_PROFILE; terminals stay opaque.")
+    sys.exit(0)
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
 SERIAL_PORT = 45494
@@ -3,6 +3,8 @@
 
 import subprocess, time, sys, os, socket
 
+from webbsd import wallpapers
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
 
@@ -10,18 +12,9 @@ SERIAL_PORT = 45478
 MONITOR_PORT = 45479
 HOME = "/home/bsduser"
 
-# Helper script to set a random wallpaper (called by i3bar click and by cycle loop)
-CYCLE_WP_LINES = [
-    '#!/bin/sh',
-    'WP_DIR="/usr/local/share/wallpapers/freebsd-wallpapers"',
-    'wp=$(find "$WP_DIR" -maxdepth 1 -type f -iname "*.png" 2>/dev/null | sort -R | head -1)',
-    'if [ -z "$wp" ]; then',
-    '    wp=$(find "$WP_DIR" -maxdepth 1 -type f -iname "*.jpg" 2>/dev/null | sort -R | head -1)',
-    'fi',
-    'if [ -n "$wp" ]; then',
-    '    feh --bg-fill "$wp"',
-    'fi',
-]
+# Helper script to set a random wallpaper (called by i3bar click and by cycle loop);
+# the wallpapers are pre-scaled and injected by prepare-wallpapers.py
+CYCLE_WP_LINES = wallpapers.pick_script().rstrip("\n").split("\n")
 
 # Updated status.sh with click support and wallpaper button
 # i3bar click events come as JSON on stdin when click_events: true
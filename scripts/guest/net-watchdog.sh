@@ -0,0 +1,108 @@
+#!/bin/sh
+#
+# Network watchdog, run as root: "listen" from /etc/rc.local.
+#
+#   net-watchdog.sh [iface ...]	run dhclient on each interface without an
+#				IPv4 address (default: every Ethernet one)
+#   net-watchdog.sh renew [iface ...]
+#				restart dhclient to get a fresh lease
+#   net-watchdog.sh listen	check once, then react to events
+#
+# The old watchdog woke every 15 seconds and forked ifconfig, grep and awk
+# to find out; a restored saved state waited up to that long for its
+# network.  "listen" instead blocks on two event sources and costs
+# nothing in between:
+#
+#   - the routing socket (route -n monitor): an address removed or a link
+#     coming up triggers the check;
+#   - the second serial port, /dev/cuau1, if the emulator has one: the
+#     page sends a line on it right after restoring the saved state, and
+#     the lease from the saved state is renewed.
+#
+# Link-up on interfaces with ifconfig_<if>="DHCP" is also handled by the
+# base devd.conf.
+
+PATH=/sbin:/bin:/usr/sbin:/usr/bin
+RESTORE_TTY=/dev/cuau1
+NAMESERVER=8.8.8.8
+
+ifaces()
+{
+	ifconfig -l ether
+}
+
+resolver()
+{
+	grep -q '^nameserver' /etc/resolv.conf 2>/dev/null ||
+	    echo "nameserver ${NAMESERVER}" > /etc/resolv.conf
+}
+
+check()
+{
+	local _if
+
+	for _if in ${*:-$(ifaces)}; do
+		case "$(ifconfig "${_if}" inet 2>/dev/null)" in
+		*"inet "*)	;;
+		*)		dhclient -b "${_if}" >/dev/null 2>&1 ;;
+		esac
+	done
+	resolver
+}
+
+renew()
+{
+	local _if _pid
+
+	for _if in ${*:-$(ifaces)}; do
+		if read _pid 2>/dev/null < "/var/run/dhclient/dhclient.${_if}.pid" &&
+		    kill "${_pid}" 2>/dev/null; then
+			pwait "${_pid}"
+		fi
+		dhclient -b "${_if}" >/dev/null 2>&1
+	done
+	resolver
+}
+
+listen_routes()
+{
+	local _kind _rest
+
+	route -n monitor 2>/dev/null | while read -r _kind _rest; do
+		case "${_kind}" in
+		RTM_DELADDR:)
+			check ;;
+		RTM_IFINFO:)
+			case "${_rest}" in
+			*"link: up"*)	check ;;
+			esac ;;
+		esac
+	done
+}
+
+listen_restore()
+{
+	local _line
+
+	[ -c "${RESTORE_TTY}" ] || return 0
+	stty -f "${RESTORE_TTY}.init" -echo clocal 2>/dev/null
+	while read -r _line; do
+		renew
+	done < "${RESTORE_TTY}"
+}
+
+case "$1" in
+listen)
+	exec >/dev/null 2>&1
+	check
+	listen_restore &
+	listen_routes
+	;;
+renew)
+	shift
+	renew "$@"
+	;;
+*)
+	check "$@"
+	;;
+esac
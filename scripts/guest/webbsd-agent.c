@@ -0,0 +1,458 @@
+/*
+ * webbsd-agent: provisioning agent on the org.webbsd.agent virtio-serial
+ * port, built and installed into the image by fix-image.py and started by
+ * /usr/local/etc/rc.d/webbsd_agent.  The host side is
+ * scripts/webbsd/qemu/agent.py.
+ *
+ * Every frame, in both directions, is a 4-byte big-endian length and that
+ * many bytes: a 4-byte request id, a 1-byte op and the op's body.
+ * Requests are served in the order they arrive, so the host may pipeline
+ * them; each response carries the id of its request.  Every response body
+ * starts with a 4-byte signed status: the exit status for EXEC, an errno
+ * value (0 on success) for everything else.
+ *
+ *   PING   ""                          -> status, version
+ *   EXEC   env ("K=V\0"... "\0"), cmd  -> DATA frames, then status
+ *   PUT    mode:4 pathlen:2 path data  -> status [, message]
+ *   GET    path                        -> status, data | message
+ *   STAT   path                        -> status, mode:4 size:8 mtime:8
+ *   BATCH  (len:4 op body)...          -> status 0, (len:4 op response)...
+ *
+ * EXEC streams output as DATA frames (fd:1 then bytes) with the request's
+ * id while the command runs; inside a BATCH it answers status, stdout
+ * length, stdout, stderr instead.  Commands run as /bin/sh -c in /root
+ * with stdin from /dev/null.
+ *
+ * usage: webbsd-agent [port]
+ */
+
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <sys/wait.h>
+
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <paths.h>
+#include <poll.h>
+#include <signal.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <termios.h>
+#include <unistd.h>
+
+#define DEFAULT_PORT	"/dev/vtcon/org.webbsd.agent"
+#define VERSION		"webbsd-agent 1"
+#define MAX_FRAME	(256u << 20)
+#define CHUNK		65536
+/* How long a command's output is still read after its shell exits. */
+#define GRACE_MS	200
+
+enum { OP_PING, OP_EXEC, OP_PUT, OP_GET, OP_STAT, OP_BATCH, OP_DATA };
+
+struct buf {
+	unsigned char	*p;
+	size_t		 len, cap;
+};
+
+static const char *port_path = DEFAULT_PORT;
+static int port = -1;
+
+static void
+buf_put(struct buf *b, const void *data, size_t n)
+{
+	if (b->len + n > b->cap) {
+		size_t cap = b->cap ? b->cap : 256;
+
+		while (cap < b->len + n)
+			cap *= 2;
+		if ((b->p = realloc(b->p, cap)) == NULL)
+			abort();
+		b->cap = cap;
+	}
+	memcpy(b->p + b->len, data, n);
+	b->len += n;
+}
+
+static void
+buf_u32(struct buf *b, uint32_t v)
+{
+	unsigned char x[4] = { v >> 24, v >> 16, v >> 8, v };
+
+	buf_put(b, x, 4);
+}
+
+static void
+buf_u64(struct buf *b, uint64_t v)
+{
+	buf_u32(b, v >> 32);
+	buf_u32(b, (uint32_t)v);
+}
+
+static void
+buf_status(struct buf *b, int status, const char *msg)
+{
+	buf_u32(b, (uint32_t)status);
+	if (msg != NULL)
+		buf_put(b, msg, strlen(msg));
+}
+
+static uint32_t
+get_u32(const unsigned char *p)
+{
+	return ((uint32_t)p[0] << 24 | (uint32_t)p[1] << 16 |
+	    (uint32_t)p[2] << 8 | p[3]);
+}
+
+static int
+readn(unsigned char *p, size_t n)
+{
+	ssize_t r;
+
+	while (n > 0) {
+		if ((r = read(port, p, n)) < 0 && errno == EINTR)
+			continue;
+		if (r <= 0)
+			return (-1);
+		p += r;
+		n -= r;
+	}
+	return (0);
+}
+
+static void
+writen(const unsigned char *p, size_t n)
+{
+	ssize_t r;
+
+	while (n > 0) {
+		if ((r = write(port, p, n)) < 0) {
+			if (errno == EINTR || errno == EAGAIN)
+				continue;
+			return;
+		}
+		p += r;
+		n -= r;
+	}
+}
+
+static void
+send_frame(uint32_t id, int op, const void *body, size_t n)
+{
+	unsigned char head[9] = {
+		(n + 5) >> 24, (n + 5) >> 16, (n + 5) >> 8, n + 5,
+		id >> 24, id >> 16, id >> 8, id, op
+	};
+
+	writen(head, sizeof(head));
+	writen(body, n);
+}
+
+static void
+open_port(void)
+{
+	struct termios t;
+
+	if (port >= 0)
+		close(port);
+	while ((port = open(port_path, O_RDWR | O_NOCTTY)) < 0)
+		sleep(1);
+	/* Binary frames: no echo, no line discipline, no CR/LF mapping. */
+	if (tcgetattr(port, &t) == 0) {
+		cfmakeraw(&t);
+		tcsetattr(port, TCSANOW, &t);
+	}
+}
+
+/* Lost our place in the stream: drop what is queued and reopen the port. */
+static void
+resync(void)
+{
+	tcflush(port, TCIFLUSH);
+	sleep(1);
+	open_port();
+}
+
+/*
+ * Run cmd; stream its output as DATA frames for id, or, with out and err,
+ * collect it.  Returns the exit status (128 + signal if killed).
+ */
+static int
+run_cmd(const char *env, size_t envlen, const char *cmd, uint32_t id,
+    struct buf *out, struct buf *err)
+{
+	int fds[2][2], status, done = 0, open_fds = 2;
+	unsigned char chunk[CHUNK + 1];
+	struct pollfd pfd[2];
+	pid_t pid;
+	ssize_t r;
+
+	if (pipe(fds[0]) < 0 || pipe(fds[1]) < 0)
+		return (127);
+	if ((pid = fork()) < 0)
+		return (127);
+	if (pid == 0) {
+		const char *e;
+		int null = open(_PATH_DEVNULL, O_RDONLY);
+
+		for (e = env; e < env + envlen && *e != '\0'; e += strlen(e) + 1)
+			putenv(strdup(e));
+		dup2(null, 0);
+		dup2(fds[0][1], 1);
+		dup2(fds[1][1], 2);
+		closefrom(3);
+		setsid();
+		execl(_PATH_BSHELL, "sh", "-c", cmd, (char *)NULL);
+		_exit(127);
+	}
+	close(fds[0][1]);
+	close(fds[1][1]);
+	pfd[0].fd = fds[0][0];
+	pfd[1].fd = fds[1][0];
+	pfd[0].events = pfd[1].events = POLLIN;
+	while (open_fds > 0) {
+		/* Daemons started by the command may keep the pipes open. */
+		int n = poll(pfd, 2, done ? GRACE_MS : 100);
+
+		if (n < 0 && errno != EINTR)
+			break;
+		if (!done && waitpid(pid, &status, WNOHANG) == pid)
+			done = 1;
+		if (n == 0 && done)
+			break;
+		for (int i = 0; i < 2; i++) {
+			if (pfd[i].fd < 0 || !(pfd[i].revents & (POLLIN | POLLHUP)))
+				continue;
+			if ((r = read(pfd[i].fd, chunk + 1, CHUNK)) <= 0) {
+				close(pfd[i].fd);
+				pfd[i].fd = -1;
+				open_fds--;
+			} else if (out != NULL) {
+				buf_put(i == 0 ? out : err, chunk + 1, r);
+			} else {
+				chunk[0] = i + 1;
+				send_frame(id, OP_DATA, chunk, r + 1);
+			}
+		}
+	}
+	for (int i = 0; i < 2; i++)
+		if (pfd[i].fd >= 0)
+			close(pfd[i].fd);
+	if (!done && waitpid(pid, &status, 0) < 0)
+		return (127);
+	if (WIFSIGNALED(status))
+		return (128 + WTERMSIG(status));
+	return (WEXITSTATUS(status));
+}
+
+static void
+do_put(const unsigned char *body, size_t n, struct buf *res)
+{
+	char path[PATH_MAX], part[PATH_MAX + 8];
+	size_t pathlen, len;
+	struct stat st;
+	mode_t mode;
+	ssize_t r;
+	int fd;
+
+	if (n < 6 || (pathlen = body[4] << 8 | body[5]) >= PATH_MAX ||
+	    6 + pathlen > n) {
+		buf_status(res, EINVAL, "bad PUT");
+		return;
+	}
+	mode = get_u32(body) & 07777;
+	memcpy(path, body + 6, pathlen);
+	path[pathlen] = '\0';
+	snprintf(part, sizeof(part), "%s.wbpart", path);
+	body += 6 + pathlen;
+	len = n - 6 - pathlen;
+	if ((fd = open(part, O_WRONLY | O_CREAT | O_TRUNC, mode ? mode : 0644)) < 0) {
+		buf_status(res, errno, strerror(errno));
+		return;
+	}
+	/* Replacing a file keeps its owner, and its mode unless one is given. */
+	if (stat(path, &st) == 0 && S_ISREG(st.st_mode)) {
+		if (!mode)
+			mode = st.st_mode & 07777;
+		if (fchown(fd, st.st_uid, st.st_gid) < 0) {
+			buf_status(res, errno, strerror(errno));
+			close(fd);
+			unlink(part);
+			return;
+		}
+	}
+	while (len > 0) {
+		if ((r = write(fd, body, len)) < 0) {
+			buf_status(res, errno, strerror(errno));
+			close(fd);
+			unlink(part);
+			return;
+		}
+		body += r;
+		len -= r;
+	}
+	if ((mode && fchmod(fd, mode) < 0) || close(fd) < 0 ||
+	    rename(part, path) < 0) {
+		buf_status(res, errno, strerror(errno));
+		unlink(part);
+		return;
+	}
+	buf_status(res, 0, NULL);
+}
+
+static void
+do_get(const char *path, struct buf *res)
+{
+	unsigned char chunk[CHUNK];
+	ssize_t r;
+	int fd;
+
+	if ((fd = open(path, O_RDONLY)) < 0) {
+		buf_status(res, errno, strerror(errno));
+		return;
+	}
+	buf_status(res, 0, NULL);
+	while ((r = read(fd, chunk, sizeof(chunk))) > 0)
+		buf_put(res, chunk, r);
+	if (r < 0) {
+		res->len = 0;
+		buf_status(res, errno, strerror(errno));
+	}
+	close(fd);
+}
+
+static void
+do_stat(const char *path, struct buf *res)
+{
+	struct stat st;
+
+	if (stat(path, &st) < 0) {
+		buf_status(res, errno, strerror(errno));
+		return;
+	}
+	buf_status(res, 0, NULL);
+	buf_u32(res, st.st_mode);
+	buf_u64(res, st.st_size);
+	buf_u64(res, st.st_mtim.tv_sec);
+}
+
+/* Answer one op into res; EXEC without a batch streams and answers too. */
+static void
+serve(uint32_t id, int op, const unsigned char *body, size_t n,
+    struct buf *res, int batched)
+{
+	/* Bodies are followed by a NUL (see main), so paths are strings. */
+	const char *s = (const char *)body;
+
+	switch (op) {
+	case OP_PING:
+		buf_status(res, 0, VERSION);
+		break;
+	case OP_EXEC: {
+		size_t envlen = 0;
+		struct buf out = { 0 }, err = { 0 };
+
+		while (envlen < n && s[envlen] != '\0')
+			envlen += strlen(s + envlen) + 1;
+		if (envlen >= n) {
+			buf_status(res, EINVAL, "bad EXEC");
+			break;
+		}
+		if (!batched) {
+			buf_status(res, run_cmd(s, envlen, s + envlen + 1, id,
+			    NULL, NULL), NULL);
+			break;
+		}
+		buf_status(res, run_cmd(s, envlen, s + envlen + 1, id, &out,
+		    &err), NULL);
+		buf_u32(res, out.len);
+		buf_put(res, out.p, out.len);
+		buf_put(res, err.p, err.len);
+		free(out.p);
+		free(err.p);
+		break;
+	}
+	case OP_PUT:
+		do_put(body, n, res);
+		break;
+	case OP_GET:
+		do_get(s, res);
+		break;
+	case OP_STAT:
+		do_stat(s, res);
+		break;
+	case OP_BATCH:
+		if (batched) {
+			buf_status(res, EINVAL, "nested BATCH");
+			break;
+		}
+		buf_status(res, 0, NULL);
+		while (n >= 5) {
+			uint32_t len = get_u32(body);
+			struct buf sub = { 0 };
+			unsigned char save;
+
+			if (len < 1 || len > n - 4)
+				break;
+			/* Terminate the sub-body like a top-level one. */
+			save = body[4 + len];
+			((unsigned char *)body)[4 + len] = '\0';
+			serve(id, body[4], body + 5, len - 1, &sub, 1);
+			((unsigned char *)body)[4 + len] = save;
+			buf_u32(res, sub.len + 1);
+			buf_put(res, &body[4], 1);
+			buf_put(res, sub.p, sub.len);
+			free(sub.p);
+			body += 4 + len;
+			n -= 4 + len;
+		}
+		break;
+	default:
+		buf_status(res, EINVAL, "unknown op");
+	}
+}
+
+int
+main(int argc, char **argv)
+{
+	unsigned char head[4], *frame = NULL;
+	uint32_t len;
+
+	if (argc > 1)
+		port_path = argv[1];
+	signal(SIGPIPE, SIG_IGN);
+	setenv("PATH", "/sbin:/bin:/usr/sbin:/usr/bin:/usr/local/sbin:/usr/local/bin", 1);
+	setenv("HOME", "/root", 1);
+	setenv("USER", "root", 1);
+	setenv("SHELL", _PATH_BSHELL, 1);
+	if (chdir("/root") < 0)
+		chdir("/");
+	open_port();
+	for (;;) {
+		struct buf res = { 0 };
+
+		if (readn(head, 4) < 0) {
+			/* Host went away (or the port hiccuped): start over. */
+			resync();
+			continue;
+		}
+		if ((len = get_u32(head)) < 5 || len > MAX_FRAME) {
+			/* Out of sync: drop whatever is queued and wait for the next request. */
+			tcflush(port, TCIFLUSH);
+			continue;
+		}
+		if ((frame = realloc(frame, len + 1)) == NULL)
+			abort();
+		if (readn(frame, len) < 0) {
+			/* Cut off inside a frame: the next bytes are no header. */
+			resync();
+			continue;
+		}
+		frame[len] = '\0';
+		serve(get_u32(frame), frame[4], frame + 5, len - 5, &res, 0);
+		send_frame(get_u32(frame), frame[4], res.p, res.len);
+		free(res.p);
+	}
+}
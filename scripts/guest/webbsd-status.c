@@ -0,0 +1,359 @@
+/*
+ * webbsd-status: i3bar status generator, built and installed into the
+ * image by fix-image.py (scripts/webbsd/qemu/statusbar.py) and run by
+ * ~/.config/i3/status.sh.
+ *
+ * The shell loop it replaces forked sysctl four times, date once and a
+ * handful of subshells every tick; under v86 each fork/exec costs more
+ * than everything else the bar does.  Here the counters are read with
+ * sysctl(3) on MIBs looked up once, the CPU and memory history rings stay
+ * in memory, and the only fork left is the command a click starts.
+ *
+ * Output is the i3bar protocol with click_events: a header, then one JSON
+ * array per tick.  Click events are read from stdin between ticks; a
+ * click on a button runs its command with /bin/sh -c, detached.  With -s
+ * the CPU and memory blocks are left out and no counters are read: the
+ * bar of the lite and minimal desktop profiles (webbsd/desktop.py).
+ * -t and -b set what the terminal and browser buttons start (a command
+ * line for i3's exec, without single quotes; default "urxvtc -e fish -C
+ * clear" and "midori").
+ *
+ * usage: webbsd-status [-s] [-i seconds] [-n ticks] [-t terminal] [-b browser]
+ */
+
+#include <sys/types.h>
+#include <sys/resource.h>
+#include <sys/sysctl.h>
+
+#include <err.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <paths.h>
+#include <poll.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+
+#define HISTORY		20
+#define CPUSTATES_MAX	5	/* user nice sys intr idle */
+#define CP_IDLE		4
+
+#define TERMINAL	"urxvtc -e fish -C clear"
+#define BROWSER		"midori"
+
+struct button {
+	const char	*name;
+	const char	*text;
+	const char	*color;
+	int		 width;
+	char		*cmd;
+};
+
+/* The terminal and browser commands are filled in by main(). */
+static struct button buttons[] = {
+	{ "terminal",	" >_ ",		"#87afd7", 6,	NULL },
+	{ "browser",	" www ",	"#87afd7", 6,	NULL },
+	{ "wallpaper",	" \\u21bb WP ",	"#5f87af", 12,	"\"$HOME\"/.config/i3/cycle-wp.sh" },
+};
+#define NBUTTONS	(sizeof(buttons) / sizeof(buttons[0]))
+
+/* U+2581..U+2588, lower one eighth block to full block. */
+static const char *const spark[8] = {
+	"\xe2\x96\x81", "\xe2\x96\x82", "\xe2\x96\x83", "\xe2\x96\x84",
+	"\xe2\x96\x85", "\xe2\x96\x86", "\xe2\x96\x87", "\xe2\x96\x88",
+};
+
+struct mib {
+	const char	*name;
+	int		 oid[CTL_MAXNAME];
+	size_t		 len;
+};
+
+static struct mib m_cp_time = { .name = "kern.cp_time" };
+static struct mib m_pages = { .name = "vm.stats.vm.v_page_count" };
+static struct mib m_free = { .name = "vm.stats.vm.v_free_count" };
+static struct mib m_inactive = { .name = "vm.stats.vm.v_inactive_count" };
+
+struct ring {
+	int	v[HISTORY];
+	int	n, next;
+};
+
+static int simple;
+
+static void
+mib_init(struct mib *m)
+{
+	m->len = CTL_MAXNAME;
+	if (sysctlnametomib(m->name, m->oid, &m->len) < 0)
+		err(1, "%s", m->name);
+}
+
+static int
+mib_read(struct mib *m, void *p, size_t n)
+{
+	return sysctl(m->oid, (u_int)m->len, p, &n, NULL, 0);
+}
+
+static u_int
+mib_uint(struct mib *m)
+{
+	u_int v = 0;
+
+	mib_read(m, &v, sizeof(v));
+	return v;
+}
+
+static void
+ring_add(struct ring *r, int v)
+{
+	r->v[r->next] = v;
+	r->next = (r->next + 1) % HISTORY;
+	if (r->n < HISTORY)
+		r->n++;
+}
+
+static void
+ring_spark(const struct ring *r, char *out)
+{
+	int i, idx;
+
+	*out = '\0';
+	for (i = 0; i < r->n; i++) {
+		idx = r->v[(r->next - r->n + i + HISTORY) % HISTORY] * 7 / 100;
+		strcat(out, spark[idx < 0 ? 0 : idx > 7 ? 7 : idx]);
+	}
+}
+
+static const char *
+level_color(int pct, int warn, int crit)
+{
+	return pct >= crit ? "#ff3333" : pct >= warn ? "#ccaa00" : "#8899aa";
+}
+
+static int
+cpu_percent(void)
+{
+	static long prev[CPUSTATES_MAX];
+	static int have_prev;
+	long cur[CPUSTATES_MAX], total = 0, idle;
+	int i, pct = 0;
+
+	memset(cur, 0, sizeof(cur));
+	if (mib_read(&m_cp_time, cur, sizeof(cur)) < 0)
+		return 0;
+	if (have_prev) {
+		for (i = 0; i < CPUSTATES_MAX; i++)
+			total += cur[i] - prev[i];
+		idle = cur[CP_IDLE] - prev[CP_IDLE];
+		if (total > 0)
+			pct = (int)(100 * (total - idle) / total);
+	}
+	memcpy(prev, cur, sizeof(prev));
+	have_prev = 1;
+	return pct;
+}
+
+static int
+mem_percent(void)
+{
+	u_int total = mib_uint(&m_pages);
+	long used = (long)total - mib_uint(&m_free) - mib_uint(&m_inactive);
+	int pct;
+
+	if (total == 0)
+		return 0;
+	pct = (int)(100 * used / total);
+	return pct < 0 ? 0 : pct > 100 ? 100 : pct;
+}
+
+static void
+emit(struct ring *cpu_hist, struct ring *mem_hist)
+{
+	char cpu_spark[HISTORY * 3 + 1], mem_spark[HISTORY * 3 + 1], date[64];
+	time_t now = time(NULL);
+	struct tm tm;
+	int cpu, mem;
+	size_t i;
+
+	strftime(date, sizeof(date), "%a %b %d  %H:%M", localtime_r(&now, &tm));
+
+	fputs(",[", stdout);
+	for (i = 0; i < NBUTTONS; i++)
+		printf("{\"name\":\"%s\",\"full_text\":\"%s\",\"color\":\"%s\","
+		    "\"separator\":false,\"separator_block_width\":%d},",
+		    buttons[i].name, buttons[i].text, buttons[i].color,
+		    buttons[i].width);
+	if (!simple) {
+		cpu = cpu_percent();
+		mem = mem_percent();
+		ring_add(cpu_hist, cpu);
+		ring_add(mem_hist, mem);
+		ring_spark(cpu_hist, cpu_spark);
+		ring_spark(mem_hist, mem_spark);
+		printf("{\"full_text\":\" CPU %s %d%% \",\"color\":\"%s\","
+		    "\"separator\":false,\"separator_block_width\":18},",
+		    cpu_spark, cpu, level_color(cpu, 60, 85));
+		printf("{\"full_text\":\" MEM %s %d%% \",\"color\":\"%s\","
+		    "\"separator\":false,\"separator_block_width\":18},",
+		    mem_spark, mem, level_color(mem, 70, 90));
+	}
+	printf("{\"full_text\":\" %s \",\"color\":\"#555555\",\"separator\":false}]\n",
+	    date);
+	if (fflush(stdout) == EOF)
+		exit(0);	/* i3bar went away */
+}
+
+static void
+run_detached(const char *cmd)
+{
+	int fd;
+
+	switch (fork()) {
+	case -1:
+		warn("fork");
+		return;
+	case 0:
+		setsid();
+		if ((fd = open(_PATH_DEVNULL, O_RDWR)) >= 0) {
+			dup2(fd, 0);
+			dup2(fd, 1);
+			if (fd > 2)
+				close(fd);
+		}
+		execl(_PATH_BSHELL, "sh", "-c", cmd, (char *)NULL);
+		_exit(127);
+	}
+}
+
+/* One line of the click event stream: "[", or "{...}" with a leading ",". */
+static void
+click(const char *line)
+{
+	char key[64];
+	size_t i;
+
+	for (i = 0; i < NBUTTONS; i++) {
+		snprintf(key, sizeof(key), "\"name\":\"%s\"", buttons[i].name);
+		if (strstr(line, key) != NULL) {
+			run_detached(buttons[i].cmd);
+			return;
+		}
+	}
+}
+
+/* Read what i3bar sent; returns 0 once stdin is closed. */
+static int
+read_clicks(void)
+{
+	static char buf[4096];
+	static size_t len;
+	char *nl, *start;
+	ssize_t n;
+
+	if ((n = read(STDIN_FILENO, buf + len, sizeof(buf) - 1 - len)) <= 0)
+		return n < 0 && errno == EINTR;
+	len += (size_t)n;
+	buf[len] = '\0';
+	start = buf;
+	while ((nl = strchr(start, '\n')) != NULL) {
+		*nl = '\0';
+		click(start);
+		start = nl + 1;
+	}
+	len -= (size_t)(start - buf);
+	memmove(buf, start, len);
+	if (len == sizeof(buf) - 1)
+		len = 0;	/* an overlong line: drop it */
+	return 1;
+}
+
+static long long
+now_ms(void)
+{
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (long long)ts.tv_sec * 1000 + ts.tv_nsec / 1000000;
+}
+
+int
+main(int argc, char **argv)
+{
+	struct ring cpu_hist = { { 0 } }, mem_hist = { { 0 } };
+	struct sigaction sa;
+	struct pollfd pfd = { STDIN_FILENO, POLLIN, 0 };
+	long long next, wait;
+	long ticks = -1;
+	const char *terminal = TERMINAL, *browser = BROWSER;
+	int ch, interval = 2, have_stdin = 1;
+
+	while ((ch = getopt(argc, argv, "b:i:n:st:")) != -1) {
+		switch (ch) {
+		case 'b':
+			browser = optarg;
+			break;
+		case 't':
+			terminal = optarg;
+			break;
+		case 'i':
+			interval = atoi(optarg);
+			break;
+		case 'n':
+			ticks = atol(optarg);
+			break;
+		case 's':
+			simple = 1;
+			break;
+		default:
+			fprintf(stderr, "usage: webbsd-status [-s] [-i seconds] "
+			    "[-n ticks] [-t terminal] [-b browser]\n");
+			return 2;
+		}
+	}
+	if (interval < 1)
+		interval = 1;
+	if (asprintf(&buttons[0].cmd, "i3-msg 'exec %s'", terminal) < 0 ||
+	    asprintf(&buttons[1].cmd, "i3-msg 'exec %s'", browser) < 0)
+		err(1, "asprintf");
+
+	/* Clicked commands are never waited for. */
+	memset(&sa, 0, sizeof(sa));
+	sa.sa_handler = SIG_IGN;
+	sa.sa_flags = SA_NOCLDWAIT;
+	sigaction(SIGCHLD, &sa, NULL);
+	/* A status bar is the least important thing on the machine. */
+	setpriority(PRIO_PROCESS, 0, 10);
+	tzset();
+
+	if (!simple) {
+		mib_init(&m_cp_time);
+		mib_init(&m_pages);
+		mib_init(&m_free);
+		mib_init(&m_inactive);
+	}
+
+	printf("{\"version\":1,\"click_events\":true}\n[\n[]\n");
+	next = now_ms();
+	while (ticks != 0) {
+		emit(&cpu_hist, &mem_hist);
+		if (ticks > 0)
+			ticks--;
+		next += interval * 1000LL;
+		/* Resumed from a saved state or stalled: do not catch up. */
+		if (next < now_ms())
+			next = now_ms();
+		while (ticks != 0 && (wait = next - now_ms()) > 0) {
+			if (!have_stdin) {
+				poll(NULL, 0, (int)wait);
+				continue;
+			}
+			if (poll(&pfd, 1, (int)wait) > 0)
+				have_stdin = read_clicks();
+		}
+	}
+	return 0;
+}
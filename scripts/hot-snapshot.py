@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Take, list or remove hot snapshots (see webbsd/qemu/hot.py).
+
+A hot snapshot is the default VM booted once to a logged-in, quiesced
+root /bin/sh and saved.  With WEBBSD_HOT=1 every overlay VM the driver
+starts (debug checks, fix and apply scripts) is restored from it in about
+a second instead of booting; the first such VM takes it if it is missing
+or the image has changed since.
+
+Usage:
+    python3 scripts/hot-snapshot.py take [--image PATH] [--rebuild]
+    python3 scripts/hot-snapshot.py list
+    python3 scripts/hot-snapshot.py clear
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import sys
+
+from webbsd import IMAGE
+from webbsd.qemu import QEMU, QEMUError
+from webbsd.qemu import hot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="webBSD hot guest snapshots")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    take = sub.add_parser("take")
+    take.add_argument("--image", default=IMAGE, help="disk image (default: images/freebsd.img)")
+    take.add_argument("--rebuild", action="store_true", help="replace a valid snapshot")
+    sub.add_parser("list")
+    sub.add_parser("clear")
+    args = parser.parse_args()
+
+    if args.cmd == "take":
+        vm = QEMU(image=args.image, hot=True)
+        try:
+            asyncio.run(vm.hot.ensure(rebuild=args.rebuild))
+        except QEMUError as e:
+            print(f"ERROR: {e}")
+            return 1
+        print(f"Hot snapshot {vm.hot.key} ready")
+    elif args.cmd == "list":
+        for state in sorted(glob.glob(os.path.join(hot.HOT_DIR, "*.state"))):
+            size = os.path.getsize(state)
+            print(f"  {size / 1048576:9.1f} MB  {os.path.basename(state)[:-len('.state')]}")
+    else:
+        hot.clear()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Write files into images/freebsd.img without booting it.
+
+Opens the freebsd-ufs partition of the raw image directly and creates or
+replaces the files listed in a JSON manifest (see webbsd/manifest.py),
+with their mode and owner.  Packages, sysrc and rc.local entries are
+ignored here; apply-manifest.py handles the whole manifest.  Owners are
+resolved against the image's own /etc/passwd and /etc/group.  Takes
+seconds instead of a boot, a login and a serial transfer.
+
+The image must not be in use by QEMU and must have been shut down
+cleanly; the script refuses a filesystem that needs fsck.
+
+Usage:
+    python3 scripts/inject-files.py manifest.json [--image PATH] [--list]
+"""
+
+import argparse
+import sys
+
+from webbsd import IMAGE
+from webbsd.manifest import inject, load_manifest
+from webbsd.ufs import UFS2, UFSError
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inject files into the disk image offline")
+    parser.add_argument("manifest", help="JSON manifest of files to write")
+    parser.add_argument("--image", default=IMAGE, help="raw disk image (default: images/freebsd.img)")
+    parser.add_argument("--list", action="store_true", help="show what would be written and exit")
+    args = parser.parse_args()
+
+    entries = load_manifest(args.manifest).files
+    if args.list:
+        for e in entries:
+            print(f"  {e.path}{'/' if e.is_dir else ''}  {e.mode:04o} {e.owner}")
+        return
+
+    print(f"Injecting {len(entries)} entries into {args.image}")
+    with UFS2(args.image, writable=True) as fs:
+        inject(fs, entries)
+    print("Done. Filesystem marked clean.")
+
+
+try:
+    main()
+except UFSError as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
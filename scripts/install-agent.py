@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Build the guest provisioning agent into an existing image.
+
+fix-image.py does this for new builds.  Boots the image on an overlay,
+compiles scripts/guest/webbsd-agent.c with the base system cc, installs
+the rc.d script, enables it, checks that it answers, and commits.
+
+Usage:
+    python3 scripts/install-agent.py [--image PATH]
+"""
+
+import argparse
+import asyncio
+import sys
+
+from webbsd import IMAGE
+from webbsd.qemu import QEMU, QEMUError, agent
+
+
+async def main(image):
+    vm = QEMU(image=image, overlay=True)
+    async with vm:
+        print("Waiting for FreeBSD to boot...")
+        await vm.login()
+        await vm.quiesce()
+        await agent.install(vm)
+        await vm.run("service webbsd_agent start", timeout=30, check=True)
+        await vm.attach_agent(timeout=10)
+        if vm.agent is None:
+            raise QEMUError("the agent was installed but does not answer")
+        await vm.shutdown()
+        await vm.commit()
+
+
+parser = argparse.ArgumentParser(description="Install the webBSD guest agent")
+parser.add_argument("--image", default=IMAGE, help="disk image (default: images/freebsd.img)")
+args = parser.parse_args()
+try:
+    asyncio.run(main(args.image))
+except QEMUError as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
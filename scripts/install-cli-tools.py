@@ -1,16 +1,29 @@
 #!/usr/bin/env python3
-"""Install gtop, tty-clock, cava + configure audio loopback for cava."""
+"""Install gtop, tty-clock, cava + configure audio loopback for cava.
+
+tty-clock and the audio packages are left out when DESKTOP_PROFILE has
+no clock or audio (see webbsd/desktop.py).
+"""
 import subprocess, time, sys, os, socket
 
+from webbsd import desktop
+from webbsd.config import load_config
+from webbsd.qemu.pkgcache import PkgCache
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
+DESKTOP = desktop.desktop_profile(load_config().get("DESKTOP_PROFILE", ""))
 SERIAL_PORT = 45494
 MONITOR_PORT = 45495
 HOME = "/home/bsduser"
 
+pkg_cache = PkgCache()
+pkg_cache.lock_sync()
+
 proc = subprocess.Popen(
     ["qemu-system-i386", "-m", "1024",
      "-drive", f"file={IMAGE},format=raw,cache=writethrough",
+     *pkg_cache.drive_args(),
      "-display", "none",
      "-serial", f"tcp:127.0.0.1:{SERIAL_PORT},server=on,wait=off",
      "-monitor", f"tcp:127.0.0.1:{MONITOR_PORT},server=on,wait=off",
@@ -80,6 +93,7 @@ send("root\n", 3); drain()
 send("/bin/sh\n", 1); drain()
 send_cmd("service cron stop", timeout=10)
 send_cmd("killall dhclient 2>/dev/null; true", timeout=5)
+send_cmd(pkg_cache.attach_command(), timeout=600)
 
 # Get network up with real DNS for QEMU
 print("Getting network...")
@@ -143,49 +157,51 @@ for pkg in ["gtop", "gotop", "bashtop", "bpytop"]:
     else:
         print(f"  {pkg} not found")
 
-# tty-clock
-print("\nInstalling tty-clock...")
-serial_buf = b""
-send("pkg install -y tty-clock 2>&1 | tail -10\n", 5)
-wait_for("#", timeout=300)
-drain()
-output = serial_buf.decode(errors="replace")
-for line in output.split("\n"):
-    s = line.strip()
-    if s and ("install" in s.lower() or "error" in s.lower() or "not found" in s.lower()) and not s.startswith("$"):
-        print(f"  {s}")
+if DESKTOP.clock:
+    # tty-clock
+    print("\nInstalling tty-clock...")
+    serial_buf = b""
+    send("pkg install -y tty-clock 2>&1 | tail -10\n", 5)
+    wait_for("#", timeout=300)
+    drain()
+    output = serial_buf.decode(errors="replace")
+    for line in output.split("\n"):
+        s = line.strip()
+        if s and ("install" in s.lower() or "error" in s.lower() or "not found" in s.lower()) and not s.startswith("$"):
+            print(f"  {s}")
 
-# cava
-print("\nInstalling cava...")
-serial_buf = b""
-send("pkg install -y cava 2>&1 | tail -10\n", 5)
-wait_for("#", timeout=300)
-drain()
-output = serial_buf.decode(errors="replace")
-for line in output.split("\n"):
-    s = line.strip()
-    if s and ("install" in s.lower() or "error" in s.lower() or "number" in s.lower()) and not s.startswith("$"):
-        print(f"  {s}")
+if DESKTOP.audio:
+    # cava
+    print("\nInstalling cava...")
+    serial_buf = b""
+    send("pkg install -y cava 2>&1 | tail -10\n", 5)
+    wait_for("#", timeout=300)
+    drain()
+    output = serial_buf.decode(errors="replace")
+    for line in output.split("\n"):
+        s = line.strip()
+        if s and ("install" in s.lower() or "error" in s.lower() or "number" in s.lower()) and not s.startswith("$"):
+            print(f"  {s}")
 
-# PulseAudio for audio monitoring (cava reads from pulseaudio monitor source)
-print("\nInstalling PulseAudio...")
-serial_buf = b""
-send("pkg install -y pulseaudio 2>&1 | tail -15\n", 5)
-print("  Waiting for PulseAudio install...")
-wait_for("#", timeout=600)
-drain()
-output = serial_buf.decode(errors="replace")
-for line in output.split("\n"):
-    s = line.strip()
-    if s and ("install" in s.lower() or "error" in s.lower() or "number" in s.lower()) and not s.startswith("$"):
-        print(f"  {s}")
+    # PulseAudio for audio monitoring (cava reads from pulseaudio monitor source)
+    print("\nInstalling PulseAudio...")
+    serial_buf = b""
+    send("pkg install -y pulseaudio 2>&1 | tail -15\n", 5)
+    print("  Waiting for PulseAudio install...")
+    wait_for("#", timeout=600)
+    drain()
+    output = serial_buf.decode(errors="replace")
+    for line in output.split("\n"):
+        s = line.strip()
+        if s and ("install" in s.lower() or "error" in s.lower() or "number" in s.lower()) and not s.startswith("$"):
+            print(f"  {s}")
 
-# Also install virtual_oss as backup for OSS loopback
-print("\nInstalling virtual_oss...")
-serial_buf = b""
-send("pkg install -y virtual_oss 2>&1 | tail -5\n", 5)
-wait_for("#", timeout=120)
-drain()
+    # Also install virtual_oss as backup for OSS loopback
+    print("\nInstalling virtual_oss...")
+    serial_buf = b""
+    send("pkg install -y virtual_oss 2>&1 | tail -5\n", 5)
+    wait_for("#", timeout=120)
+    drain()
 
 # Check what we got installed
 print("\n=== Verifying installations ===")
@@ -223,69 +239,70 @@ else:
     wait_for("#", timeout=120)
     sysmon = "htop"
 
-# Configure PulseAudio to start with user session
-print("\n=== Configuring PulseAudio ===")
-# Enable PulseAudio for bsduser
-send_cmd("pw groupmod pulse-access -m bsduser 2>/dev/null || true")
-send_cmd("pw groupmod audio -m bsduser 2>/dev/null || true")
-
-# Create PulseAudio config for bsduser to auto-start and load OSS module
-send_cmd(f"mkdir -p {HOME}/.config/pulse")
-
-# default.pa - load OSS module for SB16
-pa_config = [
-    '#!/usr/bin/pulseaudio -nF',
-    '.include /usr/local/etc/pulse/default.pa',
-    '# Load OSS output for SB16',
-    'load-module module-oss device=/dev/dsp0',
-    '# Create a monitor source so cava can read playback audio',
-    'load-module module-null-sink sink_name=monitor_sink sink_properties=device.description="Monitor"',
-    'load-module module-loopback source=monitor_sink.monitor sink=0',
-    '# Set default sink to OSS',
-    'set-default-sink 0',
-]
-write_lines(pa_config, f"{HOME}/.config/pulse/default.pa")
-
-# client.conf - auto-start pulseaudio
-pa_client = [
-    'autospawn = yes',
-    'daemon-binary = /usr/local/bin/pulseaudio',
-]
-write_lines(pa_client, f"{HOME}/.config/pulse/client.conf")
-
-# Configure cava
-print("\n=== Configuring cava ===")
-send_cmd(f"mkdir -p {HOME}/.config/cava")
-
-# cava config - use PulseAudio as input method
-cava_config = [
-    '[general]',
-    'framerate = 30',
-    'bars = 40',
-    '',
-    '[input]',
-    'method = pulse',
-    'source = auto',
-    '',
-    '[output]',
-    'method = ncurses',
-    '',
-    '[color]',
-    'gradient = 1',
-    'gradient_count = 4',
-    'gradient_color_1 = \'#ab1100\'',
-    'gradient_color_2 = \'#ff3300\'',
-    'gradient_color_3 = \'#ff6600\'',
-    'gradient_color_4 = \'#ffaa00\'',
-    '',
-    '[smoothing]',
-    'noise_reduction = 77',
-]
-write_lines(cava_config, f"{HOME}/.config/cava/config")
-
-# Add PulseAudio autostart to i3 config (before any audio apps)
-print("\n=== Updating i3 config ===")
-send_cmd(f"grep -q 'pulseaudio' {HOME}/.config/i3/config || sed -i '' '/exec --no-startup-id.*watchdog/a\\'$'\\n''exec --no-startup-id pulseaudio --start' {HOME}/.config/i3/config")
+if DESKTOP.audio:
+    # Configure PulseAudio to start with user session
+    print("\n=== Configuring PulseAudio ===")
+    # Enable PulseAudio for bsduser
+    send_cmd("pw groupmod pulse-access -m bsduser 2>/dev/null || true")
+    send_cmd("pw groupmod audio -m bsduser 2>/dev/null || true")
+
+    # Create PulseAudio config for bsduser to auto-start and load OSS module
+    send_cmd(f"mkdir -p {HOME}/.config/pulse")
+
+    # default.pa - load OSS module for SB16
+    pa_config = [
+        '#!/usr/bin/pulseaudio -nF',
+        '.include /usr/local/etc/pulse/default.pa',
+        '# Load OSS output for SB16',
+        'load-module module-oss device=/dev/dsp0',
+        '# Create a monitor source so cava can read playback audio',
+        'load-module module-null-sink sink_name=monitor_sink sink_properties=device.description="Monitor"',
+        'load-module module-loopback source=monitor_sink.monitor sink=0',
+        '# Set default sink to OSS',
+        'set-default-sink 0',
+    ]
+    write_lines(pa_config, f"{HOME}/.config/pulse/default.pa")
+
+    # client.conf - auto-start pulseaudio
+    pa_client = [
+        'autospawn = yes',
+        'daemon-binary = /usr/local/bin/pulseaudio',
+    ]
+    write_lines(pa_client, f"{HOME}/.config/pulse/client.conf")
+
+    # Configure cava
+    print("\n=== Configuring cava ===")
+    send_cmd(f"mkdir -p {HOME}/.config/cava")
+
+    # cava config - use PulseAudio as input method
+    cava_config = [
+        '[general]',
+        'framerate = 30',
+        'bars = 40',
+        '',
+        '[input]',
+        'method = pulse',
+        'source = auto',
+        '',
+        '[output]',
+        'method = ncurses',
+        '',
+        '[color]',
+        'gradient = 1',
+        'gradient_count = 4',
+        'gradient_color_1 = \'#ab1100\'',
+        'gradient_color_2 = \'#ff3300\'',
+        'gradient_color_3 = \'#ff6600\'',
+        'gradient_color_4 = \'#ffaa00\'',
+        '',
+        '[smoothing]',
+        'noise_reduction = 77',
+    ]
+    write_lines(cava_config, f"{HOME}/.config/cava/config")
+
+    # Add PulseAudio autostart to i3 config (before any audio apps)
+    print("\n=== Updating i3 config ===")
+    send_cmd(f"grep -q 'pulseaudio' {HOME}/.config/i3/config || sed -i '' '/exec --no-startup-id.*watchdog/a\\'$'\\n''exec --no-startup-id pulseaudio --start' {HOME}/.config/i3/config")
 
 # Fix ownership
 send_cmd(f"chown -R bsduser:bsduser {HOME}/.config")
@@ -318,6 +335,7 @@ for line in serial_buf.decode(errors="replace").split("\n"):
 
 # Shutdown
 print("\nSyncing...")
+send_cmd(pkg_cache.detach_command(), timeout=600)
 send("sync\n", 3)
 send("sync\n", 3)
 send("mount -ur /\n", 2)
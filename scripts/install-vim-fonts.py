@@ -2,15 +2,21 @@
 """Install Hybrid vim color scheme, powerline/Hack Nerd fonts, syntax highlighting."""
 import subprocess, time, sys, os, socket
 
+from webbsd.qemu.pkgcache import PkgCache
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
 SERIAL_PORT = 45494
 MONITOR_PORT = 45495
 HOME = "/home/bsduser"
 
+pkg_cache = PkgCache()
+pkg_cache.lock_sync()
+
 proc = subprocess.Popen(
     ["qemu-system-i386", "-m", "1024",
      "-drive", f"file={IMAGE},format=raw,cache=writethrough",
+     *pkg_cache.drive_args(),
      "-display", "none",
      "-serial", f"tcp:127.0.0.1:{SERIAL_PORT},server=on,wait=off",
      "-monitor", f"tcp:127.0.0.1:{MONITOR_PORT},server=on,wait=off",
@@ -80,6 +86,7 @@ send("root\n", 3); drain()
 send("/bin/sh\n", 1); drain()
 send_cmd("service cron stop", timeout=10)
 send_cmd("killall dhclient 2>/dev/null; true", timeout=5)
+send_cmd(pkg_cache.attach_command(), timeout=600)
 
 # Get network up with real DNS
 print("Getting network...")
@@ -493,6 +500,7 @@ for line in serial_buf.decode(errors="replace").split("\n"):
 
 # Shutdown
 print("\nSyncing...")
+send_cmd(pkg_cache.detach_command(), timeout=600)
 send("sync\n", 3)
 send("sync\n", 3)
 send("mount -ur /\n", 2)
@@ -4,7 +4,9 @@
 Boots the FreeBSD image in QEMU with networking, installs packages,
 configures Xorg, fluxbox, auto-login, and auto-startx.
 
-Reads PACKAGES and X11 config from webbsd.conf.
+Reads PACKAGES and X11 config from webbsd.conf.  DESKTOP_PROFILE="lite" or
+"minimal" leaves picom out and makes the terminals opaque (see
+webbsd/desktop.py).
 """
 
 import subprocess
@@ -13,6 +15,10 @@ import sys
 import os
 import socket
 
+from webbsd import desktop, profile
+from webbsd.qemu import statusbar
+from webbsd.qemu.pkgcache import PkgCache
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
 CONF = os.path.join(BASE, "webbsd.conf")
@@ -36,7 +42,8 @@ def load_config(path):
 
 
 cfg = load_config(CONF)
-PACKAGES = cfg.get("PACKAGES", "")
+DESKTOP = desktop.desktop_profile(cfg.get("DESKTOP_PROFILE", ""))
+PACKAGES = " ".join(desktop.packages(DESKTOP, cfg.get("PACKAGES", "").split()))
 X11_RESOLUTION = cfg.get("X11_RESOLUTION", "1024x768")
 X11_DEPTH = cfg.get("X11_DEPTH", "24")
 X11_WM = cfg.get("X11_WM", "fluxbox")
@@ -49,17 +56,23 @@ USER_GROUPS = cfg.get("USER_GROUPS", "wheel")
 HOME_DIR = f"/home/{DESKTOP_USER}" if DESKTOP_USER != "root" else "/root"
 
 print(f"Installing X11 desktop into {IMAGE}")
+print(f"  Desktop profile: {DESKTOP.name}")
 print(f"  Packages: {PACKAGES}")
 print(f"  Resolution: {X11_RESOLUTION}x{X11_DEPTH}")
 print(f"  Window manager: {X11_WM}")
 print(f"  Desktop user: {DESKTOP_USER} ({HOME_DIR})")
 print()
 
+# Packages are fetched into the persistent pkg cache disk (ada1)
+pkg_cache = PkgCache()
+pkg_cache.lock_sync()
+
 # Start QEMU with networking
 proc = subprocess.Popen(
     [
         "qemu-system-i386", "-m", "512",
         "-drive", f"file={IMAGE},format=raw",
+        *pkg_cache.drive_args(),
         "-display", "none",
         "-serial", f"tcp:127.0.0.1:{SERIAL_PORT},server=on,wait=off",
         "-monitor", f"tcp:127.0.0.1:{MONITOR_PORT},server=on,wait=off",
@@ -141,6 +154,11 @@ def send_cmd(cmd, timeout=60):
     2. In the actual output of 'echo SENTINEL'
     We wait for the second occurrence to ensure the command finished.
     """
+    with profile.span(cmd[:200], "command"):
+        _send_cmd(cmd, timeout)
+
+
+def _send_cmd(cmd, timeout):
     global serial_buf
     import random
     sentinel = f"__DONE_{random.randint(10000,99999)}__"
@@ -160,7 +178,9 @@ def send_cmd(cmd, timeout=60):
 
 # Boot to multi-user — just wait for login prompt
 print("Waiting for FreeBSD to boot...")
-if not wait_for("login:", timeout=300):
+with profile.span("login", "boot"):
+    booted = wait_for("login:", timeout=300)
+if not booted:
     print("ERROR: No login prompt detected")
     drain()
     proc.kill()
@@ -194,9 +214,13 @@ else:
 # Set DNS
 send_cmd("echo 'nameserver 8.8.8.8' > /etc/resolv.conf")
 
+# Mount the pkg cache; it bootstraps pkg itself when it has it
+print("\n=== Attaching pkg cache ===")
+send_cmd(pkg_cache.attach_command(csh=True), timeout=600)
+
 # Bootstrap pkg
 print("\n=== Bootstrapping pkg ===")
-send_cmd("env ASSUME_ALWAYS_YES=yes pkg bootstrap", timeout=120)
+send_cmd("pkg -N >& /dev/null || env ASSUME_ALWAYS_YES=yes pkg bootstrap", timeout=120)
 
 # Install packages
 print(f"\n=== Installing packages: {PACKAGES} ===")
@@ -282,14 +306,13 @@ send_cmd("sysrc moused_port=/dev/psm0")
 # ============================================================
 print("\n=== Configuring i3 ===")
 send_cmd(f"mkdir -p {HOME_DIR}/.config/i3")
-send_cmd(f"mkdir -p {HOME_DIR}/.config/i3status")
 
 # i3 config — full rice with gaps, picom, rofi, urxvt
 # Mod1 = Alt (v86 PS/2 keyboard has no Super key)
 print(">>> Writing i3 config...")
 i3_config = r"""# webBSD i3 config — dark hacker rice
 set $mod Mod1
-set $term urxvt
+set $term urxvtc
 
 # Font (Nerd Font if available, fallback to DejaVu)
 font pango:JetBrainsMono Nerd Font 9, DejaVu Sans Mono 9
@@ -391,7 +414,7 @@ bindsym $mod+r mode "resize"
 
 # Status bar
 bar {
-    status_command i3status
+    status_command ~/.config/i3/status.sh
     position bottom
     height 22
     colors {
@@ -408,54 +431,25 @@ bar {
 # Startup applications
 exec --no-startup-id picom --config HOME_DIR_PLACEHOLDER/.config/picom/picom.conf &
 exec --no-startup-id xsetroot -solid '#080808'
-exec --no-startup-id urxvt -e tmux
+exec --no-startup-id urxvtc -e tmux
 exec --no-startup-id sh -c 'echo DESKTOP_READY > /tmp/x11_ready'
 """
-i3_config = i3_config.replace("HOME_DIR_PLACEHOLDER", HOME_DIR)
+i3_config = desktop.i3_config(i3_config.replace("HOME_DIR_PLACEHOLDER", HOME_DIR), DESKTOP)
 send(f"cat > {HOME_DIR}/.config/i3/config << 'I3EOF'\n", 0.3)
 for line in i3_config.strip().split("\n"):
     send(line + "\n", 0.12)
 send("I3EOF\n", 1)
 drain()
 
-# i3status config
-print(">>> Writing i3status config...")
-send(f"cat > {HOME_DIR}/.config/i3status/config << 'I3SEOF'\n", 0.3)
-i3status_lines = r"""general {
-    output_format = "i3bar"
-    colors = true
-    color_good = "#ab1100"
-    color_degraded = "#555555"
-    color_bad = "#ff0000"
-    interval = 5
-}
-
-order += "cpu_usage"
-order += "memory"
-order += "disk /"
-order += "tztime local"
-
-cpu_usage {
-    format = " CPU %usage "
-}
-
-memory {
-    format = " MEM %used/%total "
-    threshold_degraded = "10%"
-    threshold_critical = "5%"
-}
-
-disk "/" {
-    format = " SSD %avail "
-}
-
-tztime local {
-    format = " %Y-%m-%d %H:%M "
-}"""
-for line in i3status_lines.strip().split("\n"):
+# status.sh runs the i3bar status daemon fix-image.py built
+# (scripts/guest/webbsd-status.c), with the profile's options
+print(">>> Writing status.sh...")
+send(f"cat > {HOME_DIR}/.config/i3/status.sh << 'STEOF'\n", 0.3)
+for line in statusbar.status_sh(DESKTOP.status_args).strip().split("\n"):
     send(line + "\n", 0.12)
-send("I3SEOF\n", 1)
+send("STEOF\n", 1)
 drain()
+send_cmd(f"chmod +x {HOME_DIR}/.config/i3/status.sh")
 
 # ============================================================
 # picom compositor — xrender backend for VESA compatibility
@@ -574,6 +568,7 @@ XTerm*saveLines: 2000
 XTerm*selectToClipboard: true
 XTerm*metaSendsEscape: true
 XTerm*termName: xterm-256color"""
+xres_lines = desktop.xresources(xres_lines, DESKTOP)
 for line in xres_lines.strip().split("\n"):
     send(line + "\n", 0.12)
 send("XEOF\n", 1)
@@ -747,6 +742,7 @@ print(">>> Writing .xinitrc...")
 send(f"cat > {HOME_DIR}/.xinitrc << 'XEOF'\n", 0.3)
 send("#!/bin/sh\n", 0.2)
 send(f"xrdb -merge {HOME_DIR}/.Xresources\n", 0.2)
+send("urxvtd -q -o -f\n", 0.2)
 send("exec i3\n", 0.2)
 send("XEOF\n", 1)
 drain()
@@ -772,31 +768,14 @@ send("PEOF\n", 1)
 drain()
 
 # ============================================================
-# DNS + DHCP auto-config (for v86 state restore)
+# DNS (DHCP after a state restore is the network watchdog's job)
 # ============================================================
-print("\n=== Configuring DNS + auto-DHCP ===")
+print("\n=== Configuring DNS ===")
 send_cmd("echo 'nameserver 8.8.8.8' > /etc/resolv.conf")
 send_cmd("echo 'nameserver 8.8.4.4' >> /etc/resolv.conf")
 
-send_cmd("mkdir -p /usr/local/bin")
-send("cat > /usr/local/bin/auto-dhcp.sh << 'DEOF'\n", 0.3)
-send("#!/bin/sh\n", 0.2)
-send("IP=$(ifconfig ed0 2>/dev/null | grep 'inet ' | awk '{print $2}')\n", 0.2)
-send('if [ -z "$IP" ]; then\n', 0.2)
-send("    /sbin/dhclient ed0 > /dev/null 2>&1 &\n", 0.2)
-send("fi\n", 0.2)
-send("grep -q nameserver /etc/resolv.conf 2>/dev/null || echo 'nameserver 8.8.8.8' > /etc/resolv.conf\n", 0.2)
-send("DEOF\n", 1)
-drain()
-send_cmd("chmod +x /usr/local/bin/auto-dhcp.sh")
-
-send("cat > /etc/rc.local << 'REOF'\n", 0.3)
-send("#!/bin/sh\n", 0.2)
-send("sleep 2 && /usr/local/bin/auto-dhcp.sh &\n", 0.2)
-send("REOF\n", 1)
-drain()
-send_cmd("chmod +x /etc/rc.local")
-send_cmd("echo '* * * * * /usr/local/bin/auto-dhcp.sh' | crontab -")
+# The DHCP watchdog and its rc.local hook are installed by fix-network.py
+# (scripts/guest/net-watchdog.sh); nothing here polls.
 
 # dhclient.conf to preserve DNS
 send_cmd("grep -q 'supersede domain-name-servers' /etc/dhclient.conf || echo 'supersede domain-name-servers 8.8.8.8, 8.8.4.4;' >> /etc/dhclient.conf")
@@ -814,7 +793,7 @@ send(f"echo '--- {X11_WM} ---' && ls -la /usr/local/bin/{X11_WM}\n", 1)
 drain()
 send("echo '--- dmenu ---' && ls -la /usr/local/bin/dmenu_run\n", 1)
 drain()
-send("echo '--- i3status ---' && ls -la /usr/local/bin/i3status\n", 1)
+send(f"echo '--- webbsd-status ---' && ls -la {statusbar.BINARY}\n", 1)
 drain()
 send(f"echo '--- .xinitrc ---' && cat {HOME_DIR}/.xinitrc\n", 1)
 drain()
@@ -859,6 +838,7 @@ send_cmd("sysrc pflog_enable=YES")
 
 # Clean shutdown
 print("\n=== Shutting down ===")
+send_cmd(pkg_cache.detach_command(csh=True), timeout=600)
 send("sync\n", 1)
 send("/sbin/shutdown -p now\n", 5)
 
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Pre-scale the configured wallpapers on the host and put them in the image.
+
+Clones WALLPAPER_REPO on the host (images/cache/wallpapers/src), picks the
+files matching WALLPAPER_PICK plus WALLPAPER, and renders each distinct
+one to X11_RESOLUTION as a baseline JPEG (see webbsd/wallpapers.py).  The
+rendered files, ~/.config/i3/cycle-wp.sh and wallpaper-cycle.sh are
+diffed against the image and written offline when possible; wallpapers no
+longer configured and the old in-guest clone are removed in one boot.
+
+DESKTOP_PROFILE="lite" puts in only the first wallpaper, shown once at
+login with no cycle; "minimal" removes them for a solid background (see
+webbsd/desktop.py).
+
+Usage:
+    python3 scripts/prepare-wallpapers.py [--image PATH] [--config CONF] [--no-fetch] [--dry-run] [--boot]
+"""
+
+import argparse
+import asyncio
+import os
+import shlex
+import sys
+
+from webbsd import BASE, IMAGE, desktop
+from webbsd import wallpapers as wp
+from webbsd.config import CONF, load_config
+from webbsd.manifest import (SCRIPT_PATH, Entry, Manifest, PartialApply, apply_offline,
+                             build_tar, extract_command, plan)
+from webbsd.qemu import QEMU, QEMUError
+from webbsd.qemu.transfer import put_file
+from webbsd.ufs import UFS2, UFSError
+
+CYCLE_EXEC = "exec --no-startup-id {home}/.config/i3/wallpaper-cycle.sh"
+STATIC_EXEC = "exec --no-startup-id {home}/.config/i3/cycle-wp.sh"
+
+
+def sources(cfg, fetch):
+    paths = []
+    if cfg.get("WALLPAPER"):
+        paths.append(os.path.join(BASE, cfg["WALLPAPER"]))
+    repo = cfg.get("WALLPAPER_REPO", wp.DEFAULT_REPO)
+    if repo:
+        dest = os.path.join(wp.CACHE_DIR, "src")
+        if fetch:
+            print(f"Fetching {repo}...")
+            wp.fetch_repo(repo, dest)
+        if os.path.isdir(dest):
+            paths.append(dest)
+    return wp.find_sources(paths, cfg.get("WALLPAPER_PICK", "").split())
+
+
+def i3_config_entry(fs, home, owner, profile):
+    """The i3 config starting the profile's wallpaper script, if it does not yet."""
+    path = f"{home}/.config/i3/config"
+    st = fs.stat(path)
+    if st is None:
+        return None
+    current = fs.read_file(path).decode(errors="replace")
+    text = desktop.i3_config(current, profile)
+    line = {"cycle": CYCLE_EXEC, "static": STATIC_EXEC}.get(profile.wallpaper)
+    if line and line.format(home=home) not in text.split("\n"):
+        text = text.rstrip("\n") + "\n" + line.format(home=home) + "\n"
+    if text == current:
+        return None
+    return Entry(path, text.encode(), st.mode & 0o7777, owner)
+
+
+async def apply_booted(image, p, remove):
+    tgz = build_tar(p)
+    print(f"\nApplying in one boot: {len(tgz)} byte tar stream")
+    vm = QEMU(image=image, overlay=True)
+    async with vm:
+        print("Waiting for FreeBSD to boot...")
+        await vm.login()
+        await vm.quiesce()
+        print("  " + str(await put_file(vm, tgz, "/tmp/wbwall.tgz")))
+        cmd = f"{extract_command('/tmp/wbwall.tgz')} && sh {SCRIPT_PATH}"
+        if remove:
+            cmd += " && rm -rf " + " ".join(shlex.quote(r) for r in remove)
+        await vm.run(cmd, timeout=600, check=True)
+        await vm.shutdown()
+        await vm.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-scale wallpapers and put them in the image")
+    parser.add_argument("--image", default=IMAGE, help="raw disk image (default: images/freebsd.img)")
+    parser.add_argument("--config", default=CONF, help="build configuration (default: webbsd.conf)")
+    parser.add_argument("--no-fetch", action="store_true", help="use the existing checkout of WALLPAPER_REPO")
+    parser.add_argument("--dry-run", action="store_true", help="render and show the diff, then exit")
+    parser.add_argument("--boot", action="store_true", help="apply in a boot even when offline would do")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    size = wp.parse_resolution(cfg.get("X11_RESOLUTION", "1024x768"))
+    user = cfg.get("USER_NAME", "") or "root"
+    home = f"/home/{user}" if user != "root" else "/root"
+    owner = f"{user}:{user}" if user != "root" else "root:wheel"
+    interval = int(cfg.get("WALLPAPER_INTERVAL") or wp.DEFAULT_INTERVAL)
+    profile = desktop.desktop_profile(cfg.get("DESKTOP_PROFILE", ""))
+
+    walls, entries = [], []
+    if profile.wallpaper:
+        found = sources(cfg, not args.no_fetch)
+        if profile.wallpaper == "static":
+            found = found[:1]
+        print(f"Rendering {len(found)} wallpaper(s) at {size[0]}x{size[1]} ({profile.name} profile)")
+        walls = wp.prepare(found, size)
+        if not walls:
+            print("No wallpapers configured.")
+            return 1
+        total = sum(len(w.data) for w in walls)
+        print(f"{len(walls)} distinct wallpaper(s), {total / 1048576:.1f} MB")
+        entries = wp.entries(walls, home, owner, interval, cycle=profile.wallpaper == "cycle")
+    else:
+        print(f"No wallpaper in the {profile.name} profile")
+
+    remove = []
+    try:
+        with UFS2(args.image) as fs:
+            i3 = i3_config_entry(fs, home, owner, profile)
+            if i3 is not None:
+                entries.append(i3)
+            p = plan(Manifest(entries, [], {}, []), fs)
+            if fs.stat(wp.GUEST_DIR) is not None:
+                stale = wp.stale(fs.listdir(wp.GUEST_DIR), walls)
+                remove += [f"{wp.GUEST_DIR}/{n}" for n in stale] if walls else [wp.GUEST_DIR]
+            if fs.stat(wp.LEGACY_DIR) is not None:
+                remove.append(wp.LEGACY_DIR)
+    except (UFSError, OSError) as e:
+        print(f"Cannot read image offline ({e}); applying everything")
+        p = plan(Manifest(entries, [], {}, []))
+        remove.append(wp.LEGACY_DIR)
+        if not walls:
+            remove.append(wp.GUEST_DIR)
+
+    for e in p.files:
+        print(f"  file   {e.path}{'/' if e.is_dir else ''}")
+    for r in remove:
+        print(f"  remove {r}")
+    if p.empty and not remove:
+        print("Image already has these wallpapers.")
+        return 0
+    if args.dry_run:
+        return 0
+
+    if not remove and not args.boot:
+        try:
+            with UFS2(args.image, writable=True) as fs:
+                print("\nApplying offline:")
+                apply_offline(fs, p)
+            print("Done.")
+            return 0
+        except PartialApply:
+            raise
+        except UFSError as e:
+            print(f"Offline apply not possible ({e}); booting instead")
+
+    asyncio.run(apply_booted(args.image, p, remove))
+    print("Done.")
+    return 0
+
+
+try:
+    sys.exit(main())
+except (QEMUError, UFSError, wp.WallpaperError, desktop.ProfileError) as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Summarize a build trace (see webbsd/profile.py).
+
+Reads the event log written while WEBBSD_TRACE was set, writes it as a
+Chrome trace JSON next to it (open in chrome://tracing or
+https://ui.perfetto.dev) and prints wall time and time per category
+(boot, command, transfer, shutdown, disk) for every stage, plus each
+stage's slowest operations.
+
+Usage:
+    python3 scripts/profile-report.py [TRACE] [--chrome PATH] [--top N]
+"""
+
+import argparse
+import os
+import sys
+
+from webbsd import profile
+from webbsd.profile import DEFAULT_TRACE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="webBSD build profile report")
+    parser.add_argument("trace", nargs="?", default=os.environ.get(profile.TRACE_ENV) or DEFAULT_TRACE,
+                        help="trace event log (default: $WEBBSD_TRACE or images/logs/build-trace.jsonl)")
+    parser.add_argument("--chrome", help="Chrome trace output (default: TRACE with .json)")
+    parser.add_argument("--top", type=int, default=5, help="slowest operations listed per stage")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.trace):
+        print(f"ERROR: no trace at {args.trace} (run the build with {profile.TRACE_ENV} set)")
+        return 1
+    events = profile.load(args.trace)
+    chrome = args.chrome or os.path.splitext(args.trace)[0] + ".json"
+    profile.write_chrome_trace(events, chrome)
+    print(profile.summary(events, args.top))
+    print(f"\nChrome trace: {chrome}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Run debug checks and webbsd.conf variant builds side by side.
+
+Every job boots its own VM on an overlay with private UNIX sockets, so
+nothing collides and the image is only ever read.  At most -j jobs run at
+once (default: one per core).  Serial output and script output go to
+images/logs/<job>.log; the reports are printed as jobs finish.
+
+A variant applies the desktop manifest with another config file to its
+own copy of the image, images/variants/<name>.img (a sparse copy of
+images/freebsd.img, made on first use or with --fresh).
+
+Usage:
+    python3 scripts/run-parallel.py [-j N] [CHECK ...] [--variant CONF ...] [--fresh]
+
+CHECK is the NAME of a scripts/debug-NAME.py; with neither checks nor
+variants, every debug check runs.
+"""
+
+import argparse
+import asyncio
+import glob
+import importlib.util
+import os
+import subprocess
+import sys
+
+from webbsd import IMAGE, IMAGES_DIR
+from webbsd.qemu.pool import VMPool
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+VARIANTS_DIR = os.path.join(IMAGES_DIR, "variants")
+
+
+def available_checks():
+    names = [os.path.basename(p)[len("debug-"):-len(".py")]
+             for p in glob.glob(os.path.join(SCRIPTS, "debug-*.py"))]
+    return sorted(names)
+
+
+def load_check(name):
+    path = os.path.join(SCRIPTS, f"debug-{name}.py")
+    spec = importlib.util.spec_from_file_location(f"debug_{name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def variant_image(conf, fresh):
+    name = os.path.splitext(os.path.basename(conf))[0]
+    image = os.path.join(VARIANTS_DIR, f"{name}.img")
+    if fresh or not os.path.exists(image):
+        os.makedirs(VARIANTS_DIR, exist_ok=True)
+        print(f"Copying {IMAGE} -> {image}")
+        # qemu-img keeps the copy sparse; a 10 GB image is mostly holes.
+        subprocess.run(["qemu-img", "convert", "-f", "raw", "-O", "raw", IMAGE, image], check=True)
+    return name, image
+
+
+async def run(args):
+    pool = VMPool(args.jobs)
+    jobs = []
+    for name in args.checks:
+        module = load_check(name)
+        jobs.append(pool.run(name, module.check, **module.QEMU_ARGS))
+    for conf in args.variant:
+        name, image = variant_image(conf, args.fresh)
+        argv = [sys.executable, os.path.join(SCRIPTS, "apply-manifest.py"),
+                "--config", os.path.abspath(conf), "--image", image]
+        jobs.append(pool.spawn(f"variant-{name}", argv))
+
+    print(f"Running {len(jobs)} job(s), {pool.size} at a time")
+    results = []
+    for done in asyncio.as_completed(jobs):
+        result = await done
+        results.append(result)
+        print(f"\n##### {result.name} ({'ok' if result.ok else 'FAILED'}) #####")
+        print(result.output)
+
+    print("\n=== Summary ===")
+    for result in sorted(results):
+        print(f"  {result}")
+    return 0 if all(r.ok for r in results) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run VM jobs concurrently")
+    parser.add_argument("checks", nargs="*", metavar="CHECK",
+                        help=f"debug check to run ({', '.join(available_checks())})")
+    parser.add_argument("-j", "--jobs", type=int, help="concurrent VMs (default: CPU count)")
+    parser.add_argument("--variant", action="append", default=[], metavar="CONF",
+                        help="apply the manifest with this config to a variant image")
+    parser.add_argument("--fresh", action="store_true", help="recopy variant images from the base")
+    args = parser.parse_args()
+
+    unknown = set(args.checks) - set(available_checks())
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(sorted(unknown))}")
+    if not args.checks and not args.variant:
+        args.checks = available_checks()
+    return asyncio.run(run(args))
+
+
+try:
+    sys.exit(main())
+except (OSError, subprocess.CalledProcessError) as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
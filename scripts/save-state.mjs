@@ -57,6 +57,8 @@ var emulator = new V86({
     autostart: true,
     acpi: true,
     net_device: { type: "virtio", relay_url: "fetch" },
+    // Must match index.html: the page signals state restores on COM2
+    uart1: true,
 });
 
 var serialOutput = "";
@@ -142,6 +144,25 @@ emulator.add_listener("serial0-output-byte", function(byte) {
     }
 });
 
+// golden-3term.sh logs this to the console once i3 has placed all its
+// terminals; images without it get the old fixed wait.
+var LAYOUT_READY = "WEBBSD_LAYOUT_READY";
+var LAYOUT_SETTLE_MS = 5000;
+
+function waitForLayout() {
+    var startTime = Date.now();
+    var check = setInterval(function() {
+        var ready = serialOutput.includes(LAYOUT_READY);
+        if (ready || Date.now() - startTime > 55000) {
+            clearInterval(check);
+            var elapsed = Math.round((Date.now() - startTime) / 1000);
+            console.log(ready ? `\n=== Layout placed after ${elapsed}s ===`
+                              : "\nNo layout signal; saving anyway.");
+            setTimeout(saveState, ready ? LAYOUT_SETTLE_MS : 0);
+        }
+    }, 500);
+}
+
 function startPolling() {
     var startTime = Date.now();
     var maxWait = 5 * 60 * 1000; // 5 minutes
@@ -152,9 +173,9 @@ function startPolling() {
 
         if (isGraphical) {
             console.log(`\n=== VGA in GRAPHICS mode after ${elapsed}s ===`);
-            console.log("Waiting 55s for layout + delayed clear + wallpaper...\n");
+            console.log("Waiting for the terminal layout (up to 55s)...\n");
             clearInterval(poll);
-            setTimeout(saveState, 55000);
+            waitForLayout();
             return;
         }
 
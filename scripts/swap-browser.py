@@ -4,15 +4,21 @@ Candidates: midori, epiphany, surf (WebKit-based, much lighter than Firefox).
 """
 import subprocess, time, sys, os, socket
 
+from webbsd.qemu.pkgcache import PkgCache
+
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE = os.path.join(BASE, "images", "freebsd.img")
 SERIAL_PORT = 45494
 MONITOR_PORT = 45495
 HOME = "/home/bsduser"
 
+pkg_cache = PkgCache()
+pkg_cache.lock_sync()
+
 proc = subprocess.Popen(
     ["qemu-system-i386", "-m", "1024",
      "-drive", f"file={IMAGE},format=raw,cache=writethrough",
+     *pkg_cache.drive_args(),
      "-display", "none",
      "-serial", f"tcp:127.0.0.1:{SERIAL_PORT},server=on,wait=off",
      "-monitor", f"tcp:127.0.0.1:{MONITOR_PORT},server=on,wait=off",
@@ -91,6 +97,7 @@ send_cmd("pkg delete -fy firefox-esr", timeout=120)
 # Clean up orphaned deps
 send_cmd("pkg autoremove -y", timeout=120)
 send_cmd("pkg clean -ay", timeout=60)
+send_cmd(pkg_cache.attach_command(), timeout=600)
 
 # Check what lighter browsers are available
 print("\n=== Searching for lighter browsers ===")
@@ -170,6 +177,7 @@ send_cmd("echo 'nameserver 8.8.8.8' > /etc/resolv.conf")
 send_cmd(f"chown -R bsduser:bsduser {HOME}")
 
 print("\nSyncing...")
+send_cmd(pkg_cache.detach_command(), timeout=600)
 send("sync\n", 3)
 send("sync\n", 3)
 send("mount -ur /\n", 2)
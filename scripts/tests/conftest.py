@@ -0,0 +1,6 @@
+"""The scripts are run from scripts/, which is how ``import webbsd`` resolves."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+"""Hot-snapshot VMs: shutdown() then commit(), without a real QEMU."""
+
+import asyncio
+import os
+from unittest import mock
+
+import pytest
+
+from webbsd.qemu import QEMU, QEMUError, hot
+from webbsd.qemu.overlay import Overlay
+
+
+class FakeProc:
+    pid = 999999
+    returncode = 0
+
+    async def wait(self):
+        return 0
+
+
+async def _remove_layer(self):
+    self.discard()
+
+
+def hot_vm(tmp_path):
+    image = tmp_path / "freebsd.img"
+    image.write_bytes(b"\0" * 4096)
+    vm = QEMU(image=str(image), overlay=True, hot=True, agent=False)
+    # What _start() does before QEMU runs.
+    vm.hot.use()
+    open(vm.overlay.path, "wb").close()
+    vm.proc = FakeProc()
+    vm._eof = True
+    return vm
+
+
+@pytest.fixture(autouse=True)
+def hot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(hot, "HOT_DIR", str(tmp_path / "hot"))
+    os.makedirs(hot.HOT_DIR)
+
+
+def test_shutdown_then_commit(tmp_path):
+    vm = hot_vm(tmp_path)
+
+    async def run():
+        await vm.shutdown(timeout=1)
+        await vm.commit()
+
+    with mock.patch.object(Overlay, "commit", _remove_layer), \
+            mock.patch.object(hot.HotSnapshot, "drop", mock.AsyncMock()) as drop:
+        asyncio.run(run())
+    drop.assert_awaited_once()
+    assert not vm.overlay.exists
+    assert vm.hot._users_file is None
+
+
+def test_commit_refused_while_another_hot_vm_runs(tmp_path):
+    vm = hot_vm(tmp_path)
+    other = QEMU(image=vm.image, overlay=True, hot=True, agent=False)
+    other.hot.use()
+
+    async def run():
+        await vm.shutdown(timeout=1)
+        await vm.commit()
+
+    try:
+        with mock.patch.object(Overlay, "commit", _remove_layer):
+            with pytest.raises(QEMUError, match="other hot VMs"):
+                asyncio.run(run())
+        assert vm.overlay.exists
+        assert vm.hot._users_file is None
+    finally:
+        other.hot.release()
@@ -0,0 +1,41 @@
+"""plan() and the offline apply against an image whose /home is a symlink."""
+
+import io
+import tarfile
+
+import pytest
+
+from webbsd.manifest import Entry, Manifest, apply_offline, build_tar, plan
+from webbsd.ufs import UFS2
+
+from ufsimage import make_image, symlink
+
+XINITRC = Entry("/home/bsduser/.xinitrc", b"exec i3\n", 0o755, "bsduser:bsduser")
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = str(tmp_path / "ufs.img")
+    make_image(path)
+    with UFS2(path, writable=True) as fs:
+        fs.makedirs("/etc")
+        fs.write_file("/etc/passwd", b"root:*:0:0::0:0:Charlie &:/root:/bin/sh\n"
+                                     b"bsduser:*:1001:1001::0:0:User:/home/bsduser:/bin/sh\n")
+        fs.write_file("/etc/group", b"wheel:*:0:root\nbsduser:*:1001:\n")
+        fs.makedirs("/usr/home/bsduser", 0o755, 1001, 1001)
+        symlink(fs, "/home", "usr/home")
+    return path
+
+
+def test_plan_uses_real_paths(image):
+    manifest = Manifest([XINITRC], [], {}, [])
+    with UFS2(image) as fs:
+        p = plan(manifest, fs)
+    assert [e.path for e in p.files] == ["/usr/home/bsduser/.xinitrc"]
+    names = tarfile.open(fileobj=io.BytesIO(build_tar(p))).getnames()
+    assert "usr/home/bsduser/.xinitrc" in names
+
+    with UFS2(image, writable=True) as fs:
+        apply_offline(fs, p, log=lambda *a: None)
+    with UFS2(image) as fs:
+        assert plan(manifest, fs).empty
@@ -0,0 +1,26 @@
+"""Trace events: concurrent asyncio spans land on separate rows."""
+
+import asyncio
+
+from webbsd import profile
+
+
+def test_concurrent_tasks_get_own_tid(tmp_path, monkeypatch):
+    trace = tmp_path / "trace.jsonl"
+    monkeypatch.setenv(profile.TRACE_ENV, str(trace))
+
+    async def op(name):
+        with profile.span(name, "command"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(op("a"), op("b"))
+        with profile.span("c", "command"):
+            pass
+
+    asyncio.run(main())
+    spans = {e["name"]: e for e in profile.load(str(trace)) if e["ph"] == "X"}
+    assert spans["a"]["tid"] != spans["b"]["tid"]
+    assert spans["c"]["tid"] not in (spans["a"]["tid"], spans["b"]["tid"])
+    named = {e["tid"] for e in profile.load(str(trace)) if e["name"] == "thread_name"}
+    assert {spans[n]["tid"] for n in "abc"} <= named
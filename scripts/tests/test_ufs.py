@@ -0,0 +1,46 @@
+"""Offline UFS2 writes, on a tiny image made by tests/ufsimage.py."""
+
+import pytest
+
+from webbsd.ufs import UFS2, UFSError
+
+from ufsimage import make_image, symlink
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = str(tmp_path / "ufs.img")
+    make_image(path)
+    with UFS2(path, writable=True) as fs:
+        fs.makedirs("/usr/home")
+        # What pw(8) leaves on FreeBSD 13.x.
+        symlink(fs, "/home", "usr/home")
+    return path
+
+
+def test_write_read_roundtrip(image):
+    with UFS2(image, writable=True) as fs:
+        fs.makedirs("/etc")
+        fs.write_file("/etc/motd", b"hello\n", 0o644)
+    with UFS2(image) as fs:
+        assert fs.read_file("/etc/motd") == b"hello\n"
+        assert fs.stat("/etc").is_dir
+
+
+def test_write_through_symlinked_directory(image):
+    with UFS2(image, writable=True) as fs:
+        fs.makedirs("/home/bsduser/.config/i3", 0o755, 1001, 1001)
+        fs.write_file("/home/bsduser/.config/i3/config", b"bar {}\n", 0o644, 1001, 1001)
+    with UFS2(image) as fs:
+        assert fs.read_file("/usr/home/bsduser/.config/i3/config") == b"bar {}\n"
+        assert fs.read_file("/home/bsduser/.config/i3/config") == b"bar {}\n"
+        assert fs.stat("/home/bsduser").uid == 1001
+        assert fs.realpath("/home/bsduser/.xinitrc") == "/usr/home/bsduser/.xinitrc"
+        assert "home" in fs.listdir("/usr")
+
+
+def test_symlink_loop(image):
+    with UFS2(image, writable=True) as fs:
+        symlink(fs, "/loop", "loop")
+        with pytest.raises(UFSError, match="symbolic links"):
+            fs.stat("/loop/x")
@@ -0,0 +1,75 @@
+"""A tiny blank UFS2 filesystem for the offline-writer tests.
+
+One cylinder group of 2 MB (8K blocks, 1K fragments, 256 inodes) and a
+root directory; no GPT, so find_partition() sees the superblock at 64K.
+"""
+
+import stat
+import struct
+
+from webbsd import ufs
+
+FSIZE, BSIZE, FRAG = 1024, 8192, 8
+FPG = 2048
+IPG = 256
+SBLKNO, CBLKNO, IBLKNO = 64, 72, 80
+CSADDR = IBLKNO + IPG * ufs.DINODE_SIZE // FSIZE
+ROOTDIR = CSADDR + 1
+IUSEDOFF, FREEOFF = 168, 200
+CGSIZE = 1024
+
+
+def make_image(path: str) -> None:
+    img = bytearray(FPG * FSIZE)
+
+    sb = bytearray(ufs.SBLOCKSIZE)
+    for name, value in {
+        "sblkno": SBLKNO, "cblkno": CBLKNO, "iblkno": IBLKNO,
+        "dblkno": ROOTDIR, "ncg": 1, "bsize": BSIZE, "fsize": FSIZE, "frag": FRAG,
+        "sbsize": 2048, "nindir": BSIZE // 8, "inopb": BSIZE // ufs.DINODE_SIZE,
+        "cssize": FSIZE, "cgsize": CGSIZE, "ipg": IPG, "fpg": FPG, "clean": 1,
+        "csaddr": CSADDR, "size": FPG, "magic": ufs.FS_UFS2_MAGIC,
+    }.items():
+        ufs._put(sb, ufs._FS, name, value)
+
+    cg = bytearray(CGSIZE)
+    for name, value in {
+        "magic": ufs.CG_MAGIC, "ndblk": FPG, "iusedoff": IUSEDOFF, "freeoff": FREEOFF,
+        "niblk": IPG, "initediblk": IPG,
+    }.items():
+        ufs._put(cg, ufs._CG, name, value)
+    for i in range(3):                      # inodes 0, 1 and the root
+        ufs._setbit(cg, IUSEDOFF, i, True)
+    for d in range(ROOTDIR + 1, FPG):
+        ufs._setbit(cg, FREEOFF, d, True)
+
+    root = bytearray(ufs.DINODE_SIZE)
+    ufs._put(root, ufs._DI, "mode", stat.S_IFDIR | 0o755)
+    ufs._put(root, ufs._DI, "nlink", 2)
+    ufs._put(root, ufs._DI, "size", ufs.DIRBLKSIZ)
+    ufs._put(root, ufs._DI, "blocks", FSIZE // ufs.DEV_BSIZE)
+    struct.pack_into("<q", root, ufs._DI_DB, ROOTDIR)
+    body = bytearray(ufs.DIRBLKSIZ)
+    struct.pack_into("<IHBB", body, 0, ufs.UFS_ROOTINO, 12, ufs.DT_DIR, 1)
+    body[8:9] = b"."
+    struct.pack_into("<IHBB", body, 12, ufs.UFS_ROOTINO, ufs.DIRBLKSIZ - 12, ufs.DT_DIR, 2)
+    body[20:22] = b".."
+
+    img[ufs.SBLOCK_UFS2:ufs.SBLOCK_UFS2 + len(sb)] = sb
+    img[CBLKNO * FSIZE:CBLKNO * FSIZE + CGSIZE] = cg
+    off = IBLKNO * FSIZE + ufs.UFS_ROOTINO * ufs.DINODE_SIZE
+    img[off:off + ufs.DINODE_SIZE] = root
+    img[ROOTDIR * FSIZE:ROOTDIR * FSIZE + len(body)] = body
+    with open(path, "wb") as f:
+        f.write(img)
+
+
+def symlink(fs: ufs.UFS2, path: str, target: str) -> None:
+    """ln -s target path, as a fast symlink."""
+    fs._begin()
+    pino, name = fs._split(path)
+    ino, di = fs._new_inode(pino, stat.S_IFLNK | 0o755, 0, 0, False)
+    di[ufs._DI_DB:ufs._DI_DB + len(target)] = target.encode()
+    ufs._put(di, ufs._DI, "size", len(target))
+    fs._write_inode(ino, di)
+    fs._add_entry(pino, name, ino, ufs.DT_LNK)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Apply the emulator tuning (webbsd/tuning.py) to the image.
+
+Lowers kern.hz, trims the loader.conf module list, turns off cron,
+periodic jobs, sendmail and the other services a browser session never
+uses, and puts /tmp on tmpfs.  The image's loader.conf, fstab and crontab
+are read offline and only what differs is written back, without a boot;
+an image that cannot be read offline is tuned in one boot.
+
+KERN_HZ sets the clock rate; EMULATOR_TUNING="no" leaves the image as it
+is (build both ways and compare with scripts/bench-boot.mjs).  The Sound
+Blaster modules stay when DESKTOP_PROFILE has audio.
+
+Usage:
+    python3 scripts/tune-guest.py [--image PATH] [--config CONF] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import sys
+
+from webbsd import IMAGE, desktop, tuning
+from webbsd.config import CONF, load_config
+from webbsd.manifest import (SCRIPT_PATH, PartialApply, apply_offline, build_tar,
+                             extract_command, plan)
+from webbsd.qemu import QEMU, QEMUError
+from webbsd.qemu.transfer import put_file
+from webbsd.ufs import UFS2, UFSError
+
+
+def describe(p):
+    for e in p.files:
+        print(f"  file   {e.path}")
+    for k, v in p.sysrc.items():
+        print(f"  sysrc  {k}=\"{v}\"")
+
+
+def read_offline(fs):
+    return {path: fs.read_file(path).decode(errors="replace") if fs.stat(path) else None
+            for path in tuning.FILES}
+
+
+async def tune_booted(image, hz, audio):
+    vm = QEMU(image=image, overlay=True)
+    async with vm:
+        print("Waiting for FreeBSD to boot...")
+        await vm.login()
+        await vm.quiesce()
+        current = {}
+        for path in tuning.FILES:
+            result = await vm.run(f"cat {path}")
+            current[path] = result.stdout if result.ok else None
+        p = plan(tuning.manifest(current, hz, audio))
+        describe(p)
+        print("  " + str(await put_file(vm, build_tar(p), "/tmp/wbapply.tgz")))
+        await vm.run(f"{extract_command('/tmp/wbapply.tgz')} && sh {SCRIPT_PATH}",
+                     timeout=120, check=True)
+        await vm.shutdown()
+        await vm.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the guest for running under v86")
+    parser.add_argument("--image", default=IMAGE, help="raw disk image (default: images/freebsd.img)")
+    parser.add_argument("--config", default=CONF, help="build configuration (default: webbsd.conf)")
+    parser.add_argument("--dry-run", action="store_true", help="show the changes and exit")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    if cfg.get("EMULATOR_TUNING", "yes") != "yes":
+        print("EMULATOR_TUNING is off; image left as it is.")
+        return 0
+    try:
+        hz = int(cfg.get("KERN_HZ", "") or tuning.DEFAULT_HZ)
+    except ValueError:
+        print(f"ERROR: KERN_HZ must be a number, not {cfg['KERN_HZ']!r}")
+        return 1
+    audio = desktop.desktop_profile(cfg.get("DESKTOP_PROFILE", "")).audio
+    print(f"Tuning {args.image}: kern.hz={hz}, sound modules {'kept' if audio else 'dropped'}")
+
+    try:
+        with UFS2(args.image) as fs:
+            p = plan(tuning.manifest(read_offline(fs), hz, audio), fs)
+    except (UFSError, OSError) as e:
+        print(f"Cannot read image offline ({e}); tuning in a boot")
+        if not args.dry_run:
+            asyncio.run(tune_booted(args.image, hz, audio))
+        return 0
+
+    if p.empty:
+        print("Image already tuned.")
+        return 0
+    print("Changes:")
+    describe(p)
+    if args.dry_run:
+        return 0
+    try:
+        with UFS2(args.image, writable=True) as fs:
+            print("\nApplying offline:")
+            apply_offline(fs, p)
+    except PartialApply:
+        raise
+    except UFSError as e:
+        print(f"Offline apply not possible ({e}); booting instead")
+        asyncio.run(tune_booted(args.image, hz, audio))
+    print("Done.")
+    return 0
+
+
+try:
+    sys.exit(main())
+except (QEMUError, UFSError, desktop.ProfileError) as e:
+    print(f"ERROR: {e}")
+    sys.exit(1)
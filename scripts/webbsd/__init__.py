@@ -0,0 +1,12 @@
+"""Shared helpers for the webBSD build and fix scripts.
+
+The scripts in scripts/ are run directly (``python3 scripts/foo.py``), which
+puts scripts/ on sys.path, so ``import webbsd`` works without installing
+anything.
+"""
+
+import os
+
+BASE = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+IMAGES_DIR = os.path.join(BASE, "images")
+IMAGE = os.path.join(IMAGES_DIR, "freebsd.img")
@@ -0,0 +1,287 @@
+"""Content-addressed build cache for the stages of build-desktop.sh.
+
+Each stage's result is stored under images/cache/, keyed by a hash of
+everything that can change it:
+
+  - the key of the stage before it (so a change invalidates everything after)
+  - the stage's input files (its script, plus any extra files named), and
+    the webbsd package modules its Python inputs import, directly or not
+  - the webbsd.conf values those files mention by name
+  - the stage's command line
+
+Image stages are stored as qcow2: the first as a standalone image, later
+ones as overlays backed by the previous stage, holding only the clusters
+that stage changed (``qemu-img convert -B``).  File stages (save-state)
+store copies of their output files.
+
+images/freebsd.img is only rewritten ("checked out") from the cache when
+a stage actually has to run, or at the end of the build; a small record
+remembers which key the raw image currently holds.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+from typing import List, Optional
+
+from . import BASE, IMAGE, IMAGES_DIR, profile
+from .config import CONF, load_config
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(IMAGES_DIR, "cache")
+CHAIN = os.path.join(CACHE_DIR, "chain.json")
+CURRENT = os.path.join(CACHE_DIR, "current.json")
+
+
+class CacheError(Exception):
+    pass
+
+
+def _qemu_img(*args):
+    try:
+        subprocess.run(["qemu-img", *args], check=True)
+    except FileNotFoundError:
+        raise CacheError("qemu-img not found (install QEMU)") from None
+    except subprocess.CalledProcessError as e:
+        raise CacheError(f"qemu-img {args[0]} failed (exit {e.returncode})") from None
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(path, value):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(value, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _image_sig():
+    st = os.stat(IMAGE)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _module_files(name: str) -> List[str]:
+    """The files importing module name runs: its packages' __init__ and itself."""
+    parts = name.split(".")
+    if parts[0] != "webbsd":
+        return []
+    root = os.path.dirname(PACKAGE_DIR)
+    files = []
+    for i in range(1, len(parts) + 1):
+        path = os.path.join(root, *parts[:i])
+        if os.path.isdir(path):
+            files.append(os.path.join(path, "__init__.py"))
+        elif os.path.exists(path + ".py"):
+            files.append(path + ".py")
+            break
+        else:
+            break
+    return files
+
+
+def _imported(path: str) -> List[str]:
+    """The webbsd package files a Python file imports, directly or not."""
+    seen, todo = set(), [path]
+    while todo:
+        f = todo.pop()
+        with open(f, "rb") as fh:
+            source = fh.read()
+        try:
+            tree = ast.parse(source, f)
+        except SyntaxError:
+            continue
+        package = []
+        if f.startswith(PACKAGE_DIR + os.sep):
+            rel = os.path.relpath(os.path.dirname(f), os.path.dirname(PACKAGE_DIR))
+            package = rel.split(os.sep)
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names += [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                base = package[:len(package) - node.level + 1] if node.level else []
+                module = ".".join(base + ([node.module] if node.module else []))
+                names.append(module)
+                # "from webbsd import desktop" imports the submodule too.
+                names += [f"{module}.{a.name}" for a in node.names]
+        for name in names:
+            for dep in _module_files(name):
+                if dep not in seen:
+                    seen.add(dep)
+                    todo.append(dep)
+    return sorted(seen)
+
+
+def stage_key(name: str, inputs: List[str], argv: List[str], parent: Optional[str]) -> str:
+    """Hash of a stage's parent key, input files, relevant config and command."""
+    conf = load_config(CONF)
+    h = hashlib.sha256()
+    h.update(f"stage {name}\nparent {parent or '-'}\n".encode())
+    text = ""
+    for path in inputs:
+        full = os.path.join(BASE, path)
+        files = [full]
+        if os.path.isdir(full):
+            files = sorted(os.path.join(d, f) for d, _, fs in os.walk(full) for f in fs
+                           if "__pycache__" not in d)
+        files = list(dict.fromkeys(files + [m for f in files if f.endswith(".py")
+                                            for m in _imported(f)]))
+        for f in files:
+            with open(f, "rb") as fh:
+                data = fh.read()
+            h.update(f"file {os.path.relpath(f, BASE)} {len(data)}\n".encode())
+            h.update(data)
+            text += data.decode(errors="replace")
+    # Only the config keys a stage's inputs mention, so a tweak to
+    # X11_RESOLUTION does not rebuild the base image.
+    for key in sorted(conf):
+        if re.search(r"\b" + re.escape(key) + r"\b", text):
+            h.update(f"conf {key}={conf[key]}\n".encode())
+    argv = [a.replace(BASE + os.sep, "") for a in argv]
+    h.update(("argv " + json.dumps(argv) + "\n").encode())
+    return h.hexdigest()[:16]
+
+
+class Stage:
+    def __init__(self, name: str, key: str, outputs: List[str]):
+        self.name, self.key, self.outputs = name, key, outputs
+
+    @property
+    def is_image(self) -> bool:
+        return not self.outputs
+
+    @property
+    def path(self) -> str:
+        if self.is_image:
+            return os.path.join(CACHE_DIR, f"{self.name}-{self.key}.qcow2")
+        return os.path.join(CACHE_DIR, f"{self.name}-{self.key}")
+
+    def cached(self) -> bool:
+        return os.path.exists(self.path)
+
+
+def begin():
+    """Start a new build: the next stage has no parent."""
+    _write_json(CHAIN, {"parent": None, "image": None})
+    profile.reset()
+
+
+def checkout(image_path: Optional[str]) -> None:
+    """Make images/freebsd.img hold the given cached image stage."""
+    current = _read_json(CURRENT, {})
+    if image_path is None:
+        return
+    if (current.get("image") == image_path and os.path.exists(IMAGE)
+            and current.get("sig") == _image_sig()):
+        return
+    print(f"  checkout {os.path.basename(image_path)} -> {os.path.relpath(IMAGE, BASE)}")
+    tmp = IMAGE + ".checkout"
+    with profile.span(f"checkout {os.path.basename(image_path)}", "disk"):
+        _qemu_img("convert", "-O", "raw", image_path, tmp)
+    os.replace(tmp, IMAGE)
+    _write_json(CURRENT, {"image": image_path, "sig": _image_sig()})
+
+
+def run(name: str, inputs: List[str], argv: List[str], outputs: List[str]) -> int:
+    """Run one stage, or restore it from the cache if its key is unchanged."""
+    # The stage's own processes tag their trace events with its name.
+    os.environ[profile.STAGE_ENV] = name
+    with profile.span(name, "stage") as span:
+        status = _run(name, inputs, argv, outputs, span)
+        span["status"] = status
+        return status
+
+
+def _run(name, inputs, argv, outputs, span):
+    if os.environ.get("WEBBSD_NO_CACHE"):
+        return subprocess.call(argv)
+    chain = _read_json(CHAIN, {"parent": None, "image": None})
+    stage = Stage(name, stage_key(name, inputs, argv, chain["parent"]), outputs)
+
+    if stage.cached():
+        print(f"  [cache] {name} {stage.key}: unchanged, skipped")
+        span["cached"] = True
+    else:
+        print(f"  [cache] {name} {stage.key}: running")
+        if chain["image"] or not stage.is_image:
+            checkout(chain["image"])
+        status = subprocess.call(argv)
+        if status:
+            # The raw image no longer matches any cache entry.
+            _write_json(CURRENT, {})
+            return status
+        with profile.span(f"store {os.path.basename(stage.path)}", "disk"):
+            store(stage, chain["image"])
+
+    if stage.is_image:
+        chain["image"] = stage.path
+    else:
+        restore_files(stage)
+    chain["parent"] = stage.key
+    _write_json(CHAIN, chain)
+    return 0
+
+
+def store(stage: Stage, parent_image: Optional[str]) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    if stage.is_image:
+        tmp = stage.path + ".tmp"
+        if parent_image:
+            # Only clusters that differ from the previous stage are written.
+            # The backing file is named relative to the overlay (same dir).
+            _qemu_img("convert", "-O", "qcow2", "-B", os.path.basename(parent_image),
+                      "-F", "qcow2", IMAGE, tmp)
+        else:
+            _qemu_img("convert", "-O", "qcow2", IMAGE, tmp)
+        os.replace(tmp, stage.path)
+        _write_json(CURRENT, {"image": stage.path, "sig": _image_sig()})
+    else:
+        tmp = stage.path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for out in stage.outputs:
+            src = os.path.join(BASE, out)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(tmp, os.path.basename(out)))
+        os.replace(tmp, stage.path)
+
+
+def restore_files(stage: Stage) -> None:
+    for out in stage.outputs:
+        src = os.path.join(stage.path, os.path.basename(out))
+        dest = os.path.join(BASE, out)
+        if os.path.exists(src) and not (os.path.exists(dest)
+                                        and os.path.getsize(dest) == os.path.getsize(src)
+                                        and os.path.getmtime(dest) == os.path.getmtime(src)):
+            shutil.copy2(src, dest)
+
+
+def finish() -> None:
+    """Leave images/freebsd.img holding the last image stage of this build."""
+    checkout(_read_json(CHAIN, {}).get("image"))
+
+
+def entries():
+    """(name, size, mtime) of every cache entry, newest first."""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    out = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.endswith(".json"):
+            continue
+        size = os.path.getsize(path) if os.path.isfile(path) else sum(
+            os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        out.append((name, size, os.path.getmtime(path)))
+    return sorted(out, key=lambda e: -e[2])
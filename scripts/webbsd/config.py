@@ -0,0 +1,21 @@
+"""webbsd.conf: the shell-style KEY="value" build configuration."""
+
+import os
+
+from . import BASE
+
+CONF = os.path.join(BASE, "webbsd.conf")
+
+
+def load_config(path=CONF):
+    config = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "=" in line:
+                key, val = line.split("=", 1)
+                val = val.strip().strip('"').strip("'")
+                config[key.strip()] = val
+    return config
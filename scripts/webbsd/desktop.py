@@ -0,0 +1,115 @@
+"""DESKTOP_PROFILE: how much of the i3 desktop a build turns on.
+
+Everything that moves on the desktop costs emulated CPU on the visitor's
+machine, so webbsd.conf picks one of three profiles:
+
+  full     picom, the sparkline bar every 2 s, the wallpaper cycle,
+           tty-clock in the layout, PulseAudio's OSS bridge and cava
+  lite     no compositor, one wallpaper picked at login, the bar without
+           the CPU/MEM graphs every 10 s, no audio daemons, no clock
+  minimal  as lite, with a solid background and the bar every 30 s
+
+The provisioning scripts look the profile up with ``desktop_profile()``
+and drop what it leaves out: packages (``packages()``), i3 config lines
+(``i3_config()``), urxvt's ARGB visual and cursor blink
+(``xresources()``), and for apply-manifest.py the whole manifest
+(``adjust()``).  A lite saved state comes from a build with
+DESKTOP_PROFILE="lite".
+"""
+
+import re
+from typing import Iterable, List, NamedTuple
+
+from .manifest import Manifest
+from .qemu.statusbar import status_sh
+
+DEFAULT = "full"
+
+COMPOSITOR_PACKAGES = ("picom",)
+AUDIO_PACKAGES = ("pulseaudio", "cava", "virtual_oss")
+CLOCK_PACKAGES = ("tty-clock",)
+
+
+class ProfileError(Exception):
+    pass
+
+
+class DesktopProfile(NamedTuple):
+    name: str
+    compositor: bool  # picom and the translucent terminals
+    wallpaper: str  # "cycle", "static" (one, set at login) or "" (solid colour)
+    status_args: str  # webbsd-status options
+    audio: bool  # PulseAudio, virtual_oss, cava
+    clock: bool  # tty-clock in Terminal C of the golden layout
+
+
+PROFILES = {
+    "full": DesktopProfile("full", True, "cycle", "", True, True),
+    "lite": DesktopProfile("lite", False, "static", "-s -i 10", False, False),
+    "minimal": DesktopProfile("minimal", False, "", "-s -i 30", False, False),
+}
+
+
+def desktop_profile(name: str) -> DesktopProfile:
+    """The profile called name (empty: the default)."""
+    try:
+        return PROFILES[(name or DEFAULT).lower()]
+    except KeyError:
+        raise ProfileError(f"DESKTOP_PROFILE must be one of {', '.join(PROFILES)}, "
+                           f"not {name!r}") from None
+
+
+def _left_out(profile: DesktopProfile) -> List[str]:
+    names = []
+    if not profile.compositor:
+        names += COMPOSITOR_PACKAGES
+    if not profile.audio:
+        names += AUDIO_PACKAGES
+    if not profile.clock:
+        names += CLOCK_PACKAGES
+    return names
+
+
+def packages(profile: DesktopProfile, names: Iterable[str]) -> List[str]:
+    """names without the packages the profile leaves out."""
+    drop = set(_left_out(profile))
+    return [n for n in names if n not in drop]
+
+
+def i3_config(text: str, profile: DesktopProfile) -> str:
+    """text without the exec lines that start what the profile leaves out."""
+    words = _left_out(profile)
+    if profile.wallpaper != "cycle":
+        words.append("wallpaper-cycle.sh")
+    if profile.wallpaper != "static":
+        words.append("cycle-wp.sh")
+    pattern = re.compile(r"^\s*exec(_always)?\s.*(" + "|".join(map(re.escape, words)) + ")")
+    lines = text.split("\n")
+    return "\n".join(l for l in lines if not pattern.search(l))
+
+
+def xresources(text: str, profile: DesktopProfile) -> str:
+    """text with opaque, non-blinking terminals unless there is a compositor.
+
+    Without one the 32-bit visual buys nothing, and every blink redraws
+    each terminal's cursor.
+    """
+    if profile.compositor:
+        return text
+    text = re.sub(r"^URxvt\.depth:.*\n?", "", text, flags=re.M)
+    text = re.sub(r"\[\d+\](#[0-9A-Fa-f]{6})", r"\1", text)
+    return re.sub(r"^(URxvt\.cursorBlink:).*$", r"\1 false", text, flags=re.M)
+
+
+def adjust(manifest: Manifest, profile: DesktopProfile) -> Manifest:
+    """The desktop manifest with the profile applied."""
+    entries = []
+    for e in manifest.files:
+        if e.data is not None and e.path.endswith("/.config/i3/config"):
+            e = e._replace(data=i3_config(e.data.decode(), profile).encode())
+        elif e.data is not None and e.path.endswith("/.Xresources"):
+            e = e._replace(data=xresources(e.data.decode(), profile).encode())
+        elif e.data is not None and e.path.endswith("/.config/i3/status.sh"):
+            e = e._replace(data=status_sh(profile.status_args).encode())
+        entries.append(e)
+    return manifest._replace(files=entries, packages=packages(profile, manifest.packages))
@@ -0,0 +1,142 @@
+"""KERNEL_BUILD: a slim kernel configuration for the hardware v86 emulates.
+
+The image boots the release's GENERIC kernel, which probes for and
+carries drivers for hundreds of devices the emulator will never show it,
+plus the debugger and SMP support v86's single CPU has no use for.
+``kernconf()`` derives the WEBBSD configuration from the release's own
+GENERIC: every ``device`` line not in KEEP_DEVICES becomes a
+``nodevice``, the debugging and SMP options are turned off, and so are
+the makeoptions that build debug symbols and CTF.  Working from GENERIC
+keeps the names valid for whatever release FREEBSD_VERSION is.
+
+Kept are the devices v86 emulates (PIIX ATA disks, virtio-net, the PS/2
+keyboard and mouse, VGA and the 16550 UARTs, with ISA/PCI/ACPI and the
+APIC), the pseudo-devices userland needs (bpf for dhclient, io and mem
+for Xorg), and what the QEMU provisioning VMs add: e1000 for their
+network.  The modules loaded at run time (the agent's virtio_console,
+pf, tmpfs, and the sound modules and cuse when the desktop profile has
+audio) are built with MODULES_OVERRIDE; everything else is not built at
+all.
+
+The sources come from the host-side source cache in images/src/: the
+release's src.txz is downloaded once and cut down to usr/src/sys
+(without the trees of other architectures).  scripts/build-kernel.py
+builds and installs the kernel in the guest.
+"""
+
+import os
+import re
+import subprocess
+import tarfile
+from typing import Iterable, List
+
+from . import IMAGES_DIR
+
+KERNCONF = "WEBBSD"
+KERNEL_DIR = "webbsd"  # /boot/webbsd, next to the release's /boot/kernel
+SRC_DIR = os.path.join(IMAGES_DIR, "src")
+
+KEEP_DEVICES = (
+    # buses, interrupts, FPU
+    "acpi", "apic", "atpic", "isa", "pci", "npx",
+    # ATA disks and CD-ROM through CAM
+    "ata", "scbus", "da", "cd", "pass",
+    # PS/2 keyboard and mouse
+    "atkbdc", "atkbd", "psm", "kbdmux", "evdev",
+    # VGA console and serial ports (ttyu0, the restore signal on cuau1)
+    "vt", "vt_vga", "vga", "uart",
+    # network: virtio-net in v86, e1000 in the QEMU build VMs
+    "virtio", "virtio_pci", "vtnet", "em",
+    # pseudo-devices
+    "loop", "ether", "bpf", "mem", "io", "md", "firmware", "crypto",
+)
+SOUND_DEVICES = ("sound", "snd_sb16", "snd_sbc")
+
+DEBUG_OPTIONS = (
+    "KDB", "KDB_TRACE", "DDB", "DDB_CTF", "GDB", "KTRACE", "STACK",
+    "DEADLKRES", "INVARIANTS", "INVARIANT_SUPPORT", "WITNESS", "WITNESS_SKIPSPIN",
+    "MALLOC_DEBUG_MAXZONES", "BUF_TRACKING", "FULL_BUF_TRACKING", "DIAGNOSTIC",
+    "KDTRACE_HOOKS", "KDTRACE_FRAME", "HWPMC_HOOKS", "VERBOSE_SYSINIT",
+    "INCLUDE_CONFIG_FILE",
+)
+# v86 has one CPU.
+SMP_OPTIONS = ("SMP", "EARLY_AP_STARTUP")
+DEBUG_MAKEOPTIONS = ("DEBUG", "WITH_CTF")
+
+MODULES = ("tmpfs", "pf", "virtio/console")
+SOUND_MODULES = ("sound/sound", "sound/driver/sb16", "sound/driver/sbc", "cuse")
+
+# Source trees usr/src/sys does not need for an i386 kernel.
+OTHER_ARCHES = ("arm", "arm64", "mips", "powerpc", "riscv")
+
+
+def _declared(generic: str, keyword: str) -> List[str]:
+    """Names given to keyword (device, options, makeoptions) in generic."""
+    names = []
+    for line in generic.splitlines():
+        fields = line.split("#")[0].split()
+        if len(fields) > 1 and fields[0] == keyword:
+            names += [n.split("=")[0] for n in " ".join(fields[1:]).replace(",", " ").split()]
+    return names
+
+
+def kernconf(generic: str, audio: bool = True, name: str = KERNCONF) -> str:
+    """The slim configuration, as changes on top of generic."""
+    keep = KEEP_DEVICES + (SOUND_DEVICES if audio else ())
+    devices = [d for d in _declared(generic, "device") if d not in keep]
+    options = [o for o in _declared(generic, "options") if o in DEBUG_OPTIONS + SMP_OPTIONS]
+    makeoptions = [m for m in _declared(generic, "makeoptions") if m in DEBUG_MAKEOPTIONS]
+    lines = [f"# {name}: GENERIC cut down to what v86 emulates (webbsd/kernel.py)",
+             "",
+             "include\t\tGENERIC",
+             f"ident\t\t{name}",
+             ""]
+    lines += [f"nomakeoptions\t{m}" for m in dict.fromkeys(makeoptions)]
+    lines += [f"nooptions\t{o}" for o in dict.fromkeys(options)]
+    lines += [f"nodevice\t{d}" for d in dict.fromkeys(devices)]
+    return "\n".join(lines) + "\n"
+
+
+def modules(audio: bool = True, extra: Iterable[str] = ()) -> List[str]:
+    """MODULES_OVERRIDE: the sys/modules directories to build."""
+    return list(dict.fromkeys(MODULES + (SOUND_MODULES if audio else ()) + tuple(extra)))
+
+
+def loader_conf(current: str, enabled: bool = True) -> str:
+    """current with kernel= set to the slim kernel, or removed."""
+    lines = [l for l in current.splitlines() if not re.match(r"\s*kernel\s*=", l)]
+    if enabled:
+        lines.append(f'kernel="{KERNEL_DIR}"')
+    return "\n".join(lines) + "\n"
+
+
+# ── source cache ─────────────────────────────────────────────────────
+
+def src_url(version: str, arch: str) -> str:
+    return f"https://download.freebsd.org/releases/{arch}/{version}-RELEASE/src.txz"
+
+
+def sys_tarball(version: str, arch: str) -> str:
+    """The cached usr/src/sys tarball for the release, made on first use."""
+    os.makedirs(SRC_DIR, exist_ok=True)
+    name = f"FreeBSD-{version}-RELEASE-{arch}"
+    tgz = os.path.join(SRC_DIR, f"{name}-sys.tgz")
+    if os.path.exists(tgz):
+        return tgz
+    txz = os.path.join(SRC_DIR, f"{name}-src.txz")
+    if not os.path.exists(txz):
+        print(f"Downloading {src_url(version, arch)}...")
+        subprocess.run(["curl", "-fL", "-o", txz + ".part", src_url(version, arch)], check=True)
+        os.rename(txz + ".part", txz)
+    print(f"Extracting usr/src/sys into {tgz}...")
+    skip = tuple(f"usr/src/sys/{a}/" for a in OTHER_ARCHES)
+    with tarfile.open(txz, "r|xz") as src, \
+            tarfile.open(tgz + ".part", "w:gz", compresslevel=1) as dst:
+        for member in src:
+            path = member.name[2:] if member.name.startswith("./") else member.name
+            if not path.startswith("usr/src/sys/") or (path + "/").startswith(skip):
+                continue
+            member.name = path
+            dst.addfile(member, src.extractfile(member) if member.isfile() else None)
+    os.rename(tgz + ".part", tgz)
+    return tgz
@@ -0,0 +1,28 @@
+"""The golden-ratio terminal layout of the i3 desktop.
+
+golden-3term.sh and golden-3term.json live in desktop/files (the desktop
+manifest installs them); the fix scripts that write them over the serial
+console take them from here, with Terminal C's command swapped if asked.
+"""
+
+import os
+import re
+from typing import Dict, Optional
+
+from . import BASE
+
+SOURCE_DIR = os.path.join(BASE, "desktop", "files", "home", "bsduser", ".config", "i3")
+SCRIPT = "golden-3term.sh"
+LAYOUT = "golden-3term.json"
+CLOCK_CMD = "tty-clock -c -C 1 -t"
+
+
+def files(c_cmd: Optional[str] = None) -> Dict[str, str]:
+    """File name -> text of the layout script and its append_layout tree."""
+    result = {}
+    for name in (SCRIPT, LAYOUT):
+        with open(os.path.join(SOURCE_DIR, name)) as f:
+            result[name] = f.read()
+    if c_cmd:
+        result[SCRIPT] = re.sub(r'^C_CMD=.*$', f'C_CMD="{c_cmd}"', result[SCRIPT], flags=re.M)
+    return result
@@ -0,0 +1,312 @@
+"""Declarative manifests: what the guest image should contain.
+
+A manifest is JSON::
+
+    {
+      "packages": ["git", "vim"],
+      "sysrc": {"hostname": "webbsd", "pf_enable": "YES"},
+      "rc_local": ["/usr/local/sbin/net-watchdog.sh listen &"],
+      "files": [
+        {"path": "/home/bsduser/.xinitrc", "source": "files/home/bsduser/.xinitrc",
+         "mode": "0755", "owner": "bsduser:bsduser"},
+        {"path": "/etc/motd", "content": "Welcome to webBSD\\n"},
+        {"path": "/home/bsduser/.config/i3", "type": "dir",
+         "owner": "bsduser:bsduser"}
+      ]
+    }
+
+``source`` is relative to the manifest's directory.  ``mode`` defaults to
+0644 (0755 for directories) and ``owner`` to root:wheel.  ``rc_local``
+lines are kept in a marked block of /etc/rc.local; the rest of the file is
+left alone.
+
+``plan()`` diffs a manifest against the image (read offline through
+webbsd.ufs) and keeps only what differs.  A plan is applied either offline
+with ``inject()``, or in one boot as a single tar stream plus one batched
+script (``build_tar()``/``batch_script()``).
+"""
+
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from .ufs import UFS2, UFSError
+
+RC_LOCAL = "/etc/rc.local"
+RC_CONF = "/etc/rc.conf"
+RC_LOCAL_BEGIN = "# BEGIN webbsd manifest"
+RC_LOCAL_END = "# END webbsd manifest"
+PKG_DB = "/var/db/pkg/local.sqlite"
+
+# Where the batched script lands inside the tar stream.
+SCRIPT_PATH = "/tmp/wbapply.sh"
+
+
+class PartialApply(UFSError):
+    """An offline apply failed after it had started writing."""
+
+
+class Entry(NamedTuple):
+    path: str
+    data: Optional[bytes]  # None for directories
+    mode: int
+    owner: str
+
+    @property
+    def is_dir(self) -> bool:
+        return self.data is None
+
+
+class Manifest(NamedTuple):
+    files: List[Entry]
+    packages: List[str]
+    sysrc: Dict[str, str]
+    rc_local: List[str]
+
+
+class Plan(NamedTuple):
+    """The part of a manifest that differs from the image."""
+
+    files: List[Entry]
+    packages: List[str]
+    sysrc: Dict[str, str]
+    rc_local: Optional[List[str]]  # hooks still to merge into an unknown rc.local
+
+    @property
+    def empty(self) -> bool:
+        return not (self.files or self.packages or self.sysrc or self.rc_local)
+
+
+def load_manifest(path: str, extra_packages=()) -> Manifest:
+    with open(path) as f:
+        doc = json.load(f)
+    root = os.path.dirname(os.path.abspath(path))
+    entries = []
+    for item in doc.get("files", []):
+        dest = item["path"]
+        if item.get("type") == "dir":
+            data = None
+        elif "source" in item:
+            with open(os.path.join(root, item["source"]), "rb") as f:
+                data = f.read()
+        else:
+            data = item.get("content", "").encode()
+        default = "0755" if data is None else "0644"
+        entries.append(Entry(dest, data, int(str(item.get("mode", default)), 8),
+                             item.get("owner", "root:wheel")))
+    packages = list(dict.fromkeys(list(extra_packages) + doc.get("packages", [])))
+    return Manifest(entries, packages, {k: str(v) for k, v in doc.get("sysrc", {}).items()},
+                    doc.get("rc_local", []))
+
+
+# ── rc.local / rc.conf rendering ─────────────────────────────────────
+
+def render_rc_local(current: str, hooks: List[str]) -> str:
+    """current with its managed block replaced by hooks (appended if absent)."""
+    lines = current.splitlines() or ["#!/bin/sh"]
+    if RC_LOCAL_BEGIN in lines and RC_LOCAL_END in lines:
+        start, end = lines.index(RC_LOCAL_BEGIN), lines.index(RC_LOCAL_END)
+        lines = lines[:start] + lines[end + 1:]
+    # Drop hook lines a fix script added by hand before the block existed.
+    lines = [l for l in lines if l not in hooks]
+    if hooks:
+        lines += [RC_LOCAL_BEGIN] + hooks + [RC_LOCAL_END]
+    return "\n".join(lines) + "\n"
+
+
+def parse_rc_conf(text: str) -> Dict[str, str]:
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#") or "=" not in line:
+            continue
+        key, val = line.split("=", 1)
+        values[key.strip()] = val.split("#")[0].strip().strip('"').strip("'")
+    return values
+
+
+def render_rc_conf(current: str, settings: Dict[str, str]) -> str:
+    """What sysrc(8) would leave: the last assignment replaced, or appended."""
+    lines = current.splitlines()
+    for key, val in settings.items():
+        new = f'{key}="{val}"'
+        for i in reversed(range(len(lines))):
+            if lines[i].strip().startswith(key + "="):
+                lines[i] = new
+                break
+        else:
+            lines.append(new)
+    return "\n".join(lines) + "\n"
+
+
+# ── diffing against the image ────────────────────────────────────────
+
+def _ids(fs, path: str) -> Dict[str, int]:
+    """name -> id from the image's own /etc/passwd or /etc/group."""
+    ids = {}
+    for line in fs.read_file(path).decode(errors="replace").splitlines():
+        fields = line.split(":")
+        if len(fields) > 2 and not line.startswith("#"):
+            ids[fields[0]] = int(fields[2])
+    return ids
+
+
+def resolve_owner(owner: str, users: Dict[str, int], groups: Dict[str, int]):
+    user, _, group = owner.partition(":")
+    try:
+        uid = int(user) if user.isdigit() else users[user]
+        gid = int(group) if group.isdigit() else groups[group or user]
+    except KeyError as e:
+        raise UFSError(f"unknown user or group {e} in owner {owner!r}") from None
+    return uid, gid
+
+
+def installed_packages(fs) -> Optional[set]:
+    """Names of installed packages from the image's pkg database, if any."""
+    if fs.stat(PKG_DB) is None:
+        return None
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        tmp.write(fs.read_file(PKG_DB))
+        tmp.flush()
+        db = sqlite3.connect(tmp.name)
+        try:
+            return {row[0] for row in db.execute("SELECT name FROM packages")}
+        finally:
+            db.close()
+
+
+def _read_text(fs, path):
+    return fs.read_file(path).decode(errors="replace") if fs.stat(path) else ""
+
+
+def plan(manifest: Manifest, fs: Optional[UFS2] = None) -> Plan:
+    """Diff manifest against the image; without fs everything is applied."""
+    if fs is None:
+        return Plan(list(manifest.files), list(manifest.packages),
+                    dict(manifest.sysrc), list(manifest.rc_local) or None)
+
+    users, groups = _ids(fs, "/etc/passwd"), _ids(fs, "/etc/group")
+    files = []
+    for e in manifest.files:
+        # Entries are kept under their real paths (/home is a symlink to
+        # usr/home), which both apply paths write through.
+        e = e._replace(path=fs.realpath(e.path))
+        st = fs.stat(e.path)
+        uid, gid = resolve_owner(e.owner, users, groups)
+        if st is None or (st.mode & 0o7777, st.uid, st.gid) != (e.mode, uid, gid) \
+                or st.is_dir != e.is_dir or (not e.is_dir and fs.read_file(e.path) != e.data):
+            files.append(e)
+
+    if manifest.rc_local:
+        current = _read_text(fs, RC_LOCAL)
+        rendered = render_rc_local(current, manifest.rc_local)
+        st = fs.stat(RC_LOCAL)
+        if rendered != current or st is None or st.mode & 0o111 == 0:
+            files.append(Entry(RC_LOCAL, rendered.encode(), 0o755, "root:wheel"))
+
+    rc_conf = parse_rc_conf(_read_text(fs, RC_CONF))
+    sysrc = {k: v for k, v in manifest.sysrc.items() if rc_conf.get(k) != v}
+
+    have = installed_packages(fs)
+    packages = [p for p in manifest.packages if have is None or p not in have]
+    return Plan(files, packages, sysrc, None)
+
+
+# ── applying ─────────────────────────────────────────────────────────
+
+def inject(fs: UFS2, entries: List[Entry], log=print) -> None:
+    """Write entries into an open, writable filesystem."""
+    users = _ids(fs, "/etc/passwd")
+    groups = _ids(fs, "/etc/group")
+    for e in entries:
+        uid, gid = resolve_owner(e.owner, users, groups)
+        parent = os.path.dirname(e.path.rstrip("/"))
+        fs.makedirs(parent, 0o755, uid, gid)
+        if e.is_dir:
+            fs.makedirs(e.path, e.mode, uid, gid)
+            log(f"  {e.path}/")
+        else:
+            fs.write_file(e.path, e.data, e.mode, uid, gid)
+            log(f"  {e.path} ({len(e.data)} bytes, {e.mode:04o} {e.owner})")
+
+
+def apply_offline(fs: UFS2, p: Plan, log=print) -> None:
+    """Apply a plan without booting; packages cannot be installed this way.
+
+    A UFSError before the first write leaves the image as it was; one after
+    it is raised as PartialApply, and the image needs fsck before it is
+    booted or applied to again.
+    """
+    if p.packages:
+        raise UFSError("packages need a boot: " + " ".join(p.packages))
+    entries = list(p.files)
+    if p.sysrc:
+        rendered = render_rc_conf(_read_text(fs, RC_CONF), p.sysrc)
+        entries.append(Entry(RC_CONF, rendered.encode(), 0o644, "root:wheel"))
+    try:
+        inject(fs, entries, log)
+    except UFSError as e:
+        if not fs.modified:
+            raise
+        raise PartialApply(f"offline apply failed partway ({e}); {fs.path} is partly "
+                           "written and marked unclean: run fsck on it (fsck_ufs -y on "
+                           "its root partition, or fsck -y in single-user mode) before "
+                           "booting it or running this again") from e
+
+
+def batch_script(p: Plan) -> str:
+    """The one shell script run in the guest after the tar is extracted."""
+    lines = ["#!/bin/sh", "set -e"]
+    if p.packages:
+        lines.append("pkg -N >/dev/null 2>&1 || env ASSUME_ALWAYS_YES=yes pkg bootstrap")
+        lines.append("pkg install -y " + " ".join(p.packages))
+    if p.sysrc:
+        lines.append("sysrc " + " ".join(f'{k}="{v}"' for k, v in p.sysrc.items()))
+    if p.rc_local:
+        # rc.local was not readable on the host: merge the block in place.
+        quoted = ["'" + h.replace("'", "'\\''") + "'" for h in p.rc_local]
+        lines.append(f"touch {RC_LOCAL}")
+        lines.append(f"sed -i '' '/^{RC_LOCAL_BEGIN}$/,/^{RC_LOCAL_END}$/d' {RC_LOCAL}")
+        lines.append("grep -vxF " + " ".join(f"-e {q}" for q in quoted)
+                     + f" {RC_LOCAL} > {RC_LOCAL}.new || true")
+        lines.append(f"mv {RC_LOCAL}.new {RC_LOCAL}")
+        for q in [f"'{RC_LOCAL_BEGIN}'"] + quoted + [f"'{RC_LOCAL_END}'"]:
+            lines.append(f"printf '%s\\n' {q} >> {RC_LOCAL}")
+        lines.append(f"chmod 755 {RC_LOCAL}")
+    lines.append(f"rm -f {SCRIPT_PATH}")
+    return "\n".join(lines) + "\n"
+
+
+def extract_command(tgz: str) -> str:
+    """Unpack a build_tar() archive in the guest and remove it.
+
+    -P lets bsdtar extract through symlinked directories such as /home,
+    which it otherwise refuses; the archive only holds relative names.
+    """
+    return f"tar -xpPzf {tgz} -C / && rm -f {tgz}"
+
+
+def build_tar(p: Plan) -> bytes:
+    """gzip'd tar of the plan's files plus the batch script, for extract_command()."""
+    buf = io.BytesIO()
+    now = int(time.time())
+    entries = list(p.files) + [Entry(SCRIPT_PATH, batch_script(p).encode(), 0o755, "root:wheel")]
+    with tarfile.open(fileobj=buf, mode="w:gz", format=tarfile.PAX_FORMAT) as tar:
+        for e in entries:
+            info = tarfile.TarInfo(e.path.lstrip("/"))
+            user, _, group = e.owner.partition(":")
+            # bsdtar -p restores owners by name, falling back to the ids.
+            info.uname, info.gname = user, group or user
+            info.mode, info.mtime = e.mode, now
+            if e.is_dir:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(e.data)
+                tar.addfile(info, io.BytesIO(e.data))
+    return buf.getvalue()
@@ -0,0 +1,185 @@
+"""Build profiler: Chrome trace events for every stage and driver operation.
+
+Tracing is on when WEBBSD_TRACE names a file.  Every process of the build
+appends one JSON trace event per line to it (O_APPEND, so concurrent
+writers do not interleave), tagged with the build stage it runs under
+(WEBBSD_STAGE, set by the build cache).  scripts/profile-report.py turns
+the file into a Chrome trace (load it in chrome://tracing or https://ui.perfetto.dev)
+and a per-stage summary table.
+
+Spans are complete ("X") events with microsecond timestamps from the
+wall clock, so events from different processes line up.  Each asyncio task
+gets its own thread row, so concurrent spans do not overlap on one track.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from . import IMAGES_DIR
+
+DEFAULT_TRACE = os.path.join(IMAGES_DIR, "logs", "build-trace.jsonl")
+TRACE_ENV = "WEBBSD_TRACE"
+STAGE_ENV = "WEBBSD_STAGE"
+
+_named = set()
+# Task rows start above thread rows (thread ident % 100000).
+_TASK_TID = 100000
+_next_task_tid = itertools.count(_TASK_TID + 1)
+_task_tids: "weakref.WeakKeyDictionary[asyncio.Task, int]" = weakref.WeakKeyDictionary()
+
+
+def enabled() -> bool:
+    return bool(os.environ.get(TRACE_ENV))
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def _emit(event: dict) -> None:
+    path = os.environ[TRACE_ENV]
+    line = (json.dumps(event, separators=(",", ":")) + "\n").encode()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def _base(name: str, cat: str) -> dict:
+    pid = os.getpid()
+    if pid not in _named:
+        _named.add(pid)
+        label = os.environ.get(STAGE_ENV) or "build"
+        _emit({"ph": "M", "name": "process_name", "pid": pid, "tid": 0,
+               "args": {"name": f"{label} ({os.path.basename(sys.argv[0])})"}})
+    return {"name": name, "cat": cat, "pid": pid, "tid": _tid(pid)}
+
+
+def _tid(pid: int) -> int:
+    """The current asyncio task's row, else the current thread's."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is None:
+        return threading.get_ident() % 100000
+    tid = _task_tids.get(task)
+    if tid is None:
+        tid = _task_tids[task] = next(_next_task_tid)
+        _emit({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid,
+               "args": {"name": task.get_name()}})
+    return tid
+
+
+def record(name: str, cat: str, start_us: int, end_us: int, **args) -> None:
+    """Record a span measured elsewhere (wall-clock microseconds)."""
+    if not enabled():
+        return
+    event = _base(name, cat)
+    event.update(ph="X", ts=start_us, dur=max(end_us - start_us, 0))
+    stage = os.environ.get(STAGE_ENV)
+    event["args"] = dict(args, stage=stage) if stage else dict(args)
+    _emit(event)
+
+
+@contextlib.contextmanager
+def span(name: str, cat: str, **args):
+    """Time the body as one span; usable around awaits in async code too.
+
+    Yields a dict the body can add args to (e.g. an exit status).
+    """
+    if not enabled():
+        yield {}
+        return
+    extra = {}
+    start = _now_us()
+    try:
+        yield extra
+    except BaseException as e:
+        extra.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        record(name, cat, start, _now_us(), **args, **extra)
+
+
+def reset(path: Optional[str] = None) -> None:
+    """Truncate the trace file (the start of a build)."""
+    path = path or os.environ.get(TRACE_ENV)
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        open(path, "w").close()
+
+
+def load(path: str) -> List[dict]:
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    pass
+    return events
+
+
+def write_chrome_trace(events: List[dict], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def summary(events: List[dict], top: int = 5) -> str:
+    """Per-stage table: wall time, time per category, slowest operations."""
+    stages: Dict[str, dict] = {}
+    cats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    slowest: Dict[str, List[dict]] = defaultdict(list)
+    for e in events:
+        if e.get("ph") != "X":
+            continue
+        if e.get("cat") == "stage":
+            stages[e["name"]] = e
+            continue
+        stage = e.get("args", {}).get("stage", "-")
+        cats[stage][e["cat"]] += e["dur"] / 1e6
+        counts[stage][e["cat"]] += 1
+        slowest[stage].append(e)
+
+    order = sorted(stages.values(), key=lambda e: e["ts"])
+    names = [e["name"] for e in order] + sorted(set(cats) - set(stages))
+    all_cats = sorted({c for s in cats.values() for c in s})
+    lines = []
+    header = f"{'stage':<16} {'wall':>9} " + " ".join(f"{c:>14}" for c in all_cats)
+    lines.append(header)
+    lines.append("-" * len(header))
+    total = 0.0
+    for name in names:
+        st = stages.get(name)
+        wall = st["dur"] / 1e6 if st else 0.0
+        total += wall
+        tag = " (cached)" if st and st.get("args", {}).get("cached") else ""
+        cells = " ".join(f"{cats[name].get(c, 0):>9.1f}s/{counts[name].get(c, 0):<3}"
+                         for c in all_cats)
+        lines.append(f"{(name + tag)[:16]:<16} {wall:>8.1f}s {cells}")
+    lines.append("-" * len(header))
+    lines.append(f"{'total':<16} {total:>8.1f}s")
+    lines.append("")
+    lines.append("(category columns: seconds/count; nested spans are counted in each category)")
+    for name in names:
+        ops = sorted(slowest[name], key=lambda e: -e["dur"])[:top]
+        if not ops:
+            continue
+        lines.append(f"\nSlowest in {name}:")
+        for e in ops:
+            lines.append(f"  {e['dur'] / 1e6:9.1f}s  {e['cat']:<9} {e['name'][:90]}")
+    return "\n".join(lines)
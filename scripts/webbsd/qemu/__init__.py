@@ -0,0 +1,38 @@
+"""Asyncio QEMU driver for the FreeBSD build VM.
+
+Typical use::
+
+    import asyncio
+    from webbsd.qemu import QEMU
+
+    async def main():
+        async with QEMU(overlay=True) as vm:
+            await vm.login()
+            print((await vm.run("uname -a")).output)
+            await vm.shutdown()
+            await vm.commit()
+
+    asyncio.run(main())
+
+Independent jobs run concurrently through ``VMPool`` (see pool.py); with
+WEBBSD_HOT=1 overlay VMs resume from a saved root shell (see hot.py), and
+pkg_cache=True VMs keep fetched packages on a shared disk (see pkgcache.py).
+Once the image has the guest agent (see agent.py), commands and transfers
+bypass the serial console.
+"""
+
+from .agent import Agent, StatResult
+from .driver import QEMU, live_pids
+from .errors import AgentError, CommandError, QEMUError, QMPError
+from .hot import HotSnapshot
+from .matcher import Match, Matcher
+from .overlay import Overlay
+from .pkgcache import PkgCache
+from .pool import JobResult, VMPool
+from .qmp import QMP
+from .screen import Screen
+from .shell import CommandResult, Shell
+
+__all__ = ["QEMU", "QEMUError", "Agent", "AgentError", "CommandError", "CommandResult",
+           "HotSnapshot", "JobResult", "Match", "Matcher", "Overlay", "PkgCache", "QMP",
+           "QMPError", "Screen", "Shell", "StatResult", "VMPool", "live_pids"]
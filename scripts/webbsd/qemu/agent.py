@@ -0,0 +1,237 @@
+"""Host side of the guest provisioning agent (scripts/guest/webbsd-agent.c).
+
+The serial console is shared with getty, kernel messages and dhclient,
+echoes everything typed into it and only carries text.  The agent has a
+virtio-serial port of its own (org.webbsd.agent, a UNIX socket on the
+host) and speaks length-prefixed binary frames: exec with exit status and
+separate stdout and stderr, put, get and stat of files, and a batch of
+any of these in one round trip.  Every request carries an id and any
+number of them may be in flight; responses are matched to them by id, so
+independent operations are pipelined instead of waiting on a prompt.
+
+fix-image.py builds the agent in the guest and enables it in rc.d
+(``install``).  The driver pings it after ``login()`` and, when it
+answers, runs commands and file transfers through it; without it
+everything goes over the console as before.
+"""
+
+import asyncio
+import codecs
+import errno
+import os
+import struct
+import time
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from .. import BASE, profile
+from .errors import AgentError, CommandError, QEMUError
+from .shell import CommandResult
+from .transfer import put_path
+
+PORT_NAME = "org.webbsd.agent"
+SOURCE_DIR = os.path.join(BASE, "scripts", "guest")
+BINARY = "/usr/local/sbin/webbsd-agent"
+RC_SCRIPT = "/usr/local/etc/rc.d/webbsd_agent"
+
+PING, EXEC, PUT, GET, STAT, BATCH, DATA = range(7)
+_OPS = {"exec": EXEC, "put": PUT, "get": GET, "stat": STAT}
+
+
+class StatResult(NamedTuple):
+    mode: int
+    size: int
+    mtime: int
+
+
+def device_args(socket_path: str) -> List[str]:
+    """QEMU arguments for the agent's virtio-serial port on a UNIX socket."""
+    return ["-device", "virtio-serial-pci,id=wbvs",
+            "-chardev", f"socket,id=wbagent,path={socket_path},server=on,wait=off",
+            "-device", f"virtserialport,bus=wbvs.0,chardev=wbagent,name={PORT_NAME}"]
+
+
+def _exec_body(cmd: str, env: Optional[Mapping[str, str]]) -> bytes:
+    block = b"".join(f"{k}={v}".encode() + b"\0" for k, v in (env or {}).items())
+    return block + b"\0" + cmd.encode()
+
+
+def _put_body(path: str, data: bytes, mode: Optional[int]) -> bytes:
+    p = path.encode()
+    return struct.pack(">IH", mode or 0, len(p)) + p + data
+
+
+def _encode(op: Tuple) -> Tuple[int, bytes]:
+    kind, args = op[0], op[1:]
+    if kind == "exec":
+        return EXEC, _exec_body(args[0], args[1] if len(args) > 1 else None)
+    if kind == "put":
+        return PUT, _put_body(args[0], args[1], args[2] if len(args) > 2 else None)
+    if kind in ("get", "stat"):
+        return _OPS[kind], args[0].encode()
+    raise ValueError(f"unknown agent op {kind!r}")
+
+
+def _decode(op: Tuple, status: int, body: bytes, elapsed: float = 0.0):
+    kind, path = op[0], op[1]
+    if kind == "exec":
+        (n,) = struct.unpack(">I", body[:4])
+        out, err = body[4:4 + n], body[4 + n:]
+        return CommandResult(path, out.decode(errors="replace"), err.decode(errors="replace"),
+                             status, elapsed)
+    if kind == "stat" and status == errno.ENOENT:
+        return None
+    if status:
+        raise AgentError(kind, path, status, body.decode(errors="replace"))
+    if kind == "stat":
+        return StatResult(*struct.unpack(">IQq", body[:20]))
+    return body if kind == "get" else None
+
+
+class Agent:
+    """A connection to the agent; requests may be issued concurrently."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.version = None
+        self.closed = False
+        self._next = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._streams: Dict[int, Callable[[int, bytes], None]] = {}
+        self._task = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def connect(cls, socket_path: str) -> "Agent":
+        return cls(*await asyncio.open_unix_connection(socket_path))
+
+    async def _read(self):
+        try:
+            while True:
+                (n,) = struct.unpack(">I", await self.reader.readexactly(4))
+                frame = await self.reader.readexactly(n)
+                rid, op = struct.unpack(">IB", frame[:5])
+                if op == DATA:
+                    fn = self._streams.get(rid)
+                    if fn is not None:
+                        fn(frame[5], frame[6:])
+                    continue
+                fut = self._pending.pop(rid, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(frame[5:])
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            self.closed = True
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(QEMUError("agent connection closed"))
+            self._pending.clear()
+
+    async def request(self, op: int, body: bytes, timeout: float = 60,
+                      stream: Optional[Callable[[int, bytes], None]] = None) -> Tuple[int, bytes]:
+        """Send one request; returns its status and the rest of the response."""
+        if self.closed:
+            raise QEMUError("agent connection closed")
+        self._next = (self._next + 1) & 0xFFFFFFFF
+        rid = self._next
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[rid] = fut
+        if stream is not None:
+            self._streams[rid] = stream
+        try:
+            self.writer.write(struct.pack(">IIB", len(body) + 5, rid, op) + body)
+            await self.writer.drain()
+            reply = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            raise QEMUError(f"agent: no answer in {timeout}s") from None
+        finally:
+            self._pending.pop(rid, None)
+            self._streams.pop(rid, None)
+        return struct.unpack(">i", reply[:4])[0], reply[4:]
+
+    async def ping(self, timeout: float = 2) -> str:
+        _, body = await self.request(PING, b"", timeout)
+        self.version = body.decode(errors="replace")
+        return self.version
+
+    async def run(self, cmd: str, timeout: float = 60, check: bool = False,
+                  env: Optional[Mapping[str, str]] = None,
+                  on_output: Optional[Callable[[str], None]] = None) -> CommandResult:
+        """Run cmd with /bin/sh -c; stdout is streamed to on_output."""
+        decoders = {1: codecs.getincrementaldecoder("utf-8")(errors="replace"),
+                    2: codecs.getincrementaldecoder("utf-8")(errors="replace")}
+        parts: Dict[int, List[str]] = {1: [], 2: []}
+
+        def stream(fd, data):
+            text = decoders[fd].decode(data)
+            parts[fd].append(text)
+            if fd == 1 and on_output is not None and text:
+                on_output(text)
+
+        with profile.span(cmd.split("\n", 1)[0][:200], "command", agent=True) as span:
+            began = time.monotonic()
+            status, _ = await self.request(EXEC, _exec_body(cmd, env), timeout, stream)
+            for fd, dec in decoders.items():
+                parts[fd].append(dec.decode(b"", final=True))
+            result = CommandResult(cmd, "".join(parts[1]), "".join(parts[2]), status,
+                                   time.monotonic() - began)
+            span["status"] = status
+        if check and not result.ok:
+            raise CommandError(result)
+        return result
+
+    async def put(self, path: str, data: bytes, mode: Optional[int] = None,
+                  timeout: float = 300) -> None:
+        """Write data to path atomically (via path.wbpart); mode e.g. 0o755."""
+        op = ("put", path, data, mode)
+        _decode(op, *await self.request(PUT, _put_body(path, data, mode), timeout))
+
+    async def get(self, path: str, timeout: float = 300) -> bytes:
+        return _decode(("get", path), *await self.request(GET, path.encode(), timeout))
+
+    async def stat(self, path: str, timeout: float = 30) -> Optional[StatResult]:
+        """mode, size and mtime of path, or None if it does not exist."""
+        return _decode(("stat", path), *await self.request(STAT, path.encode(), timeout))
+
+    async def batch(self, ops: Sequence[Tuple], timeout: float = 300) -> list:
+        """Run several ops in one round trip, in order.
+
+        Each op is ("exec", cmd[, env]), ("put", path, data[, mode]),
+        ("get", path) or ("stat", path); the results are what run() (without
+        streaming), put(), get() and stat() return.  A failed put or get
+        raises AgentError after the whole batch has run.
+        """
+        body = bytearray()
+        for op in ops:
+            code, sub = _encode(op)
+            body += struct.pack(">IB", len(sub) + 1, code) + sub
+        began = time.monotonic()
+        with profile.span(f"batch of {len(ops)}", "command", agent=True):
+            _, reply = await self.request(BATCH, bytes(body), timeout)
+        elapsed = time.monotonic() - began
+        results, off = [], 0
+        for op in ops:
+            (n,) = struct.unpack(">I", reply[off:off + 4])
+            sub = reply[off + 5:off + 4 + n]
+            off += 4 + n
+            (status,) = struct.unpack(">i", sub[:4])
+            results.append(_decode(op, status, sub[4:], elapsed))
+        return results
+
+    def close(self) -> None:
+        self._task.cancel()
+        self.writer.close()
+
+
+async def install(vm) -> None:
+    """Build the agent in the guest and enable it at boot.
+
+    Needs a writable /usr/local and the base system compiler.
+    """
+    with profile.span("install agent", "install"):
+        await put_path(vm, os.path.join(SOURCE_DIR, "webbsd-agent.c"), "/tmp/webbsd-agent.c")
+        await vm.run(f"mkdir -p {os.path.dirname(BINARY)} {os.path.dirname(RC_SCRIPT)} && "
+                     f"cc -O2 -o {BINARY} /tmp/webbsd-agent.c && rm -f /tmp/webbsd-agent.c",
+                     timeout=600, check=True)
+        await put_path(vm, os.path.join(SOURCE_DIR, "webbsd_agent"), RC_SCRIPT, mode="555")
+        await vm.run("sysrc webbsd_agent_enable=YES", check=True)
@@ -0,0 +1,44 @@
+"""Read-only guest checks, as used by the debug-*.py scripts.
+
+A check is a list of (title, command) pairs run in one logged-in shell.
+The VM boots on an overlay and is never shut down cleanly, so a check
+leaves the image untouched and any number can run at once (see
+run-parallel.py).
+"""
+
+import asyncio
+from typing import Awaitable, Callable, List, Tuple
+
+from .driver import QEMU
+from .errors import QEMUError
+
+
+async def run_checks(vm, checks: List[Tuple[str, str]], quiesce: bool = False,
+                     timeout: float = 60) -> str:
+    """Log in, run every command and return the titled report."""
+    await vm.login()
+    if quiesce:
+        await vm.quiesce()
+    parts = []
+    for title, cmd in checks:
+        result = await vm.run(cmd, timeout)
+        part = f"=== {title} === (exit {result.status}, {result.elapsed:.1f}s)\n{result.stdout.rstrip()}"
+        if result.stderr.strip():
+            part += f"\n--- stderr ---\n{result.stderr.rstrip()}"
+        parts.append(part)
+    return "\n\n".join(parts) + "\n"
+
+
+def main(check: Callable[[QEMU], Awaitable[str]], **qemu_args) -> int:
+    """Run one check standalone and print its report."""
+    async def one():
+        async with QEMU(overlay=True, echo=False, **qemu_args) as vm:
+            print("Waiting for boot...")
+            print(await check(vm))
+
+    try:
+        asyncio.run(one())
+    except QEMUError as e:
+        print(f"ERROR: {e}")
+        return 1
+    return 0
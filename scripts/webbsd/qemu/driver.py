@@ -0,0 +1,528 @@
+"""Event-driven QEMU serial/QMP driver.
+
+The standalone scripts poll the serial socket with a 1 s recv timeout and
+sleep 0.3 s between pattern checks.  Here one reader task feeds serial
+output to an incremental matcher (see matcher.py) as it arrives, so
+``wait_for`` returns as soon as the pattern shows up instead of on the next
+poll tick, and only a bounded tail of the output is kept in memory.
+
+Serial, QMP (see qmp.py) and the guest agent's port (see agent.py) are
+UNIX sockets in a private temporary directory unless ports are given, so
+any number of VMs can run side by side.  Every QEMU the driver starts is
+remembered and killed at interpreter exit if it is still running; nothing
+else on the machine is touched.
+"""
+
+import asyncio
+import atexit
+import os
+import shlex
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Pattern, Sequence, Union
+
+from .. import IMAGE, profile
+from . import agent as _agent
+from .agent import Agent
+from .errors import QEMUError
+from .hot import HotSnapshot
+from .matcher import Match, Matcher
+from .overlay import Overlay, drive_options
+from .pkgcache import PkgCache
+from .qmp import QMP
+from .screen import Screen, ScreenReader
+from .shell import CommandResult, Shell
+
+# PIDs of QEMU processes started by this interpreter and not yet reaped.
+_LIVE = set()
+
+
+@atexit.register
+def _kill_live():
+    for pid in list(_LIVE):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    _LIVE.clear()
+
+
+def live_pids() -> List[int]:
+    """PIDs of the QEMU processes this interpreter is still running."""
+    return sorted(_LIVE)
+
+
+class QEMU:
+    """A qemu-system-i386 process driven over its serial console and QMP.
+
+    Use as an async context manager, or call ``start()`` and ``close()``.
+
+    With overlay=True the guest writes to a qcow2 layer over the image
+    (cache=writeback), and the image itself only changes on ``commit()``
+    after a clean ``shutdown()``.  Leaving the context without committing
+    discards the layer.
+
+    With hot=True (the default for overlay VMs when WEBBSD_HOT=1) the VM
+    is restored from a hot snapshot (see hot.py) already logged in as root
+    in /bin/sh and quiesced, instead of booting; ``login()`` returns at once.
+    Scripts that drive the boot loader pass hot=False.  ``commit()`` of a
+    hot VM is refused while other hot VMs run on the same image, and
+    drops the snapshot, which no longer matches the image.
+
+    With pkg_cache=True the persistent pkg cache (see pkgcache.py) is a
+    second drive, mounted on /var/cache/pkg after ``login()`` and saved
+    and unmounted by ``shutdown()``.
+
+    Every VM has the guest agent's virtio-serial port (agent=False drops
+    it).  When the agent answers after ``login()``, ``run()`` and file
+    transfers go through it instead of the console; ``setenv()`` sets a
+    variable for every later command either way.
+    """
+
+    def __init__(self, image: str = IMAGE, memory: int = 512,
+                 serial_port: Optional[int] = None, monitor_port: Optional[int] = None,
+                 drive: str = "format=raw", net: Optional[Sequence[str]] = None,
+                 extra_args: Sequence[str] = (), echo: bool = True,
+                 overlay: bool = False, hot: Optional[bool] = None,
+                 serial_log: Optional[str] = None, pkg_cache: bool = False,
+                 agent: bool = True):
+        self.image = image
+        self.memory = memory
+        self.serial_port = serial_port
+        self.monitor_port = monitor_port
+        self.drive = drive
+        self.net = list(net) if net is not None else ["-net", "none"]
+        self.extra_args = list(extra_args)
+        self.echo = echo
+        self.serial_log = serial_log
+        self.use_agent = agent
+        self.pkg_cache = PkgCache() if pkg_cache else None
+        if self.pkg_cache:
+            self.extra_args += self.pkg_cache.drive_args()
+        if hot is None:
+            hot = overlay and os.environ.get("WEBBSD_HOT") == "1"
+        # A restored guest must never write to the image directly.
+        self.hot = HotSnapshot(self) if hot else None
+        if self.hot:
+            self.overlay = Overlay(self.hot.disk, base_format="qcow2", commit_to=image)
+        else:
+            self.overlay = Overlay(image) if overlay else None
+        self.sockdir = None
+
+        self.proc = None
+        self.serial = Matcher()
+        # Stream offset that the next wait_for starts matching from, so a
+        # pattern that already matched once is never matched again.
+        self.cursor = 0
+        self._listeners = []
+        self._log = None
+        self._ser_r = self._ser_w = None
+        self.qmp = None
+        self._screen = None
+        self._eof = False
+        self._reader = None
+        self._seq = 0
+        self._powered_off = False
+        self.shell = None
+        self.agent: Optional[Agent] = None
+        self.env: Dict[str, str] = {}
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.proc.pid if self.proc is not None else None
+
+    @property
+    def received(self) -> int:
+        """Serial bytes received so far."""
+        return self.serial.end
+
+    def tail(self, n: int = 500) -> str:
+        """The last n bytes of serial output, decoded."""
+        return self.serial.ring.tail(n).decode(errors="replace")
+
+    def add_listener(self, fn: Callable[[bytes], None]) -> None:
+        """Call fn with every chunk of serial output, and b"" at EOF."""
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn: Callable[[bytes], None]) -> None:
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def _socket(self, name: str) -> str:
+        return os.path.join(self.sockdir, name)
+
+    def _chardev(self, name: str, port: Optional[int]) -> str:
+        if port is None:
+            return f"unix:{self._socket(name)},server=on,wait=off"
+        return f"tcp:127.0.0.1:{port},server=on,wait=off"
+
+    def argv(self) -> List[str]:
+        """Full qemu-system-i386 command line."""
+        drive = f"file={self.image},{self.drive}"
+        if self.overlay:
+            drive = ",".join([f"file={self.overlay.path}", "format=qcow2", "cache=writeback",
+                              *drive_options(self.drive)])
+        incoming = ["-incoming", self.hot.incoming()] if self.hot else []
+        return [
+            "qemu-system-i386", "-m", str(self.memory),
+            "-drive", drive,
+            "-display", "none",
+            "-serial", self._chardev("serial", self.serial_port),
+            "-qmp", self._chardev("qmp", self.monitor_port),
+            *self.net,
+            *self.extra_args,
+            *(_agent.device_args(self._socket("agent")) if self.use_agent else []),
+            *incoming,
+            "-no-reboot",
+        ]
+
+    async def start(self, connect_timeout: float = 10.0) -> "QEMU":
+        with profile.span("start", "qemu", image=os.path.basename(self.image),
+                          hot=bool(self.hot)):
+            return await self._start(connect_timeout)
+
+    async def _start(self, connect_timeout):
+        if self.serial_log:
+            self._log = open(self.serial_log, "wb")
+        if self.pkg_cache:
+            await self.pkg_cache.acquire()
+        if self.hot:
+            self.hot.use()
+            await self.hot.ensure()
+        if self.overlay:
+            await self.overlay.create()
+        if self.serial_port is None or self.monitor_port is None or self.use_agent:
+            self.sockdir = tempfile.mkdtemp(prefix="webbsd-qemu-")
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.argv(), stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL)
+        _LIVE.add(self.proc.pid)
+        self._ser_r, self._ser_w = await self._connect("serial", self.serial_port, connect_timeout)
+        self.qmp = await QMP(*await self._connect("qmp", self.monitor_port, connect_timeout)).negotiate()
+        self._reader = asyncio.ensure_future(self._read_serial())
+        return self
+
+    async def _connect(self, name, port, timeout):
+        """Connect to one of QEMU's listening sockets as soon as it is up."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                if port is None:
+                    return await asyncio.open_unix_connection(self._socket(name))
+                return await asyncio.open_connection("127.0.0.1", port)
+            except OSError:
+                if self.proc.returncode is not None:
+                    raise QEMUError(f"QEMU exited with status {self.proc.returncode}")
+                if loop.time() >= deadline:
+                    raise QEMUError(f"QEMU did not open its {name} socket")
+                await asyncio.sleep(0.05)
+
+    async def _read_serial(self):
+        while True:
+            data = await self._ser_r.read(65536)
+            if not data:
+                break
+            if self.echo:
+                sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+            if self._log is not None:
+                self._log.write(data)
+            self.serial.feed(data)
+            for fn in list(self._listeners):
+                fn(data)
+        self._eof = True
+        self.serial.close()
+        for fn in list(self._listeners):
+            fn(b"")
+
+    async def expect(self, patterns: Sequence[Union[str, bytes, Pattern]],
+                     timeout: float = 300, start: Optional[int] = None) -> Optional[Match]:
+        """Wait for the first of patterns after start (default: the cursor).
+
+        Strings and bytes are literals; compiled regular expressions are
+        searched too.  Returns the Match and moves the cursor past it, or
+        None on timeout or EOF.
+        """
+        fut = asyncio.get_running_loop().create_future()
+
+        def done(match):
+            if not fut.done():
+                fut.set_result(match)
+
+        watch = self.serial.watch(patterns, self.cursor if start is None else start, done)
+        try:
+            match = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self.serial.cancel(watch)
+            return None
+        if match is not None:
+            self.cursor = match.end
+        return match
+
+    async def wait_for(self, pattern: Union[str, bytes, Pattern], timeout: float = 300) -> bool:
+        """Wait until pattern appears in serial output after the cursor."""
+        return await self.expect([pattern], timeout) is not None
+
+    async def send(self, text: Union[str, bytes]) -> None:
+        """Write raw text to the serial console."""
+        self._ser_w.write(text.encode() if isinstance(text, str) else text)
+        await self._ser_w.drain()
+
+    async def run(self, cmd: str, timeout: float = 60, check: bool = False,
+                  on_output: Optional[Callable[[str], None]] = None) -> CommandResult:
+        """Run a shell command and return once the guest prompt is back.
+
+        The first call installs the prompt-synchronized Shell; with
+        check=True a non-zero exit status raises CommandError.  on_output
+        receives stdout incrementally as it arrives.
+
+        With the guest agent up the command runs there instead, as
+        ``sh -c`` in /root with the variables from ``setenv()``.
+        """
+        if self.agent is not None:
+            return await self.agent.run(cmd, timeout, check, self.env, on_output)
+        if self.shell is None:
+            self.shell = await Shell(self).setup()
+        return await self.shell.run(cmd, timeout, check, on_output)
+
+    async def setenv(self, name: str, value: str) -> None:
+        """Set an environment variable for every later ``run()``."""
+        self.env[name] = value
+        if self.shell is not None:
+            await self.shell.run(f"export {name}={shlex.quote(value)}", check=True)
+
+    async def _run_marker(self, cmd: str, timeout: float) -> None:
+        """Run cmd and wait for a marker echoed after it.
+
+        Works in any shell (csh included) before the prompt is set up.  The
+        marker is split by quotes on the command line, so the tty's echo of
+        what we typed can never match it; only the real output does.
+        """
+        self._seq += 1
+        marker = f"__WB_DONE_{self._seq}__"
+        quoted = f"'{marker[:5]}''{marker[5:]}'"
+        self.cursor = self.received
+        await self.send(f"{cmd}; echo {quoted}\n")
+        if not await self.wait_for(marker, timeout):
+            raise QEMUError(f"timeout ({timeout}s) waiting for: {cmd[:80]}")
+
+    async def monitor(self, cmd: str) -> str:
+        """Run an HMP monitor command (through QMP) and return its text."""
+        return (await self.qmp.hmp(cmd)).replace("\r", "")
+
+    async def type_text(self, text: str) -> None:
+        """Type text on the VGA console's keyboard, e.g. at the loader prompt."""
+        await self.qmp.type_text(text)
+
+    async def send_key(self, *keys: str) -> None:
+        """Press and release one chord, e.g. send_key("ctrl", "alt", "f2")."""
+        await self.qmp.send_keys(tuple(keys))
+
+    async def screen(self) -> Screen:
+        """The VGA text screen as it is now (see screen.py)."""
+        if self._screen is None:
+            self._screen = ScreenReader(self)
+        return await self._screen.read()
+
+    async def wait_for_screen(self, pattern: Union[str, Pattern],
+                              timeout: float = 60) -> Optional[Screen]:
+        """Wait until pattern is on the VGA text screen; None on timeout."""
+        if self._screen is None:
+            self._screen = ScreenReader(self)
+        return await self._screen.wait_for(pattern, timeout)
+
+    async def login(self, user: str = "root", shell: str = "/bin/sh",
+                    timeout: float = 300) -> None:
+        """Wait for the getty, log in on the serial console and exec shell.
+
+        root's login shell is csh; every script speaks sh, so by default
+        the session is switched to /bin/sh straight away.  A VM restored
+        from a hot snapshot is already there; its clock is only reset to
+        the host's, since it stood still while the snapshot was on disk.
+        """
+        with profile.span("login", "boot", hot=bool(self.hot)):
+            await self._login(user, shell, timeout)
+        await self.attach_agent()
+        if self.pkg_cache:
+            await self.pkg_cache.attach(self)
+
+    async def _login(self, user, shell, timeout):
+        if self.hot:
+            await self._probe()
+            self.shell = await Shell(self).setup()
+            stamp = time.strftime("%Y%m%d%H%M.%S", time.gmtime())
+            await self.run(f"date -u {stamp} >/dev/null", timeout=30)
+            return
+        if not await self.wait_for("login:", timeout):
+            raise QEMUError("no login prompt")
+        await self.send(user + "\n")
+        await self._probe()
+        if shell:
+            await self.send(f"exec {shell}\n")
+            await self._probe()
+        self.shell = await Shell(self).setup()
+
+    async def attach_agent(self, timeout: float = 2) -> None:
+        """Switch run() to the guest agent if it answers on its port."""
+        if not self.use_agent or self.agent is not None:
+            return
+        # Images without the agent have no port device: skip the ping wait.
+        if not (await self.run(f"test -e /dev/vtcon/{_agent.PORT_NAME}")).ok:
+            return
+        try:
+            agent = await Agent.connect(self._socket("agent"))
+        except OSError:
+            return
+        try:
+            version = await agent.ping(timeout)
+        except QEMUError:
+            agent.close()
+            return
+        print(f"Guest agent: {version}")
+        self.agent = agent
+
+    async def single_user(self, timeout: float = 300) -> None:
+        """Take over the shell of a ``boot -s`` boot and set up the Shell.
+
+        The root filesystem is still read-only at this point; run fsck and
+        ``mount -u -o rw /`` before writing anything.
+        """
+        with profile.span("single-user", "boot"):
+            match = await self.expect(["Enter full pathname of shell", "# "], timeout)
+        if match is None:
+            raise QEMUError("no single-user shell")
+        if match.index == 0:
+            await self.send("\n")
+        await self._probe()
+        self.shell = await Shell(self).setup()
+
+    async def _probe(self, timeout: float = 60) -> None:
+        """Run ``true`` until the shell answers, whatever shell it is.
+
+        login(1) may discard type-ahead, so a single command sent right
+        after the user name can be lost.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                await self._run_marker("true", timeout=3)
+                return
+            except QEMUError:
+                if self._eof or loop.time() >= deadline:
+                    raise QEMUError("shell is not responding")
+
+    async def quiesce(self) -> None:
+        """Stop cron and dhclient so they stop writing to the console."""
+        await self.run("service cron stop >/dev/null 2>&1; "
+                       "pkill -9 dhclient 2>/dev/null; true", timeout=30)
+
+    async def shutdown(self, cmd: str = "/sbin/shutdown -p now",
+                       timeout: float = 120) -> None:
+        """Sync and power off the guest, then wait for QEMU to exit."""
+        with profile.span("shutdown", "shutdown") as span:
+            await self._shutdown(cmd, timeout)
+            span["clean"] = self._powered_off
+
+    async def _shutdown(self, cmd, timeout):
+        if not self._eof:
+            try:
+                if self.pkg_cache and self.pkg_cache.attached:
+                    await self.pkg_cache.detach(self)
+                await self.run("sync", timeout=60)
+                await self.send(cmd + "\n")
+            except QEMUError:
+                pass
+        try:
+            await asyncio.wait_for(self.proc.wait(), timeout)
+            self._powered_off = True
+        except asyncio.TimeoutError:
+            pass
+        await self.close()
+
+    async def commit(self) -> None:
+        """Fold the overlay into the image; only after a clean shutdown()."""
+        if self.overlay is None:
+            return
+        if not self._powered_off:
+            raise QEMUError("guest was not shut down cleanly; overlay not committed")
+        try:
+            if self.hot:
+                self.hot.claim_image()
+            print(f"Committing overlay into {self.image}")
+            with profile.span("commit", "disk", image=os.path.basename(self.image)):
+                await self.overlay.commit()
+            if self.hot:
+                await self.hot.drop()
+        finally:
+            if self.hot:
+                self.hot.release()
+
+    async def discard(self) -> None:
+        """Stop QEMU if needed and throw the overlay's changes away."""
+        await self.close()
+        if self.overlay is not None:
+            self.overlay.discard()
+        if self.hot:
+            self.hot.release()
+
+    async def close(self) -> None:
+        """Quit QEMU (if still running) and close the sockets."""
+        if self.proc is not None and self.proc.returncode is None:
+            if self.qmp is not None:
+                try:
+                    await asyncio.wait_for(self.qmp.quit(), 5)
+                except (asyncio.TimeoutError, QEMUError, OSError):
+                    pass
+            try:
+                await asyncio.wait_for(self.proc.wait(), 10)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+                await self.proc.wait()
+        if self.proc is not None:
+            _LIVE.discard(self.proc.pid)
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._ser_w is not None:
+            self._ser_w.close()
+        if self.qmp is not None:
+            self.qmp.close()
+        if self.agent is not None:
+            self.agent.close()
+            self.agent = None
+        if self._screen is not None:
+            self._screen.close()
+            self._screen = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if self.sockdir is not None:
+            shutil.rmtree(self.sockdir, ignore_errors=True)
+            self.sockdir = None
+        if self.pkg_cache:
+            self.pkg_cache.release()
+        # After a clean shutdown the image lock is kept for commit().
+        if self.hot and not (self._powered_off and self.overlay.exists):
+            self.hot.release()
+
+    async def __aenter__(self):
+        try:
+            return await self.start()
+        except BaseException:
+            await self.close()
+            if self.overlay is not None:
+                self.overlay.discard()
+            raise
+
+    async def __aexit__(self, exc_type, *exc):
+        await self.close()
+        if self.overlay is not None and self.overlay.exists:
+            if exc_type is None:
+                print(f"Overlay not committed; discarding changes to {self.image}")
+            self.overlay.discard()
+        if self.hot:
+            self.hot.release()
@@ -0,0 +1,34 @@
+"""Exceptions raised by the QEMU driver."""
+
+
+class QEMUError(Exception):
+    """QEMU exited, refused a connection, or the guest stopped responding."""
+
+
+class CommandError(QEMUError):
+    """A guest command run with ``check=True`` exited non-zero."""
+
+    def __init__(self, result):
+        self.result = result
+        super().__init__(f"exit {result.status}: {result.cmd[:80]}\n{result.output.strip()[-500:]}")
+
+
+class QMPError(QEMUError):
+    """QEMU answered a QMP command with an error reply."""
+
+    def __init__(self, command, error_class, desc):
+        self.command = command
+        self.error_class = error_class
+        self.desc = desc
+        super().__init__(f"{command}: {desc}" + (f" ({error_class})" if error_class else ""))
+
+
+class AgentError(QEMUError):
+    """The guest agent could not carry out a file operation."""
+
+    def __init__(self, op, path, errno, message):
+        self.op = op
+        self.path = path
+        self.errno = errno
+        self.message = message
+        super().__init__(f"agent {op} {path}: {message or f'errno {errno}'}")
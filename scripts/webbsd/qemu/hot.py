@@ -0,0 +1,171 @@
+"""Hot snapshots: boot to a root shell once, restore it in a second.
+
+Booting to ``login:``, logging in and quiescing the guest is the fixed cost
+of every run.  A hot snapshot pays it once: the guest boots on a qcow2
+layer over the image, logs in as root, switches to /bin/sh, stops cron and
+dhclient, and its RAM and device state are saved with QEMU's ``migrate``
+to images/hot/<key>.state.  That layer, frozen at the same instant, is
+images/hot/<key>.qcow2.
+
+A restore starts QEMU with ``-incoming`` on a fresh overlay over the
+frozen layer, so any number of restores can run at once and none of them
+change it.  Snapshots are keyed by the machine configuration (memory,
+drive options, network, extra arguments, agent port) and remember the
+size and mtime of the image they were taken from; once the image changes
+(a commit, a rebuilt stage) the next use takes a new one.
+
+Every hot VM holds a shared lock on images/hot/<image>.users while it
+runs.  A commit needs it exclusively: committing changes the image under
+the frozen layer of every other restore, so it is refused while any other
+hot VM on the same image is up, and the snapshot is dropped afterwards.
+Scripts that drive the boot loader (fix-image.py, fix-network.py) never
+restore: a hot VM is past the loader.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shlex
+import shutil
+
+from .. import IMAGES_DIR
+from .errors import QEMUError
+from .overlay import Overlay, drive_options
+
+HOT_DIR = os.path.join(IMAGES_DIR, "hot")
+
+
+def _image_sig(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class HotSnapshot:
+    """The saved, logged-in state matching one QEMU configuration."""
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.image = os.path.abspath(vm.image)
+        h = hashlib.sha256(json.dumps([self.image, vm.memory, drive_options(vm.drive),
+                                       vm.net, vm.extra_args, vm.use_agent]).encode())
+        self.key = h.hexdigest()[:16]
+        stem = os.path.join(HOT_DIR, self.key)
+        self.disk = stem + ".qcow2"
+        self.state = stem + ".state"
+        self.meta = stem + ".json"
+        self.lock = stem + ".lock"
+        image_key = hashlib.sha256(self.image.encode()).hexdigest()[:16]
+        self.users = os.path.join(HOT_DIR, image_key + ".users")
+        self._users_file = None
+
+    @property
+    def valid(self) -> bool:
+        try:
+            with open(self.meta) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return (meta.get("image") == _image_sig(self.image)
+                and os.path.exists(self.disk) and os.path.exists(self.state))
+
+    def incoming(self) -> str:
+        return f"exec:cat {shlex.quote(self.state)}"
+
+    def invalidate(self) -> None:
+        for path in (self.meta, self.state, self.disk):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @contextlib.asynccontextmanager
+    async def _locked(self):
+        """Hold images/hot/<key>.lock; other VMs and processes wait."""
+        os.makedirs(HOT_DIR, exist_ok=True)
+        with open(self.lock, "w") as f:
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(0.5)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def use(self) -> None:
+        """Register as a running VM on the image (shared lock)."""
+        os.makedirs(HOT_DIR, exist_ok=True)
+        self._users_file = open(self.users, "w")
+        fcntl.flock(self._users_file, fcntl.LOCK_SH)
+
+    def release(self) -> None:
+        if self._users_file is not None:
+            fcntl.flock(self._users_file, fcntl.LOCK_UN)
+            self._users_file.close()
+            self._users_file = None
+
+    def claim_image(self) -> None:
+        """Upgrade to the exclusive lock before a commit, or raise."""
+        if self._users_file is None:
+            self.use()
+        try:
+            fcntl.flock(self._users_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise QEMUError(f"other hot VMs are running on {self.image}; not committing "
+                            "(run without WEBBSD_HOT=1, or once they are done)") from None
+
+    async def drop(self) -> None:
+        """Remove the snapshot once the image under it has changed."""
+        async with self._locked():
+            self.invalidate()
+
+    async def ensure(self, rebuild: bool = False) -> None:
+        """Take the snapshot unless a valid one exists."""
+        async with self._locked():
+            if rebuild or not self.valid:
+                await self._take()
+
+    async def _take(self):
+        vm = self.vm
+        print(f"Taking hot snapshot {self.key} of {self.image}")
+        self.invalidate()
+        sig = _image_sig(self.image)
+        await Overlay(self.image, path=self.disk).create()
+        drive = ",".join(["format=qcow2", "cache=writeback", *drive_options(vm.drive)])
+        cold = type(vm)(image=self.disk, memory=vm.memory, drive=drive, net=vm.net,
+                        extra_args=vm.extra_args, echo=vm.echo, hot=False,
+                        agent=vm.use_agent)
+        try:
+            async with cold:
+                await cold.login()
+                await cold.quiesce()
+                await cold.run("sync", timeout=60)
+                await cold.qmp.migrate(f"exec:cat > {shlex.quote(self.state)}")
+                status = await self._migration_status(cold)
+                if status != "completed":
+                    raise QEMUError(f"saving hot snapshot failed (migration {status})")
+        except BaseException:
+            self.invalidate()
+            raise
+        with open(self.meta, "w") as f:
+            json.dump({"image": sig}, f)
+
+    @staticmethod
+    async def _migration_status(vm, timeout: float = 300) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            status = (await vm.qmp.query_migrate()).get("status")
+            if status in ("completed", "failed", "cancelled"):
+                return status
+            if loop.time() >= deadline:
+                return "timeout"
+            await asyncio.sleep(0.2)
+
+
+def clear() -> None:
+    """Remove every hot snapshot."""
+    shutil.rmtree(HOT_DIR, ignore_errors=True)
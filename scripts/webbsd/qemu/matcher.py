@@ -0,0 +1,235 @@
+"""Incremental multi-pattern matching over a serial stream.
+
+The old scripts append every byte to one buffer and test each pattern
+against the whole of it on every poll, so the cost grows with the session
+and text that scrolled by long ago still matches.  Here bytes are fed to a
+Matcher once, as they arrive.  Literal patterns of every pending watch share
+one Aho-Corasick automaton, so each byte is looked at once however many
+patterns are registered; regular expressions are tried only on the new
+bytes plus REGEX_SPAN bytes before them.  Only the last RING_SIZE bytes are
+kept, for context and for watches that start slightly in the past.
+
+Offsets are absolute: the number of bytes fed before that point.  A watch
+only matches text at or after its start offset, so a prompt from an
+earlier command can never satisfy a later wait.
+"""
+
+import re
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Pattern, Sequence, Union
+
+RING_SIZE = 1 << 20
+# How far back a regular expression match may start before new data.
+REGEX_SPAN = 4096
+
+PatternLike = Union[str, bytes, Pattern]
+
+
+class Match(NamedTuple):
+    """Which pattern of a watch matched, and where in the stream."""
+
+    index: int
+    start: int
+    end: int
+    data: bytes
+
+
+class RingBuffer:
+    """The most recent ``size`` bytes of a stream, by absolute offset."""
+
+    def __init__(self, size: int = RING_SIZE):
+        self.size = size
+        self.data = bytearray()
+        self.start = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.data)
+
+    def append(self, data: bytes) -> None:
+        self.data += data
+        # Trim in large steps so appends stay amortized O(len(data)).
+        if len(self.data) > 2 * self.size:
+            drop = len(self.data) - self.size
+            del self.data[:drop]
+            self.start += drop
+
+    def since(self, offset: int) -> bytes:
+        """Bytes from offset (or the oldest kept byte) to the end."""
+        return bytes(self.data[max(offset - self.start, 0):])
+
+    def tail(self, n: int) -> bytes:
+        return bytes(self.data[-n:]) if n > 0 else b""
+
+
+def _compile(pattern: PatternLike):
+    if isinstance(pattern, str):
+        return pattern.encode()
+    if isinstance(pattern, bytes):
+        return pattern
+    if isinstance(pattern.pattern, str):
+        return re.compile(pattern.pattern.encode(), pattern.flags & ~re.UNICODE)
+    return pattern
+
+
+class Watch:
+    """A pending wait for the first of several patterns after ``start``."""
+
+    def __init__(self, patterns: Sequence[PatternLike], start: int,
+                 callback: Callable[[Optional[Match]], None]):
+        self.patterns = [_compile(p) for p in patterns]
+        self.start = start
+        self.callback = callback
+        self.match = None
+        self.done = False
+
+
+class _Automaton:
+    """Aho-Corasick over a fixed set of byte strings."""
+
+    def __init__(self, words: Sequence[bytes]):
+        self.goto: List[Dict[int, int]] = [{}]
+        self.fail = [0]
+        self.out: List[List[bytes]] = [[]]
+        for word in words:
+            s = 0
+            for b in word:
+                t = self.goto[s].get(b)
+                if t is None:
+                    t = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[s][b] = t
+                s = t
+            self.out[s].append(word)
+        queue = deque(self.goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for b, t in self.goto[s].items():
+                queue.append(t)
+                f = self.fail[s]
+                while f and b not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[t] = self.goto[f].get(b, 0) if s else 0
+                self.out[t] = self.out[t] + self.out[self.fail[t]]
+        self.longest = max((len(w) for w in words), default=0)
+
+    def scan(self, state: int, data: bytes, offset: int, found: list) -> int:
+        """Advance over data, appending (end offset, word) to found."""
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, b in enumerate(data):
+            while state and b not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(b, 0)
+            if out[state]:
+                end = offset + i + 1
+                found.extend((end, w) for w in out[state])
+        return state
+
+
+class Matcher:
+    """Feeds a byte stream to every pending Watch."""
+
+    def __init__(self, size: int = RING_SIZE):
+        self.ring = RingBuffer(size)
+        self.watches: List[Watch] = []
+        self.closed = False
+        self._automaton = _Automaton([])
+        self._state = 0
+
+    @property
+    def end(self) -> int:
+        return self.ring.end
+
+    def watch(self, patterns: Sequence[PatternLike], start: Optional[int] = None,
+              callback: Optional[Callable[[Optional[Match]], None]] = None) -> Watch:
+        """Register a watch for patterns at or after start (default: now).
+
+        Bytes already kept since start are checked at once, so the callback
+        may run before this returns.  It gets None if the stream closes.
+        """
+        w = Watch(patterns, self.end if start is None else start, callback or (lambda m: None))
+        backlog_at = max(w.start, self.ring.start)
+        backlog = self.ring.since(backlog_at)
+        best = None
+        for i, p in enumerate(w.patterns):
+            if isinstance(p, bytes):
+                j = backlog.find(p)
+                m = (j + len(p), i, j) if j >= 0 else None
+            else:
+                r = p.search(backlog)
+                m = (r.end(), i, r.start()) if r else None
+            if m and (best is None or m < best):
+                best = m
+        if best:
+            end, i, j = best
+            self._resolve(w, Match(i, backlog_at + j, backlog_at + end, backlog[j:end]))
+        elif self.closed:
+            self._resolve(w, None)
+        else:
+            self.watches.append(w)
+            self._rebuild()
+        return w
+
+    def cancel(self, w: Watch) -> None:
+        if w in self.watches:
+            self.watches.remove(w)
+            self._rebuild()
+
+    def _rebuild(self):
+        words = sorted({p for w in self.watches for p in w.patterns if isinstance(p, bytes)})
+        if words == sorted(set(self._words())):
+            return
+        self._automaton = _Automaton(words)
+        # Replay the bytes a match in progress could span.
+        tail = self.ring.tail(self._automaton.longest - 1)
+        self._state = self._automaton.scan(0, tail, self.end - len(tail), [])
+
+    def _words(self):
+        return [w for out in self._automaton.out for w in out]
+
+    def feed(self, data: bytes) -> None:
+        if not data:
+            return
+        prev = self.end
+        self.ring.append(data)
+        if not self.watches:
+            return
+        found = []
+        self._state = self._automaton.scan(self._state, data, prev, found)
+        best: Dict[Watch, tuple] = {}
+        for end, word in found:
+            for w in self.watches:
+                if w in best or word not in w.patterns:
+                    continue
+                start = end - len(word)
+                if start >= w.start:
+                    best[w] = (end, w.patterns.index(word), start)
+        for w in self.watches:
+            at = max(w.start, prev - REGEX_SPAN, self.ring.start)
+            for i, p in enumerate(w.patterns):
+                if isinstance(p, bytes):
+                    continue
+                r = p.search(self.ring.since(at))
+                if r and (w not in best or at + r.end() < best[w][0]):
+                    best[w] = (at + r.end(), i, at + r.start())
+        if not best:
+            return
+        for w, (end, i, start) in best.items():
+            self.watches.remove(w)
+            self._resolve(w, Match(i, start, end, self.ring.since(start)[:end - start]))
+        self._rebuild()
+
+    def close(self) -> None:
+        """End of stream: every pending watch gets None."""
+        self.closed = True
+        watches, self.watches = self.watches, []
+        for w in watches:
+            self._resolve(w, None)
+
+    @staticmethod
+    def _resolve(w: Watch, match: Optional[Match]):
+        w.match = match
+        w.done = True
+        w.callback(match)
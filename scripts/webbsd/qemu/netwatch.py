@@ -0,0 +1,55 @@
+"""The network watchdog (scripts/guest/net-watchdog.sh).
+
+Earlier images got one of several polling loops: a root one from rc.local,
+one started by i3 as the desktop user, and /usr/local/bin/auto-dhcp.sh run
+from rc.local and root's crontab every minute.  Each forked ifconfig and
+friends on a timer for the whole session.  ``install`` replaces all of
+them with the event-driven script, started once from rc.local; the
+desktop manifest carries the same script and hook.
+"""
+
+import os
+
+from .. import profile
+from ..manifest import RC_LOCAL
+from .agent import SOURCE_DIR
+from .transfer import put_file, put_path
+
+SCRIPT = "/usr/local/sbin/net-watchdog.sh"
+RC_HOOK = f"{SCRIPT} listen &"
+AUTO_DHCP = "/usr/local/bin/auto-dhcp.sh"
+
+# rc.local lines that started an earlier watchdog.
+_LEGACY = ("auto-dhcp.sh", "net-watchdog.sh")
+
+
+def rc_local(current: str) -> str:
+    """current with earlier watchdog lines dropped and RC_HOOK added.
+
+    A manifest block that already has RC_HOOK is left alone; otherwise the
+    hook goes at the end, where render_rc_local() adopts it later.
+    """
+    lines = current.splitlines() or ["#!/bin/sh"]
+    lines = [l for l in lines if l == RC_HOOK or not any(n in l for n in _LEGACY)]
+    if RC_HOOK not in lines:
+        lines.append(RC_HOOK)
+    return "\n".join(lines) + "\n"
+
+
+async def install(vm, home: str = "") -> None:
+    """Install the watchdog and remove the polling ones.
+
+    home, if given, is the desktop user's, whose i3 config may start one.
+    """
+    with profile.span("install net watchdog", "install"):
+        await put_path(vm, os.path.join(SOURCE_DIR, "net-watchdog.sh"), SCRIPT, mode="755")
+        current = (await vm.run(f"cat {RC_LOCAL} 2>/dev/null")).stdout
+        await put_file(vm, rc_local(current).encode(), RC_LOCAL, mode="755")
+        cmd = (f"rm -f {AUTO_DHCP}; "
+               f"if crontab -l 2>/dev/null | grep -q auto-dhcp; then "
+               f"crontab -l | grep -v auto-dhcp | crontab -; fi")
+        if home:
+            cmd += (f"; rm -f {home}/.config/i3/net-watchdog.sh; "
+                    f"[ ! -f {home}/.config/i3/config ] || "
+                    f"sed -i '' '/net-watchdog/d' {home}/.config/i3/config")
+        await vm.run(cmd, check=True)
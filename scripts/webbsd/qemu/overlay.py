@@ -0,0 +1,70 @@
+"""Copy-on-write qcow2 overlays for provisioning boots.
+
+A boot writes only to a throwaway qcow2 layer backed by the real image.
+The base is not touched until ``commit()`` folds the layer back in, which
+the driver only allows after a clean power-off; ``discard()`` drops it.
+A crashed or failed stage therefore leaves the base exactly as it was, and
+the overlay can run with cache=writeback.
+"""
+
+import asyncio
+import itertools
+import os
+from typing import List, Optional
+
+from .errors import QEMUError
+
+# Several VMs in one process may share a base, so the PID alone is not unique.
+_SEQ = itertools.count(1)
+
+
+def drive_options(drive: str) -> List[str]:
+    """The -drive options that still apply when the file becomes a qcow2 layer."""
+    return [o for o in drive.split(",") if o and not o.startswith(("format=", "cache="))]
+
+
+class Overlay:
+    """A qcow2 layer over a base image, created next to it.
+
+    commit_to names an image further down the backing chain to commit
+    into, when the base is itself a layer (a hot snapshot's disk).
+    """
+
+    def __init__(self, base: str, base_format: str = "raw", path: Optional[str] = None,
+                 commit_to: Optional[str] = None):
+        self.base = os.path.abspath(base)
+        self.base_format = base_format
+        self.path = path or f"{self.base}.{os.getpid()}.{next(_SEQ)}.overlay.qcow2"
+        self.commit_to = os.path.abspath(commit_to) if commit_to else None
+
+    async def _qemu_img(self, *args):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "qemu-img", *args, stdout=asyncio.subprocess.DEVNULL)
+        except FileNotFoundError:
+            raise QEMUError("qemu-img not found (install QEMU)") from None
+        if await proc.wait():
+            raise QEMUError(f"qemu-img {args[0]} failed (exit {proc.returncode})")
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    async def create(self) -> None:
+        if not os.path.exists(self.base):
+            raise QEMUError(f"base image {self.base} does not exist")
+        self.discard()
+        await self._qemu_img("create", "-q", "-f", "qcow2", "-F", self.base_format,
+                             "-b", self.base, self.path)
+
+    async def commit(self) -> None:
+        """Write the layer's changes into the base and remove the layer."""
+        if self.commit_to:
+            await self._qemu_img("commit", "-q", "-b", self.commit_to, self.path)
+        else:
+            await self._qemu_img("commit", "-q", self.path)
+        self.discard()
+
+    def discard(self) -> None:
+        if self.exists:
+            os.remove(self.path)
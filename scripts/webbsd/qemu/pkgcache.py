@@ -0,0 +1,178 @@
+"""Persistent pkg cache disk shared by every provisioning run.
+
+Every script that installs packages used to bootstrap pkg, fetch the repo
+catalog and download every .pkg through QEMU's user-mode NAT, the slowest
+link of the build, and throw all of it away with the VM.  The cache is a
+second raw drive, images/pkg-cache.img (sparse, UFS2 made by the guest on
+first use), that the guest mounts on /var/cache/pkg:
+
+  - fetched packages stay on it, so a reinstall reads them at disk speed
+  - the repo catalog (/var/db/pkg/repo-*, repos/) is saved on it when the
+    cache is detached and restored when it is attached, so pkg only asks
+    the mirror whether it changed
+  - pkg itself is kept on it, so a fresh image bootstraps without a fetch
+
+With WEBBSD_PKG_OFFLINE=1 the attach exports REPO_AUTOUPDATE=NO, so every
+pkg command after it uses the saved catalog and the cached packages only,
+and a run needs no network at all as long as the cache has what it asks
+for.
+
+Before unmounting, packages installed in the guest are touched (they are
+in use), then packages older than PKG_CACHE_MAX_AGE_DAYS and, oldest
+first, whatever exceeds PKG_CACHE_MAX_MB are removed.  One VM at a time
+mounts the cache; images/pkg-cache.lock serializes them across processes.
+"""
+
+import asyncio
+import fcntl
+import os
+import re
+import shlex
+
+from .. import IMAGES_DIR, profile
+from ..config import load_config
+
+CACHE_IMAGE = os.path.join(IMAGES_DIR, "pkg-cache.img")
+OFFLINE_ENV = "WEBBSD_PKG_OFFLINE"
+MOUNT = "/var/cache/pkg"
+DB_DIR = "/var/db/pkg"
+CATALOG = f"{MOUNT}/.catalog.tar"
+# The cache is the second IDE disk: ada1 in the guest.
+DEVICE = "/dev/ada1"
+
+DEFAULT_SIZE = "4G"
+DEFAULT_MAX_MB = 3072
+DEFAULT_MAX_AGE_DAYS = 90
+
+
+def _parse_size(text: str) -> int:
+    m = re.fullmatch(r"\s*(\d+)\s*([KMGT]?)B?\s*", text.upper())
+    if not m:
+        raise ValueError(f"bad size: {text!r}")
+    return int(m.group(1)) << (10 * " KMGT".index(m.group(2) or " "))
+
+
+def offline() -> bool:
+    return os.environ.get(OFFLINE_ENV) == "1"
+
+
+class PkgCache:
+    """The cache drive: host-side image and lock, guest-side commands.
+
+    Async users go through ``QEMU(pkg_cache=True)``; the standalone socket
+    scripts call ``lock_sync()``, put ``drive_args()`` on the QEMU command
+    line and run ``attach_command()``/``detach_command()`` themselves.
+    """
+
+    def __init__(self, path: str = CACHE_IMAGE, config: dict = None):
+        cfg = load_config() if config is None else config
+        self.path = path
+        self.size = _parse_size(cfg.get("PKG_CACHE_SIZE") or DEFAULT_SIZE)
+        self.max_mb = int(cfg.get("PKG_CACHE_MAX_MB") or DEFAULT_MAX_MB)
+        self.max_age_days = int(cfg.get("PKG_CACHE_MAX_AGE_DAYS") or DEFAULT_MAX_AGE_DAYS)
+        self.lock = os.path.splitext(path)[0] + ".lock"
+        self.attached = False
+        self._lock_file = None
+
+    def create(self) -> None:
+        """Create the sparse image if it does not exist yet."""
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.truncate(self.size)
+
+    def drive_args(self):
+        return ["-drive", f"file={self.path},format=raw,if=ide,index=1,cache=writeback"]
+
+    def _try_lock(self) -> bool:
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.lock), exist_ok=True)
+            self._lock_file = open(self.lock, "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self.create()
+        return True
+
+    async def acquire(self) -> None:
+        """Take the lock, waiting while another VM has the cache."""
+        if not self._try_lock():
+            print(f"Waiting for {self.lock}...")
+            while not self._try_lock():
+                await asyncio.sleep(0.5)
+
+    def lock_sync(self) -> None:
+        """Blocking acquire() for the socket scripts; held until exit."""
+        if not self._try_lock():
+            print(f"Waiting for {self.lock}...")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self.create()
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def attach_command(self, csh: bool = False) -> str:
+        """One command line: mount the cache and restore pkg state from it.
+
+        With csh=True it is wrapped for root's login shell.
+        """
+        steps = [
+            f"fstyp {DEVICE} >/dev/null 2>&1 || newfs -U -L pkgcache {DEVICE} >/dev/null",
+            f"fsck -p -t ufs {DEVICE} >/dev/null 2>&1",
+            f"mkdir -p {MOUNT} {DB_DIR}",
+            f"mount -o noatime {DEVICE} {MOUNT}",
+            f"if [ -f {CATALOG} ]; then tar -xpf {CATALOG} -C {DB_DIR}; fi",
+            # Bootstrap from the cached pkg package instead of the mirror.
+            f"if ! pkg -N >/dev/null 2>&1; then"
+            f" p=$(ls -t {MOUNT}/pkg-[0-9]*.pkg 2>/dev/null | head -1);"
+            f" if [ -n \"$p\" ]; then env ASSUME_ALWAYS_YES=yes pkg add \"$p\" >/dev/null; fi; fi",
+        ]
+        # The mount check comes last: its status is the command's.
+        steps.append(f"mount | grep -q ' on {MOUNT} '")
+        if csh:
+            cmd = "sh -c " + shlex.quote("; ".join(steps))
+            return "setenv REPO_AUTOUPDATE NO; " + cmd if offline() else cmd
+        if offline():
+            steps.insert(0, "export REPO_AUTOUPDATE=NO")
+        return "; ".join(steps)
+
+    def detach_command(self, csh: bool = False) -> str:
+        """One command line: save pkg state, evict, unmount."""
+        max_bytes = self.max_mb << 20
+        steps = [
+            f"cd {MOUNT}",
+            f"(cd {DB_DIR} && ls -d repo-* repos 2>/dev/null) | "
+            f"xargs tar -cf {CATALOG}.new -C {DB_DIR} && mv {CATALOG}.new {CATALOG}",
+            # Keep pkg itself around for the next bootstrap.
+            f"if pkg -N >/dev/null 2>&1 && ! ls pkg-[0-9]*.pkg >/dev/null 2>&1"
+            f" && [ \"$REPO_AUTOUPDATE\" != NO ]; then pkg fetch -y -q pkg; fi",
+            # Installed packages are in use: refresh them before evicting.
+            "pkg query '%n-%v.pkg' 2>/dev/null | xargs touch -c 2>/dev/null",
+            f"find . -maxdepth 1 -type f -name '*.pkg' -mtime +{self.max_age_days} -delete",
+            "find . -maxdepth 1 -type f -name '*.pkg' -exec stat -f '%m %z %N' {} + | sort -n | "
+            f"awk -v max={max_bytes} '{{s += $2; z[NR] = $2; f[NR] = $3}} "
+            "END {for (i = 1; i <= NR && s > max; i++) {print f[i]; s -= z[i]}}' | xargs rm -f",
+            "find -L . -maxdepth 1 -type l -delete",
+            "cd /",
+            "sync",
+            f"umount {MOUNT}",
+        ]
+        cmd = "; ".join(steps)
+        return "sh -c " + shlex.quote(cmd) if csh else cmd
+
+    async def attach(self, vm) -> None:
+        with profile.span("pkg-cache attach", "disk"):
+            await vm.run(self.attach_command(), timeout=600, check=True)
+            if offline():
+                # The export above only lasts in the console shell.
+                await vm.setenv("REPO_AUTOUPDATE", "NO")
+        self.attached = True
+
+    async def detach(self, vm) -> None:
+        with profile.span("pkg-cache detach", "disk"):
+            await vm.run(self.detach_command(), timeout=600, check=True)
+        self.attached = False
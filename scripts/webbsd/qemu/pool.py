@@ -0,0 +1,105 @@
+"""Run independent VM jobs concurrently.
+
+Each VM gets its own overlay and its own UNIX sockets, so jobs never
+fight over ports or write to the shared base image.  The pool caps how
+many run at once (one per core by default), tracks the QEMU PIDs it
+started, and writes every job's serial output (or a script's stdout) to
+images/logs/<name>.log instead of interleaving it on the terminal.
+"""
+
+import asyncio
+import contextlib
+import os
+import signal
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from .. import IMAGES_DIR
+from .driver import QEMU
+
+LOG_DIR = os.path.join(IMAGES_DIR, "logs")
+
+
+class JobResult(NamedTuple):
+    name: str
+    ok: bool
+    seconds: float
+    output: str
+    log: str
+
+    def __str__(self):
+        state = "ok" if self.ok else "FAILED"
+        return f"{self.name:<20} {state:<7} {self.seconds:7.1f}s  {self.log}"
+
+
+class VMPool:
+    """At most ``size`` jobs at a time, each VM on a throwaway overlay."""
+
+    def __init__(self, size: Optional[int] = None, log_dir: str = LOG_DIR):
+        self.size = size or os.cpu_count() or 1
+        self.log_dir = log_dir
+        self.vms = set()
+        self._slots = asyncio.Semaphore(self.size)
+
+    def pids(self) -> List[int]:
+        """PIDs of the QEMU processes this pool is running right now."""
+        return sorted(vm.pid for vm in self.vms if vm.pid is not None)
+
+    def _log_path(self, name: str) -> str:
+        os.makedirs(self.log_dir, exist_ok=True)
+        return os.path.join(self.log_dir, f"{name}.log")
+
+    @contextlib.asynccontextmanager
+    async def vm(self, **kwargs):
+        """Wait for a free slot, then boot a QEMU (overlay=True, echo=False)."""
+        kwargs.setdefault("overlay", True)
+        kwargs.setdefault("echo", False)
+        async with self._slots:
+            vm = QEMU(**kwargs)
+            self.vms.add(vm)
+            try:
+                async with vm:
+                    yield vm
+            finally:
+                self.vms.discard(vm)
+
+    async def run(self, name: str, job: Callable[[QEMU], Awaitable[str]],
+                  **kwargs) -> JobResult:
+        """Run job(vm) in a fresh VM; job returns the text to report.
+
+        A failing job is reported, not raised, so it cannot take its
+        siblings down with it.
+        """
+        log = self._log_path(name)
+        start = time.monotonic()
+        kwargs.setdefault("serial_log", log)
+        try:
+            async with self.vm(**kwargs) as vm:
+                output, ok = await job(vm), True
+        except Exception as e:
+            output, ok = f"{type(e).__name__}: {e}\n", False
+        return JobResult(name, ok, time.monotonic() - start, output, log)
+
+    async def spawn(self, name: str, argv: Sequence[str],
+                    env: Optional[Dict[str, str]] = None) -> JobResult:
+        """Run a script that boots its own VM, holding one slot while it runs."""
+        log = self._log_path(name)
+        start = time.monotonic()
+        async with self._slots:
+            with open(log, "wb") as f:
+                proc = await asyncio.create_subprocess_exec(
+                    *argv, stdout=f, stderr=asyncio.subprocess.STDOUT,
+                    env={**os.environ, **(env or {})})
+                try:
+                    await proc.wait()
+                except asyncio.CancelledError:
+                    # SIGINT lets the script's own cleanup quit its QEMU.
+                    proc.send_signal(signal.SIGINT)
+                    try:
+                        await asyncio.wait_for(proc.wait(), 30)
+                    except asyncio.TimeoutError:
+                        proc.kill()
+                    raise
+        with open(log, errors="replace") as f:
+            tail = "".join(f.readlines()[-20:])
+        return JobResult(name, proc.returncode == 0, time.monotonic() - start, tail, log)
@@ -0,0 +1,151 @@
+"""QMP (QEMU Machine Protocol) client.
+
+The HMP text monitor answers with free-form text that has to be scraped,
+and ``sendkey`` costs one round trip per character.  QMP speaks one JSON
+object per line: every command gets a ``return`` or an ``error`` reply, and
+asynchronous events (SHUTDOWN, STOP, ...) are kept in ``events``.  Typed
+text goes out as ``input-send-event`` batches of key down/up events, a few
+characters per command, so a loader line takes a fraction of a second and
+no key is lost to a full BIOS keyboard buffer.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .errors import QEMUError, QMPError
+
+# Characters typed without shift, by QEMU qcode.
+_PLAIN = {
+    " ": "spc", "\n": "ret", "\t": "tab", "-": "minus", "=": "equal",
+    "[": "bracket_left", "]": "bracket_right", ";": "semicolon",
+    "'": "apostrophe", "`": "grave_accent", "\\": "backslash",
+    ",": "comma", ".": "dot", "/": "slash",
+}
+_SHIFTED = {
+    "!": "1", "@": "2", "#": "3", "$": "4", "%": "5", "^": "6", "&": "7",
+    "*": "8", "(": "9", ")": "0", "_": "minus", "+": "equal",
+    "{": "bracket_left", "}": "bracket_right", ":": "semicolon",
+    '"': "apostrophe", "~": "grave_accent", "|": "backslash",
+    "<": "comma", ">": "dot", "?": "slash",
+}
+# The BIOS keyboard buffer holds 15 keys; stay well below it per batch.
+KEYS_PER_BATCH = 8
+BATCH_GAP = 0.03
+
+
+def keys_for(text: str) -> Iterator[Tuple[str, ...]]:
+    """Key chords (modifiers first) that type text on a US keyboard."""
+    for ch in text:
+        if ch in _PLAIN:
+            yield (_PLAIN[ch],)
+        elif ch in _SHIFTED:
+            yield ("shift", _SHIFTED[ch])
+        elif ch.isascii() and ch.isalpha():
+            yield ("shift", ch.lower()) if ch.isupper() else (ch,)
+        elif ch.isascii() and ch.isdigit():
+            yield (ch,)
+        else:
+            raise ValueError(f"cannot type {ch!r}")
+
+
+def _key_events(chord: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    def event(key, down):
+        return {"type": "key", "data": {"down": down, "key": {"type": "qcode", "data": key}}}
+    return [event(k, True) for k in chord] + [event(k, False) for k in reversed(chord)]
+
+
+class QMP:
+    """One QMP session over an already connected stream."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.events: List[Dict[str, Any]] = []
+        self.greeting = None
+        self._lock = asyncio.Lock()
+
+    async def _read(self) -> Dict[str, Any]:
+        line = await self.reader.readline()
+        if not line:
+            raise QEMUError("QMP connection closed")
+        return json.loads(line)
+
+    async def negotiate(self) -> "QMP":
+        """Read the greeting and leave capabilities negotiation mode."""
+        self.greeting = (await self._read()).get("QMP")
+        await self.execute("qmp_capabilities")
+        return self
+
+    async def execute(self, command: str, **arguments) -> Any:
+        """Run a command and return its ``return`` value; errors raise QMPError."""
+        msg = {"execute": command}
+        if arguments:
+            msg["arguments"] = arguments
+        async with self._lock:
+            self.writer.write(json.dumps(msg).encode() + b"\n")
+            await self.writer.drain()
+            while True:
+                reply = await self._read()
+                if "event" in reply:
+                    self.events.append(reply)
+                    continue
+                if "error" in reply:
+                    raise QMPError(command, reply["error"].get("class", ""),
+                                   reply["error"].get("desc", ""))
+                return reply.get("return")
+
+    async def hmp(self, command: str) -> str:
+        """Run an HMP command through QMP and return its text output."""
+        return (await self.execute("human-monitor-command", **{"command-line": command})).strip()
+
+    async def status(self) -> Dict[str, Any]:
+        """``query-status``: {"running": bool, "status": "running" | "paused" | ...}."""
+        return await self.execute("query-status")
+
+    async def screendump(self, filename: str, format: Optional[str] = None) -> None:
+        """Save the display to filename (PPM, or PNG with format="png")."""
+        args = {"filename": filename}
+        if format:
+            args["format"] = format
+        await self.execute("screendump", **args)
+
+    async def savevm(self, name: str) -> None:
+        """Save a named internal snapshot (needs a qcow2 drive)."""
+        out = await self.hmp(f"savevm {name}")
+        if out:
+            raise QMPError("savevm", "GenericError", out)
+
+    async def loadvm(self, name: str) -> None:
+        out = await self.hmp(f"loadvm {name}")
+        if out:
+            raise QMPError("loadvm", "GenericError", out)
+
+    async def system_powerdown(self) -> None:
+        """Press the ACPI power button."""
+        await self.execute("system_powerdown")
+
+    async def quit(self) -> None:
+        await self.execute("quit")
+
+    async def migrate(self, uri: str) -> None:
+        await self.execute("migrate", uri=uri)
+
+    async def query_migrate(self) -> Dict[str, Any]:
+        """``query-migrate``: {"status": "active" | "completed" | "failed" | ...}."""
+        return await self.execute("query-migrate")
+
+    async def send_keys(self, *chords: Tuple[str, ...]) -> None:
+        """Press and release each chord (e.g. ("ctrl", "alt", "f2")) in order."""
+        for i in range(0, len(chords), KEYS_PER_BATCH):
+            if i:
+                await asyncio.sleep(BATCH_GAP)
+            events = [e for chord in chords[i:i + KEYS_PER_BATCH] for e in _key_events(chord)]
+            await self.execute("input-send-event", events=events)
+
+    async def type_text(self, text: str) -> None:
+        """Type text on the emulated keyboard."""
+        await self.send_keys(*keys_for(text))
+
+    def close(self) -> None:
+        self.writer.close()
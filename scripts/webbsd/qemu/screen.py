@@ -0,0 +1,80 @@
+"""VGA text-mode screen reader.
+
+Before the serial console is up (boot menu, loader prompt, installer) the
+only output is on the VGA screen.  Instead of sleeping a guessed delay or
+saving a screendump for a human, the text buffer at 0xB8000 is copied out
+with QMP ``pmemsave`` (4000 bytes for 80x25, a millisecond or two) and
+decoded: every even byte is a CP437 character, every odd byte its colour.
+``wait_for`` polls it until a pattern shows up.
+"""
+
+import asyncio
+import os
+import tempfile
+from typing import List, Optional, Pattern, Union
+
+VGA_TEXT = 0xB8000
+COLS = 80
+ROWS = 25
+
+
+def decode(data: bytes, cols: int = COLS) -> List[str]:
+    """Rows of text from a VGA text buffer (character/attribute pairs)."""
+    chars = bytes(data[0::2]).decode("cp437").replace("\0", " ")
+    return [chars[i:i + cols].rstrip() for i in range(0, len(chars), cols)]
+
+
+class Screen:
+    """One snapshot of the text screen."""
+
+    def __init__(self, rows: List[str]):
+        self.rows = rows
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.rows)
+
+    def search(self, pattern: Union[str, Pattern]) -> bool:
+        if isinstance(pattern, str):
+            return pattern in self.text
+        return pattern.search(self.text) is not None
+
+    def __contains__(self, pattern) -> bool:
+        return self.search(pattern)
+
+    def __str__(self):
+        return self.text.rstrip("\n")
+
+
+class ScreenReader:
+    """Reads a VM's VGA text screen through QMP."""
+
+    def __init__(self, vm, cols: int = COLS, rows: int = ROWS):
+        self.vm = vm
+        self.cols = cols
+        self.rows = rows
+        fd, self.path = tempfile.mkstemp(prefix="webbsd-vga-")
+        os.close(fd)
+
+    async def read(self) -> Screen:
+        size = self.cols * self.rows * 2
+        await self.vm.qmp.execute("pmemsave", val=VGA_TEXT, size=size, filename=self.path)
+        with open(self.path, "rb") as f:
+            return Screen(decode(f.read(size), self.cols))
+
+    async def wait_for(self, pattern: Union[str, Pattern], timeout: float = 60,
+                       interval: float = 0.05) -> Optional[Screen]:
+        """Poll the screen until pattern is on it; None on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            screen = await self.read()
+            if pattern in screen:
+                return screen
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(interval)
+
+    def close(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
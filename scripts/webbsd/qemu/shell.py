@@ -0,0 +1,246 @@
+"""Prompt-synchronized command execution on the guest's serial shell.
+
+Instead of sleeping a fixed delay after each command, the shell is given a
+unique PS1 once, and every command is framed by control bytes written by
+the shell itself::
+
+    printf '\\035'; { <cmd>
+    } 2>/tmp/.wbXXXX.err; printf '\\036%d\\034' $?; cat /tmp/.wbXXXX.err; printf '\\037'
+
+The tty echoes the command line with the escapes still spelled out as text,
+so the frame can only come from the shell: stdout lies between ``\\x1d``
+and ``\\x1e``, then the exit status, then stderr up to ``\\x1f``.  Echo and
+prompt noise never reach the result.  A command is finished the moment
+``\\x1f`` followed by the prompt arrives.  The frame is parsed from each
+chunk of serial output as the driver receives it, never from a buffer, and
+stdout can be streamed to a callback as it comes.
+
+When the stderr file cannot be created (read-only or full root), the group
+never runs, so the command is simply sent again with stderr left on the
+console, interleaved with stdout.
+
+File contents are not typed as command lines (which the tty echoes back,
+doubling the traffic).  ``write_raw`` saves the tty settings, switches to
+``stty raw -echo``, signals with a ``\\016`` byte that it is ready, and
+``head -c N`` reads exactly the payload; the settings are restored right
+after, and a guest-side ``timeout`` guarantees that even if the payload
+never arrives.
+"""
+
+import asyncio
+import codecs
+import os
+import shlex
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from .. import profile
+from .errors import CommandError, QEMUError
+
+OUT_START = b"\x1d"
+STATUS_START = b"\x1e"
+ERR_START = b"\x1c"
+STATUS_END = b"\x1f"
+# The byte that ends each part of the frame, in order: echo, stdout,
+# status, stderr.
+_DELIMS = (OUT_START, STATUS_START, ERR_START, STATUS_END)
+# Printed once the tty is raw and the payload may be sent.
+RAW_READY = b"\x0e"
+# Payload per write_raw: fits the tty input queue (about 23 KB at 115200
+# baud) even before head(1) starts reading.
+RAW_BLOCK = 16384
+
+
+class CommandResult(NamedTuple):
+    """A command's stdout, stderr, exit status and wall-clock seconds."""
+
+    cmd: str
+    stdout: str
+    stderr: str
+    status: int
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 0
+
+    @property
+    def output(self) -> str:
+        """stdout followed by stderr."""
+        return self.stdout + self.stderr
+
+    def lines(self) -> List[str]:
+        return [l for l in self.output.split("\n") if l.strip()]
+
+
+class _Capture:
+    """Splits one command's framed output as the bytes arrive."""
+
+    def __init__(self, prompt: bytes, on_output: Optional[Callable[[str], None]]):
+        self.prompt = prompt
+        self.on_output = on_output
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.stdout = bytearray()
+        self.status = bytearray()
+        self.stderr = bytearray()
+        self.part = 0
+        self.fed = 0
+        self.tail = bytearray()
+        self.tail_at = 0
+        # Offset just past the prompt once the frame is complete.
+        self.end = -1
+
+    def feed(self, data: bytes) -> None:
+        i = 0
+        while self.part < len(_DELIMS) and i < len(data):
+            j = data.find(_DELIMS[self.part], i)
+            chunk = data[i:j if j >= 0 else len(data)]
+            if self.part == 1:
+                self.stdout += chunk
+                if self.on_output and chunk:
+                    self.on_output(self.decoder.decode(chunk).replace("\r", ""))
+            elif self.part == 2:
+                self.status += chunk
+            elif self.part == 3:
+                self.stderr += chunk
+            if j < 0:
+                i = len(data)
+                break
+            i = j + 1
+            self.part += 1
+            if self.part == len(_DELIMS):
+                self.tail_at = self.fed + i
+        if self.part == len(_DELIMS):
+            self.tail += data[i:]
+            k = self.tail.find(self.prompt)
+            if k >= 0:
+                self.end = self.tail_at + k + len(self.prompt)
+        self.fed += len(data)
+
+    def result(self, cmd: str, elapsed: float) -> CommandResult:
+        status = int(self.status) if self.status.isdigit() else -1
+        return CommandResult(cmd, _text(self.stdout), _text(self.stderr), status, elapsed)
+
+
+def _text(data: bytes) -> str:
+    return data.decode(errors="replace").replace("\r", "")
+
+
+class Shell:
+    """Runs commands on an already logged-in sh session of a QEMU driver."""
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.prompt = f"wb{os.urandom(4).hex()}# "
+        # Unique to this session, for scratch file names.
+        self.tag = self.prompt[:-2]
+        self.errfile = f"/tmp/.{self.tag}.err"
+        self.blkfile = f"/tmp/.{self.tag}.blk"
+
+    async def setup(self, timeout: float = 30) -> "Shell":
+        """Install the unique prompt and turn off line editing.
+
+        The PS1 assignment is split by quotes so its own echo cannot be
+        mistaken for the new prompt.
+        """
+        p = self.prompt
+        self.vm.cursor = self.vm.received
+        await self.vm.send(f"set +E +V 2>/dev/null; PS2=''; PS1='{p[:4]}''{p[4:]}'\n")
+        if not await self.vm.wait_for(p, timeout):
+            raise QEMUError("shell did not show the new prompt")
+        return self
+
+    async def run(self, cmd: str, timeout: float = 60, check: bool = False,
+                  on_output: Optional[Callable[[str], None]] = None) -> CommandResult:
+        """Run cmd and return as soon as the prompt comes back.
+
+        on_output, if given, is called with each piece of stdout as it
+        arrives.
+        """
+        with profile.span(cmd.split("\n", 1)[0][:200], "command") as span:
+            result = await self._run(cmd, timeout, on_output, split=True)
+            if result.status != 0 and self.errfile in result.stdout:
+                result = await self._run(cmd, timeout, on_output, split=False)
+            span["status"] = result.status
+        if check and not result.ok:
+            raise CommandError(result)
+        return result
+
+    async def _run(self, cmd, timeout, on_output, split, payload=None):
+        vm = self.vm
+        # A newline, not "; ", closes the group: it is valid after "&" and
+        # ";", and keeps a heredoc terminator alone on its line.
+        if split:
+            tail = (f"}} 2>{self.errfile}; printf '\\036%d\\034' $?; "
+                    f"cat {self.errfile}; printf '\\037'")
+        else:
+            tail = "}; printf '\\036%d\\034\\037' $?"
+        if vm._eof:
+            raise QEMUError("serial console closed")
+        began = time.monotonic()
+        done = asyncio.get_running_loop().create_future()
+        capture = _Capture(self.prompt.encode(), on_output)
+
+        def feed(data):
+            capture.feed(data)
+            if (capture.end >= 0 or not data) and not done.done():
+                done.set_result(None)
+
+        start = vm.cursor = vm.received
+        vm.add_listener(feed)
+        try:
+            await vm.send(f"printf '\\035'; {{ {cmd}\n{tail}\n")
+            if payload is not None:
+                if await vm.expect([RAW_READY], timeout, start=start) is None:
+                    raise QEMUError(f"tty did not switch to raw mode for: {cmd[:80]}")
+                await vm.send(payload)
+            await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            vm.remove_listener(feed)
+        if capture.end < 0:
+            raise QEMUError(f"timeout ({timeout}s) waiting for: {cmd[:80]}")
+        vm.cursor = start + capture.end
+        return capture.result(cmd, time.monotonic() - began)
+
+    async def write_raw(self, path: str, data: bytes, then: Optional[str] = None,
+                        timeout: float = 60) -> CommandResult:
+        """Copy up to RAW_BLOCK bytes into path, unechoed and byte for byte.
+
+        then, if given, runs after a complete write (e.g. a checksum test
+        and an append).  The tty is back in its old mode when this returns,
+        whatever happened.
+        """
+        if len(data) > RAW_BLOCK:
+            raise ValueError(f"write_raw takes at most {RAW_BLOCK} bytes")
+        n = len(data)
+        q = shlex.quote(path)
+        cmd = (f"wbtty=$(stty -g); stty raw -echo; printf '\\016'; "
+               f"timeout {int(timeout)} head -c {n} > {q}; stty \"$wbtty\"; "
+               f"[ $(wc -c < {q}) -eq {n} ]")
+        if then:
+            cmd += f" && {then}"
+        with profile.span(f"write_raw {path}", "command", bytes=n) as span:
+            result = await self._run(cmd, timeout + 10, None, split=True, payload=data)
+            span["status"] = result.status
+        return result
+
+    async def write_text(self, path: str, text: str, mode: Optional[str] = None) -> None:
+        """Write a text file (newline-terminated) through write_raw.
+
+        Waiting for the prompt after each block keeps the tty input queue
+        from overflowing without any fixed delay.
+        """
+        data = (text.rstrip("\n") + "\n").encode()
+        dest, part = shlex.quote(path), shlex.quote(f"{path}.wbpart")
+        await self.run(f": > {part}", check=True)
+        for off in range(0, len(data), RAW_BLOCK):
+            result = await self.write_raw(self.blkfile, data[off:off + RAW_BLOCK],
+                                          then=f"cat {self.blkfile} >> {part}")
+            if not result.ok:
+                raise CommandError(result)
+        # cat, not mv: an existing file keeps its mode and owner.
+        await self.run(f"cat {part} > {dest} && rm -f {part} {self.blkfile}", check=True)
+        if mode:
+            await self.run(f"chmod {shlex.quote(mode)} {dest}", check=True)
@@ -0,0 +1,68 @@
+"""The i3bar status daemon (scripts/guest/webbsd-status.c).
+
+~/.config/i3/status.sh used to be a shell loop that forked sysctl four
+times, date once and several subshells per tick, which under v86 is a
+noticeable share of the emulated CPU at idle.  webbsd-status is one
+long-lived process that reads the counters with sysctl(3), keeps the
+sparkline history in memory and speaks the i3bar protocol with
+click_events itself; status.sh only execs it.
+
+``install`` builds it in the guest (fix-image.py does this for every
+image); ``measure`` is what scripts/bench-status.py reports: the guest's
+busy share while a status command runs, from kern.cp_time.
+"""
+
+import os
+import shlex
+from typing import NamedTuple
+
+from .. import profile
+from .agent import SOURCE_DIR
+from .transfer import put_path
+
+BINARY = "/usr/local/bin/webbsd-status"
+
+
+def status_sh(args: str = "") -> str:
+    """~/.config/i3/status.sh, running the daemon with args."""
+    return f"""#!/bin/sh
+# i3bar status: one long-lived process (scripts/guest/webbsd-status.c).
+exec {BINARY}{" " + args if args else ""}
+"""
+
+
+STATUS_SH = status_sh()
+
+
+class CPUSample(NamedTuple):
+    busy: int
+    total: int
+
+    @property
+    def percent(self) -> float:
+        return 100.0 * self.busy / self.total if self.total else 0.0
+
+
+async def install(vm) -> None:
+    """Build webbsd-status in the guest with the base system cc."""
+    with profile.span("install status daemon", "install"):
+        await put_path(vm, os.path.join(SOURCE_DIR, "webbsd-status.c"), "/tmp/webbsd-status.c")
+        await vm.run(f"mkdir -p {os.path.dirname(BINARY)} && "
+                     f"cc -O2 -o {BINARY} /tmp/webbsd-status.c && rm -f /tmp/webbsd-status.c",
+                     timeout=600, check=True)
+
+
+async def measure(vm, command: str, seconds: int) -> CPUSample:
+    """Guest CPU use while command runs for seconds (empty: idle baseline).
+
+    command gets a pipe that stays open as stdin, like i3bar's, and its
+    output is discarded.  timeout(1) kills every process it started.
+    """
+    body = f"sleep {seconds + 5} | {command} >/dev/null" if command else f"sleep {seconds}"
+    result = await vm.run(
+        f"a=$(sysctl -n kern.cp_time); timeout {seconds} sh -c {shlex.quote(body)}; "
+        f"b=$(sysctl -n kern.cp_time); echo $a; echo $b", timeout=seconds + 60, check=True)
+    before, after = ([int(v) for v in line.split()] for line in result.lines()[-2:])
+    delta = [b - a for a, b in zip(before, after)]
+    # kern.cp_time: user nice sys intr idle
+    return CPUSample(sum(delta) - delta[4], sum(delta))
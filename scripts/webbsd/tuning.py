@@ -0,0 +1,117 @@
+"""EMULATOR_TUNING: boot and idle settings for a guest that runs under v86.
+
+Under v86 every timer interrupt, wakeup and background job is paid for by
+the visitor's CPU, and the stock image has plenty of them: a 1000 Hz
+clock, cron running periodic(8), newsyslog and save-entropy, sendmail's
+queue runners, and loader.conf lines for modules that are built into the
+kernel or no longer exist.  ``manifest()`` turns the image's current
+files into a manifest (see manifest.py) that
+
+  - sets kern.hz (KERN_HZ, default 100) and skips the boot-time memory
+    test in loader.conf
+  - drops the *_load lines of built-in or removed drivers from
+    loader.conf and loader.conf.local, and the Sound Blaster ones unless
+    the desktop profile has audio (see desktop.py)
+  - turns off cron, sendmail, dumps/savecore and motd updates in rc.conf,
+    and keeps syslogd (the layout's ready signal goes through it) off
+    the network
+  - comments the periodic, newsyslog, save-entropy and atrun jobs out of
+    /etc/crontab, so re-enabling cron does not bring them back
+  - mounts /tmp as tmpfs
+
+scripts/tune-guest.py applies it; scripts/bench-boot.mjs measures the
+result in v86.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+from .manifest import Entry, Manifest, render_rc_conf
+
+LOADER_CONF = "/boot/loader.conf"
+LOADER_CONF_LOCAL = "/boot/loader.conf.local"
+FSTAB = "/etc/fstab"
+CRONTAB = "/etc/crontab"
+FILES = (LOADER_CONF, LOADER_CONF_LOCAL, FSTAB, CRONTAB)
+
+DEFAULT_HZ = 100
+
+LOADER_SETTINGS = {
+    "hw.memtest.tests": "0",
+}
+
+# vtnet and virtio are in the 13.x GENERIC kernel; ed was removed, so its
+# line only sends the loader looking for a module that is not there.
+BUILTIN_MODULES = ("if_vtnet", "virtio", "virtio_pci", "if_ed")
+SOUND_MODULES = ("snd_sbc", "snd_sb16")
+
+RC_CONF_SETTINGS = {
+    "cron_enable": "NO",
+    "sendmail_enable": "NONE",
+    "sendmail_submit_enable": "NO",
+    "sendmail_outbound_enable": "NO",
+    "sendmail_msp_queue_enable": "NO",
+    "dumpdev": "NO",
+    "savecore_enable": "NO",
+    "update_motd": "NO",
+    "virecover_enable": "NO",
+    "syslogd_flags": "-ss",
+}
+
+CRON_JOBS = ("periodic", "newsyslog", "save-entropy", "atrun")
+
+TMPFS_LINE = "tmpfs\t\t\t/tmp\t\ttmpfs\trw,mode=1777\t0\t0"
+
+
+def _without_modules(current: str, audio: bool) -> List[str]:
+    modules = BUILTIN_MODULES + (() if audio else SOUND_MODULES)
+    pattern = re.compile(r"^\s*(" + "|".join(map(re.escape, modules)) + r")_load\s*=")
+    return [l for l in current.splitlines() if not pattern.match(l)]
+
+
+def loader_conf(current: str, hz: int = DEFAULT_HZ, audio: bool = True) -> str:
+    """current without the dropped module lines, with kern.hz and LOADER_SETTINGS."""
+    lines = _without_modules(current, audio)
+    return render_rc_conf("\n".join(lines), dict(LOADER_SETTINGS, **{"kern.hz": str(hz)}))
+
+
+def loader_conf_local(current: str, audio: bool = True) -> str:
+    """current without the dropped module lines."""
+    return "".join(l + "\n" for l in _without_modules(current, audio))
+
+
+def fstab(current: str) -> str:
+    """current with a tmpfs /tmp, unless something is mounted there already."""
+    lines = current.splitlines()
+    if not any(l.split()[1:2] == ["/tmp"] for l in lines if not l.lstrip().startswith("#")):
+        lines.append(TMPFS_LINE)
+    return "\n".join(lines) + "\n"
+
+
+def crontab(current: str, jobs: Iterable[str] = CRON_JOBS) -> str:
+    """current with the entries running jobs commented out."""
+    pattern = re.compile(r"[\s/](" + "|".join(map(re.escape, jobs)) + r")\b")
+    lines = ["#" + l if l.strip() and not l.lstrip().startswith("#") and pattern.search(l) else l
+             for l in current.splitlines()]
+    return "\n".join(lines) + "\n"
+
+
+def manifest(current: Dict[str, Optional[str]], hz: int = DEFAULT_HZ,
+             audio: bool = True) -> Manifest:
+    """The tuning as a manifest, from FILES' current contents (None: missing).
+
+    Missing optional files (loader.conf.local, crontab) are not created.
+    """
+    render = {
+        LOADER_CONF: lambda text: loader_conf(text, hz, audio),
+        LOADER_CONF_LOCAL: lambda text: loader_conf_local(text, audio),
+        FSTAB: fstab,
+        CRONTAB: crontab,
+    }
+    entries = []
+    for path in FILES:
+        text = current.get(path)
+        if text is None and path in (LOADER_CONF_LOCAL, CRONTAB):
+            continue
+        entries.append(Entry(path, render[path](text or "").encode(), 0o644, "root:wheel"))
+    return Manifest(entries, [], dict(RC_CONF_SETTINGS), [])
@@ -0,0 +1,771 @@
+"""Offline UFS2 reader/writer for the root partition of images/freebsd.img.
+
+Enough of FFS to read files and to create or replace regular files and
+directories while the image is not in use: GPT partition lookup, inode and
+directory access (following symlinks: FreeBSD 13.x's /home is one),
+fragment/block allocation in the cylinder groups, single and double
+indirect blocks, and the CK_SUPERBLOCK / CK_CYLGRP / CK_INODE crc32c
+check-hashes FreeBSD 12+ newfs enables.
+
+The filesystem must have been unmounted cleanly.  It is marked unclean
+while it is being modified and clean again by ``commit()``, so an
+interrupted run is caught by fsck on the next boot rather than trusted.
+Cylinder-group summaries are recomputed from the bitmaps the same way
+fsck_ffs pass 5 does, rather than patched incrementally.
+"""
+
+import os
+import posixpath
+import stat as statmod
+import struct
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+SBLOCK_UFS2 = 65536
+SBLOCKSIZE = 8192
+FS_UFS2_MAGIC = 0x19540119
+CG_MAGIC = 0x090255
+
+UFS_ROOTINO = 2
+UFS_NDADDR = 12
+UFS_NIADDR = 3
+DINODE_SIZE = 256
+DIRBLKSIZ = 512
+DEV_BSIZE = 512
+
+FS_UNCLEAN = 0x0001
+FS_NEEDSFSCK = 0x0004
+
+CK_SUPERBLOCK = 0x0001
+CK_CYLGRP = 0x0002
+CK_INODE = 0x0004
+
+DT_DIR = 4
+DT_REG = 8
+DT_LNK = 10
+
+# Targets shorter than this live in the inode itself (a "fast" symlink).
+MAXSYMLINKLEN = (UFS_NDADDR + UFS_NIADDR) * 8
+MAXSYMLINKS = 32
+
+# freebsd-ufs partition type, as stored on disk (mixed-endian GUID).
+GPT_FREEBSD_UFS = bytes.fromhex("b67c6e51cf6ed6118ff800022d09712b")
+
+# struct fs field offsets.
+_FS = {
+    "sblkno": (8, "i"), "cblkno": (12, "i"), "iblkno": (16, "i"), "dblkno": (20, "i"),
+    "ncg": (44, "I"), "bsize": (48, "i"), "fsize": (52, "i"), "frag": (56, "i"),
+    "sbsize": (104, "i"), "nindir": (116, "i"), "inopb": (120, "I"),
+    "cssize": (156, "i"), "cgsize": (160, "i"), "ipg": (184, "I"), "fpg": (188, "i"),
+    "fmod": (208, "b"), "clean": (209, "b"),
+    "cs_ndir": (1008, "q"), "cs_nbfree": (1016, "q"), "cs_nifree": (1024, "q"),
+    "cs_nffree": (1032, "q"), "time": (1072, "q"), "size": (1080, "q"),
+    "csaddr": (1096, "q"), "ckhash": (1304, "I"), "metackhash": (1308, "I"),
+    "flags": (1312, "i"), "contigsumsize": (1316, "i"), "magic": (1372, "i"),
+}
+
+# struct cg field offsets.
+_CG = {
+    "magic": (4, "i"), "cgx": (12, "I"), "ndblk": (20, "I"),
+    "cs_ndir": (24, "i"), "cs_nbfree": (28, "i"), "cs_nifree": (32, "i"), "cs_nffree": (36, "i"),
+    "iusedoff": (92, "I"), "freeoff": (96, "I"), "clustersumoff": (104, "I"),
+    "clusteroff": (108, "I"), "nclusterblks": (112, "I"), "niblk": (116, "I"),
+    "initediblk": (120, "I"), "ckhash": (132, "I"), "time": (136, "q"),
+}
+_CG_FRSUM = 52
+
+# struct ufs2_dinode field offsets.
+_DI = {
+    "mode": (0, "H"), "nlink": (2, "h"), "uid": (4, "I"), "gid": (8, "I"),
+    "size": (16, "Q"), "blocks": (24, "Q"), "atime": (32, "q"), "mtime": (40, "q"),
+    "ctime": (48, "q"), "birthtime": (56, "q"), "gen": (80, "I"), "flags": (88, "I"),
+    "ckhash": (244, "I"),
+}
+_DI_DB = 112
+_DI_IB = 208
+
+
+def _crc32c_table():
+    table = []
+    for i in range(256):
+        c = i
+        for _ in range(8):
+            c = (c >> 1) ^ 0x82F63B78 if c & 1 else c >> 1
+        table.append(c)
+    return table
+
+
+_CRC32C = _crc32c_table()
+
+
+def calculate_crc32c(data, crc=0xFFFFFFFF):
+    """crc32c as FreeBSD's calculate_crc32c(~0L, ...) computes it (no final xor)."""
+    table = _CRC32C
+    for b in data:
+        crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+def _get(buf, fields, name):
+    off, fmt = fields[name]
+    return struct.unpack_from("<" + fmt, buf, off)[0]
+
+
+def _put(buf, fields, name, value):
+    off, fmt = fields[name]
+    struct.pack_into("<" + fmt, buf, off, value)
+
+
+def _isset(bm, off, i):
+    return bm[off + (i >> 3)] >> (i & 7) & 1
+
+
+def _setbit(bm, off, i, on):
+    if on:
+        bm[off + (i >> 3)] |= 1 << (i & 7)
+    else:
+        bm[off + (i >> 3)] &= ~(1 << (i & 7)) & 0xFF
+
+
+def _direntsize(namlen):
+    return (8 + namlen + 1 + 3) & ~3
+
+
+class UFSError(Exception):
+    """The image or filesystem cannot be read or safely modified."""
+
+
+class Stat(NamedTuple):
+    ino: int
+    mode: int
+    uid: int
+    gid: int
+    size: int
+    nlink: int
+
+    @property
+    def is_dir(self):
+        return statmod.S_ISDIR(self.mode)
+
+
+def find_partition(f) -> int:
+    """Byte offset of the first freebsd-ufs GPT partition, or 0 for a bare UFS image."""
+    f.seek(SBLOCK_UFS2 + _FS["magic"][0])
+    if struct.unpack("<i", f.read(4))[0] == FS_UFS2_MAGIC:
+        return 0
+    f.seek(512)
+    hdr = f.read(92)
+    if hdr[:8] != b"EFI PART":
+        raise UFSError("no GPT header and no UFS2 superblock at offset 64K")
+    entries_lba, count, entsize = struct.unpack_from("<QII", hdr, 72)
+    f.seek(entries_lba * 512)
+    table = f.read(count * entsize)
+    for i in range(count):
+        ent = table[i * entsize:(i + 1) * entsize]
+        if ent[:16] == GPT_FREEBSD_UFS:
+            return struct.unpack_from("<Q", ent, 32)[0] * 512
+    raise UFSError("no freebsd-ufs partition in GPT")
+
+
+class UFS2:
+    """A UFS2 filesystem inside an image file, opened for reading or update."""
+
+    def __init__(self, path: str, writable: bool = False):
+        self.path = path
+        self.writable = writable
+        self.f = open(path, "r+b" if writable else "rb")
+        try:
+            self.base = find_partition(self.f)
+            self.sb = bytearray(self._pread(SBLOCK_UFS2, SBLOCKSIZE))
+        except Exception:
+            self.f.close()
+            raise
+        if self.sb_get("magic") != FS_UFS2_MAGIC:
+            self.f.close()
+            raise UFSError("not a UFS2 filesystem")
+        for name in ("bsize", "fsize", "frag", "ncg", "ipg", "fpg", "inopb",
+                     "nindir", "iblkno", "cblkno", "cgsize", "sbsize", "contigsumsize"):
+            setattr(self, name, self.sb_get(name))
+        self.metackhash = self.sb_get("metackhash")
+        self._cgs: Dict[int, bytearray] = {}
+        self._dirty_cgs = set()
+        self._ndir_delta: Dict[int, int] = {}
+        self._marked_unclean = False
+
+    @property
+    def modified(self) -> bool:
+        """True once writing has begun and until ``commit()``."""
+        return self._marked_unclean
+
+    # ── raw I/O ──────────────────────────────────────────────────────
+
+    def _pread(self, off, n):
+        self.f.seek(self.base + off)
+        data = self.f.read(n)
+        if len(data) != n:
+            raise UFSError(f"short read at {off}")
+        return data
+
+    def _pwrite(self, off, data):
+        self.f.seek(self.base + off)
+        self.f.write(data)
+
+    def sb_get(self, name):
+        return _get(self.sb, _FS, name)
+
+    def _read_frags(self, frag, nfrags):
+        return self._pread(frag * self.fsize, nfrags * self.fsize)
+
+    def _write_frags(self, frag, data):
+        self._pwrite(frag * self.fsize, data)
+
+    # ── cylinder groups ──────────────────────────────────────────────
+
+    def _cg(self, c) -> bytearray:
+        if c not in self._cgs:
+            buf = bytearray(self._read_frags(c * self.fpg + self.cblkno,
+                                             -(-self.cgsize // self.fsize)))[:self.cgsize]
+            if _get(buf, _CG, "magic") != CG_MAGIC:
+                raise UFSError(f"bad magic in cylinder group {c}")
+            self._cgs[c] = buf
+        return self._cgs[c]
+
+    def _frag_free(self, d):
+        cg = self._cg(d // self.fpg)
+        return _isset(cg, _get(cg, _CG, "freeoff"), d % self.fpg)
+
+    def _set_frags(self, d, n, free):
+        c = d // self.fpg
+        cg = self._cg(c)
+        off = _get(cg, _CG, "freeoff")
+        for i in range(d % self.fpg, d % self.fpg + n):
+            if bool(_isset(cg, off, i)) == free:
+                raise UFSError(f"fragment {c * self.fpg + i} is already "
+                               f"{'free' if free else 'allocated'}")
+            _setbit(cg, off, i, free)
+        self._dirty_cgs.add(c)
+
+    def _alloc(self, nfrags, pref_cg=0) -> int:
+        """Allocate nfrags (1..frag) contiguous fragments inside one block."""
+        for k in range(self.ncg):
+            c = (pref_cg + k) % self.ncg
+            d = self._alloc_in_cg(c, nfrags)
+            if d is not None:
+                self._set_frags(d, nfrags, False)
+                return d
+        raise UFSError("filesystem is full")
+
+    def _alloc_in_cg(self, c, nfrags):
+        cg = self._cg(c)
+        off = _get(cg, _CG, "freeoff")
+        ndblk = _get(cg, _CG, "ndblk")
+        frag = self.frag
+        best = None
+        for blk in range(0, ndblk - frag + 1, frag):
+            # Whole bytes of the map that are all-allocated are skipped fast.
+            if frag == 8 and cg[off + (blk >> 3)] == 0:
+                continue
+            run = start = 0
+            runs = []
+            for j in range(frag):
+                if _isset(cg, off, blk + j):
+                    if run == 0:
+                        start = j
+                    run += 1
+                else:
+                    if run:
+                        runs.append((start, run))
+                    run = 0
+            if run:
+                runs.append((start, run))
+            for start, length in runs:
+                if length == frag:
+                    if nfrags == frag:
+                        return c * self.fpg + blk
+                    if best is None:
+                        best = c * self.fpg + blk
+                elif length >= nfrags:
+                    # A partly used block that fits: best for fragments.
+                    return c * self.fpg + blk + start
+        return best
+
+    def _cg_summarize(self, c):
+        """Recompute a cylinder group's counts from its bitmaps (fsck pass 5 rules)."""
+        cg = self._cg(c)
+        off = _get(cg, _CG, "freeoff")
+        ndblk = _get(cg, _CG, "ndblk")
+        frag = self.frag
+        frsum = [0] * 8
+        nbfree = nffree = 0
+        clusters = []
+        for blk in range(0, ndblk, frag):
+            free = [_isset(cg, off, blk + j) if blk + j < ndblk else 0 for j in range(frag)]
+            if all(free):
+                nbfree += 1
+                clusters.append(1)
+                continue
+            clusters.append(0)
+            nffree += sum(free)
+            run = 0
+            for bit in free + [0]:
+                if bit:
+                    run += 1
+                elif run:
+                    frsum[run] += 1
+                    run = 0
+        _put(cg, _CG, "cs_nbfree", nbfree)
+        _put(cg, _CG, "cs_nffree", nffree)
+        struct.pack_into("<8i", cg, _CG_FRSUM, *frsum)
+
+        if self.contigsumsize > 0:
+            coff = _get(cg, _CG, "clusteroff")
+            soff = _get(cg, _CG, "clustersumoff")
+            nclusterblks = _get(cg, _CG, "nclusterblks")
+            sums = [0] * (self.contigsumsize + 1)
+            run = 0
+            for b in range(nclusterblks):
+                isfree = b < len(clusters) and clusters[b]
+                _setbit(cg, coff, b, isfree)
+                if isfree:
+                    run += 1
+                elif run:
+                    sums[min(run, self.contigsumsize)] += 1
+                    run = 0
+            if run:
+                sums[min(run, self.contigsumsize)] += 1
+            struct.pack_into(f"<{len(sums) - 1}i", cg, soff + 4, *sums[1:])
+
+        ioff = _get(cg, _CG, "iusedoff")
+        used = sum(bin(b).count("1") for b in cg[ioff:ioff + (self.ipg + 7) // 8])
+        _put(cg, _CG, "cs_nifree", self.ipg - used)
+        _put(cg, _CG, "cs_ndir", _get(cg, _CG, "cs_ndir") + self._ndir_delta.pop(c, 0))
+
+    # ── inodes ───────────────────────────────────────────────────────
+
+    def _ino_offset(self, ino):
+        c, i = divmod(ino, self.ipg)
+        frag = c * self.fpg + self.iblkno + (i // self.inopb) * self.frag
+        return frag * self.fsize + (i % self.inopb) * DINODE_SIZE
+
+    def _read_inode(self, ino) -> bytearray:
+        return bytearray(self._pread(self._ino_offset(ino), DINODE_SIZE))
+
+    def _write_inode(self, ino, di):
+        if self.metackhash & CK_INODE:
+            _put(di, _DI, "ckhash", 0)
+            _put(di, _DI, "ckhash", calculate_crc32c(di))
+        self._pwrite(self._ino_offset(ino), bytes(di))
+
+    def _alloc_inode(self, pref_cg, is_dir) -> int:
+        for k in range(self.ncg):
+            c = (pref_cg + k) % self.ncg
+            cg = self._cg(c)
+            off = _get(cg, _CG, "iusedoff")
+            for i in range(self.ipg):
+                if cg[off + (i >> 3)] == 0xFF:
+                    continue
+                if not _isset(cg, off, i):
+                    break
+            else:
+                continue
+            self._init_inode_blocks(c, i)
+            _setbit(cg, off, i, True)
+            self._dirty_cgs.add(c)
+            if is_dir:
+                self._ndir_delta[c] = self._ndir_delta.get(c, 0) + 1
+            return c * self.ipg + i
+        raise UFSError("out of inodes")
+
+    def _init_inode_blocks(self, c, i):
+        """Zero the lazily-initialized inode block(s) up to inode i, like ffs_nodealloccg."""
+        cg = self._cg(c)
+        niblk = _get(cg, _CG, "niblk")
+        while i + self.inopb > _get(cg, _CG, "initediblk") and _get(cg, _CG, "initediblk") < niblk:
+            first = _get(cg, _CG, "initediblk")
+            block = bytearray(self.inopb * DINODE_SIZE)
+            for k in range(self.inopb):
+                gen = 0
+                while gen == 0:
+                    gen = struct.unpack("<I", os.urandom(4))[0]
+                struct.pack_into("<I", block, k * DINODE_SIZE + _DI["gen"][0], gen)
+            self._pwrite(self._ino_offset(c * self.ipg + first), bytes(block))
+            _put(cg, _CG, "initediblk", first + self.inopb)
+
+    # ── block maps ───────────────────────────────────────────────────
+
+    def _blocks(self, di) -> List[int]:
+        """Data block addresses of an inode, in logical order (0 for holes)."""
+        size = _get(di, _DI, "size")
+        nblocks = -(-size // self.bsize)
+        ptrs = list(struct.unpack_from("<12q", di, _DI_DB))[:nblocks]
+        if nblocks > UFS_NDADDR:
+            ind = struct.unpack_from("<3q", di, _DI_IB)
+            ptrs += self._indirect(ind[0], 1)[:nblocks - len(ptrs)]
+            if nblocks > len(ptrs):
+                ptrs += self._indirect(ind[1], 2)[:nblocks - len(ptrs)]
+            if nblocks > len(ptrs):
+                raise UFSError("triple-indirect files are not supported")
+        return ptrs
+
+    def _indirect(self, d, level):
+        if d == 0:
+            return [0] * (self.nindir ** level)
+        ptrs = struct.unpack(f"<{self.nindir}q", self._read_frags(d, self.frag))
+        if level == 1:
+            return list(ptrs)
+        out = []
+        for p in ptrs:
+            out += self._indirect(p, level - 1)
+        return out
+
+    def _meta_blocks(self, di) -> List[int]:
+        """Indirect block addresses of an inode."""
+        ind = struct.unpack_from("<3q", di, _DI_IB)
+        out = [d for d in ind[:1] if d]
+        if ind[1]:
+            out.append(ind[1])
+            out += [d for d in struct.unpack(f"<{self.nindir}q",
+                                             self._read_frags(ind[1], self.frag)) if d]
+        return out
+
+    def _last_frags(self, size, lbn):
+        if lbn >= UFS_NDADDR or size >= (lbn + 1) * self.bsize:
+            return self.frag
+        return -(-(size - lbn * self.bsize) // self.fsize)
+
+    def _read_data(self, di) -> bytes:
+        size = _get(di, _DI, "size")
+        out = bytearray()
+        for lbn, d in enumerate(self._blocks(di)):
+            n = self._last_frags(size, lbn)
+            out += self._read_frags(d, n) if d else bytes(n * self.fsize)
+        return bytes(out[:size])
+
+    def _free_data(self, di) -> int:
+        """Release every data and indirect block of an inode; returns frags freed."""
+        size = _get(di, _DI, "size")
+        freed = 0
+        for lbn, d in enumerate(self._blocks(di)):
+            if d:
+                n = self._last_frags(size, lbn)
+                self._set_frags(d, n, True)
+                freed += n
+        for d in self._meta_blocks(di):
+            self._set_frags(d, self.frag, True)
+            freed += self.frag
+        struct.pack_into("<12q", di, _DI_DB, *([0] * UFS_NDADDR))
+        struct.pack_into("<3q", di, _DI_IB, 0, 0, 0)
+        return freed
+
+    def _write_data(self, ino, di, data):
+        """Replace an inode's contents with data, reallocating all of its blocks."""
+        pref = ino // self.ipg
+        freed = self._free_data(di)
+        nblocks = -(-len(data) // self.bsize)
+        if nblocks > UFS_NDADDR + self.nindir + self.nindir ** 2:
+            raise UFSError("file too large")
+        used = 0
+        ptrs = []
+        for lbn in range(nblocks):
+            n = self._last_frags(len(data), lbn)
+            d = self._alloc(n, pref)
+            chunk = data[lbn * self.bsize:lbn * self.bsize + n * self.fsize]
+            self._write_frags(d, chunk.ljust(n * self.fsize, b"\0"))
+            ptrs.append(d)
+            used += n
+        struct.pack_into("<12q", di, _DI_DB, *(ptrs[:UFS_NDADDR] + [0] * (UFS_NDADDR - len(ptrs[:UFS_NDADDR]))))
+        rest = ptrs[UFS_NDADDR:]
+        ib = [0, 0, 0]
+        if rest:
+            ib[0], n = self._write_indirect(rest[:self.nindir], pref)
+            used += n
+            rest = rest[self.nindir:]
+        if rest:
+            level1 = []
+            for i in range(0, len(rest), self.nindir):
+                d, n = self._write_indirect(rest[i:i + self.nindir], pref)
+                level1.append(d)
+                used += n
+            ib[1], n = self._write_indirect(level1, pref)
+            used += n
+        struct.pack_into("<3q", di, _DI_IB, *ib)
+        _put(di, _DI, "size", len(data))
+        sectors = _get(di, _DI, "blocks") + (used - freed) * (self.fsize // DEV_BSIZE)
+        _put(di, _DI, "blocks", sectors)
+
+    def _write_indirect(self, ptrs, pref):
+        d = self._alloc(self.frag, pref)
+        body = struct.pack(f"<{len(ptrs)}q", *ptrs).ljust(self.bsize, b"\0")
+        self._write_frags(d, body)
+        return d, self.frag
+
+    # ── directories ──────────────────────────────────────────────────
+
+    def _entries(self, data) -> List[Tuple[int, int, int, int, bytes]]:
+        """(offset, ino, reclen, type, name) for every slot in a directory."""
+        out = []
+        for chunk in range(0, len(data), DIRBLKSIZ):
+            off = chunk
+            while off < chunk + DIRBLKSIZ:
+                ino, reclen, dtype, namlen = struct.unpack_from("<IHBB", data, off)
+                if reclen == 0:
+                    raise UFSError("corrupt directory entry")
+                out.append((off, ino, reclen, dtype, bytes(data[off + 8:off + 8 + namlen])))
+                off += reclen
+        return out
+
+    def _lookup(self, dir_ino, name: bytes) -> Optional[int]:
+        data = self._read_data(self._read_inode(dir_ino))
+        for _, ino, _, _, n in self._entries(data):
+            if ino and n == name:
+                return ino
+        return None
+
+    def _add_entry(self, dir_ino, name: bytes, ino, dtype):
+        di = self._read_inode(dir_ino)
+        data = bytearray(self._read_data(di))
+        need = _direntsize(len(name))
+        entry = None
+        for off, eino, reclen, _, ename in self._entries(data):
+            used = _direntsize(len(ename)) if eino else 0
+            if reclen - used >= need:
+                if eino:
+                    struct.pack_into("<H", data, off + 4, used)
+                    entry = (off + used, reclen - used)
+                else:
+                    entry = (off, reclen)
+                break
+        if entry is None:
+            entry = (len(data), DIRBLKSIZ)
+            data += bytes(DIRBLKSIZ)
+        off, reclen = entry
+        struct.pack_into("<IHBB", data, off, ino, reclen, dtype, len(name))
+        data[off + 8:off + need] = name.ljust(need - 8, b"\0")
+        self._write_data(dir_ino, di, bytes(data))
+        now = int(time.time())
+        _put(di, _DI, "mtime", now)
+        _put(di, _DI, "ctime", now)
+        if dtype == DT_DIR:
+            _put(di, _DI, "nlink", _get(di, _DI, "nlink") + 1)
+        self._write_inode(dir_ino, di)
+
+    # ── public API ───────────────────────────────────────────────────
+
+    def _readlink(self, di) -> str:
+        size = _get(di, _DI, "size")
+        if size < MAXSYMLINKLEN and _get(di, _DI, "blocks") == 0:
+            data = bytes(di[_DI_DB:_DI_DB + size])
+        else:
+            data = self._read_data(di)
+        return data.decode(errors="surrogateescape")
+
+    def _resolve(self, path: str) -> Tuple[Optional[int], str]:
+        """(inode or None, path without symlinks) for an absolute path.
+
+        Symlinks are followed in every component, the last one included;
+        a relative target restarts from the link's directory.  When a
+        component does not exist the rest of path is appended unresolved.
+        """
+        todo = [p for p in path.split("/") if p][::-1]
+        walked = [(UFS_ROOTINO, "")]
+        links = 0
+        while todo:
+            part = todo.pop()
+            if part == ".":
+                continue
+            if part == "..":
+                if len(walked) > 1:
+                    walked.pop()
+                continue
+            parent = walked[-1][0]
+            ino = None
+            if statmod.S_ISDIR(_get(self._read_inode(parent), _DI, "mode")):
+                ino = self._lookup(parent, part.encode())
+            if ino is None:
+                names = [n for _, n in walked[1:]] + [part] + todo[::-1]
+                return None, posixpath.normpath("/" + "/".join(names))
+            di = self._read_inode(ino)
+            if statmod.S_ISLNK(_get(di, _DI, "mode")):
+                links += 1
+                if links > MAXSYMLINKS:
+                    raise UFSError(f"{path}: too many levels of symbolic links")
+                target = self._readlink(di)
+                if target.startswith("/"):
+                    walked = walked[:1]
+                todo += [p for p in target.split("/") if p][::-1]
+                continue
+            walked.append((ino, part))
+        return walked[-1][0], "/" + "/".join(n for _, n in walked[1:])
+
+    def namei(self, path: str) -> Optional[int]:
+        """Inode number of an absolute path, or None if it does not exist.
+
+        Symlinks are followed (FreeBSD's /home is one, to usr/home).
+        """
+        return self._resolve(path)[0]
+
+    def realpath(self, path: str) -> str:
+        """path with every symlink resolved, like realpath -m."""
+        return self._resolve(path)[1]
+
+    def stat(self, path: str) -> Optional[Stat]:
+        ino = self.namei(path)
+        if ino is None:
+            return None
+        di = self._read_inode(ino)
+        return Stat(ino, _get(di, _DI, "mode"), _get(di, _DI, "uid"), _get(di, _DI, "gid"),
+                    _get(di, _DI, "size"), _get(di, _DI, "nlink"))
+
+    def read_file(self, path: str) -> bytes:
+        ino = self.namei(path)
+        if ino is None:
+            raise UFSError(f"{path}: no such file")
+        return self._read_data(self._read_inode(ino))
+
+    def listdir(self, path: str) -> List[str]:
+        ino = self.namei(path)
+        if ino is None:
+            raise UFSError(f"{path}: no such directory")
+        data = self._read_data(self._read_inode(ino))
+        return [n.decode(errors="replace") for _, i, _, _, n in self._entries(data)
+                if i and n not in (b".", b"..")]
+
+    def _begin(self):
+        """Mark the filesystem unclean before the first modification."""
+        if not self.writable:
+            raise UFSError("image opened read-only")
+        if self._marked_unclean:
+            return
+        if self.sb_get("clean") != 1 or self.sb_get("flags") & (FS_UNCLEAN | FS_NEEDSFSCK):
+            raise UFSError("filesystem is not clean; boot the image once (fsck) first")
+        _put(self.sb, _FS, "clean", 0)
+        self._write_sb()
+        self._marked_unclean = True
+
+    def _split(self, path):
+        parent, _, name = path.rstrip("/").rpartition("/")
+        if not name or not path.startswith("/"):
+            raise UFSError(f"{path}: need an absolute path")
+        pino = self.namei(parent or "/")
+        if pino is None:
+            raise UFSError(f"{parent}: no such directory")
+        return pino, name.encode()
+
+    def _new_inode(self, pino, mode, uid, gid, is_dir):
+        ino = self._alloc_inode(pino // self.ipg, is_dir)
+        di = self._read_inode(ino)
+        gen = _get(di, _DI, "gen") or struct.unpack("<I", os.urandom(4))[0] | 1
+        di[:] = bytes(DINODE_SIZE)
+        now = int(time.time())
+        for field in ("atime", "mtime", "ctime", "birthtime"):
+            _put(di, _DI, field, now)
+        _put(di, _DI, "gen", gen)
+        _put(di, _DI, "mode", mode)
+        _put(di, _DI, "uid", uid)
+        _put(di, _DI, "gid", gid)
+        _put(di, _DI, "nlink", 2 if is_dir else 1)
+        return ino, di
+
+    def mkdir(self, path: str, mode: int = 0o755, uid: int = 0, gid: int = 0) -> int:
+        self._begin()
+        pino, name = self._split(path)
+        if self._lookup(pino, name) is not None:
+            raise UFSError(f"{path}: already exists")
+        ino, di = self._new_inode(pino, statmod.S_IFDIR | mode, uid, gid, True)
+        body = bytearray(DIRBLKSIZ)
+        struct.pack_into("<IHBB", body, 0, ino, 12, DT_DIR, 1)
+        body[8:9] = b"."
+        struct.pack_into("<IHBB", body, 12, pino, DIRBLKSIZ - 12, DT_DIR, 2)
+        body[20:22] = b".."
+        self._write_data(ino, di, bytes(body))
+        self._write_inode(ino, di)
+        self._add_entry(pino, name, ino, DT_DIR)
+        return ino
+
+    def makedirs(self, path: str, mode: int = 0o755, uid: int = 0, gid: int = 0) -> None:
+        """mkdir -p; existing components are left as they are."""
+        cur = ""
+        for part in [p for p in path.split("/") if p]:
+            cur += "/" + part
+            st = self.stat(cur)
+            if st is None:
+                self.mkdir(cur, mode, uid, gid)
+            elif not st.is_dir:
+                raise UFSError(f"{cur}: not a directory")
+
+    def write_file(self, path: str, data: bytes, mode: int = 0o644,
+                   uid: int = 0, gid: int = 0) -> int:
+        """Create or replace a regular file; an existing inode is reused."""
+        self._begin()
+        path = self.realpath(path)
+        pino, name = self._split(path)
+        ino = self._lookup(pino, name)
+        if ino is None:
+            ino, di = self._new_inode(pino, statmod.S_IFREG | mode, uid, gid, False)
+            self._write_data(ino, di, data)
+            self._write_inode(ino, di)
+            self._add_entry(pino, name, ino, DT_REG)
+            return ino
+        di = self._read_inode(ino)
+        if not statmod.S_ISREG(_get(di, _DI, "mode")):
+            raise UFSError(f"{path}: exists and is not a regular file")
+        self._write_data(ino, di, data)
+        now = int(time.time())
+        _put(di, _DI, "mode", statmod.S_IFREG | mode)
+        _put(di, _DI, "uid", uid)
+        _put(di, _DI, "gid", gid)
+        _put(di, _DI, "mtime", now)
+        _put(di, _DI, "ctime", now)
+        self._write_inode(ino, di)
+        return ino
+
+    def _write_sb(self):
+        if self.metackhash & CK_SUPERBLOCK:
+            _put(self.sb, _FS, "ckhash", 0)
+            _put(self.sb, _FS, "ckhash", calculate_crc32c(self.sb[:self.sbsize]))
+        self._pwrite(SBLOCK_UFS2, bytes(self.sb[:self.sbsize]))
+
+    def commit(self) -> None:
+        """Write back cylinder groups and summaries and mark the filesystem clean."""
+        if not self._marked_unclean:
+            return
+        now = int(time.time())
+        totals = {k: 0 for k in ("cs_ndir", "cs_nbfree", "cs_nifree", "cs_nffree")}
+        dirty = sorted(self._dirty_cgs | set(self._ndir_delta))
+        for c in dirty:
+            cg = self._cg(c)
+            before = {k: _get(cg, _CG, k) for k in totals}
+            self._cg_summarize(c)
+            for k in totals:
+                totals[k] += _get(cg, _CG, k) - before[k]
+            _put(cg, _CG, "time", now)
+            if self.metackhash & CK_CYLGRP:
+                _put(cg, _CG, "ckhash", 0)
+                _put(cg, _CG, "ckhash", calculate_crc32c(cg))
+            self._pwrite((c * self.fpg + self.cblkno) * self.fsize, bytes(cg))
+            # Per-cg summary copy in the fs_csaddr area.
+            csum = struct.pack("<4i", *(_get(cg, _CG, k) for k in
+                                        ("cs_ndir", "cs_nbfree", "cs_nifree", "cs_nffree")))
+            self._pwrite(self.sb_get("csaddr") * self.fsize + c * 16, csum)
+        for k, delta in totals.items():
+            _put(self.sb, _FS, k, self.sb_get(k) + delta)
+        _put(self.sb, _FS, "time", now)
+        _put(self.sb, _FS, "fmod", 0)
+        _put(self.sb, _FS, "clean", 1)
+        self._write_sb()
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self._dirty_cgs.clear()
+        self._marked_unclean = False
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # On error the filesystem stays marked unclean so fsck repairs it.
+        if exc_type is None and self.writable:
+            self.commit()
+        self.close()
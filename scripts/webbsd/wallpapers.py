@@ -0,0 +1,193 @@
+"""Host-side wallpaper preparation for the i3 desktop.
+
+The desktop used to git clone the whole freebsd-wallpapers repo into the
+guest and have feh ``--bg-fill`` a random full-size PNG every five minutes:
+a large PNG decode and a software rescale on the emulated i386 each time,
+plus every wallpaper in the repo on disk and in the saved state.
+
+Here the configured wallpapers are picked on the host, scaled and
+center-cropped to X11_RESOLUTION, and re-encoded as baseline JPEG (fast to
+decode, a fraction of the PNG size).  Sources are deduplicated by content
+hash, and each rendered file is named after that hash and kept under
+images/cache/wallpapers/ so later runs only render what is new.  Only the
+rendered files go into the image; since they match the screen exactly,
+the cycle script shows them with ``feh --bg-center``, a plain blit.
+
+Rendering needs Pillow (``pip install Pillow``) on the host.
+"""
+
+import fnmatch
+import hashlib
+import io
+import os
+import subprocess
+from typing import List, NamedTuple, Sequence, Tuple
+
+from . import IMAGES_DIR
+from .manifest import Entry
+
+GUEST_DIR = "/usr/local/share/wallpapers/webbsd"
+# Where the in-guest clone used to go.
+LEGACY_DIR = "/usr/local/share/wallpapers/freebsd-wallpapers"
+CACHE_DIR = os.path.join(IMAGES_DIR, "cache", "wallpapers")
+
+DEFAULT_REPO = "https://github.com/fuzzy/freebsd-wallpapers"
+DEFAULT_INTERVAL = 300
+EXTENSIONS = (".png", ".jpg", ".jpeg")
+QUALITY = 90
+# Bump when the rendering changes, so cached renders are redone.
+RENDER_VERSION = 1
+
+
+class WallpaperError(Exception):
+    pass
+
+
+class Wallpaper(NamedTuple):
+    name: str  # file name in GUEST_DIR
+    source: str
+    data: bytes
+
+
+def parse_resolution(text: str) -> Tuple[int, int]:
+    try:
+        w, h = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise WallpaperError(f"bad resolution: {text!r}") from None
+    return w, h
+
+
+def fetch_repo(url: str, dest: str) -> str:
+    """Shallow clone url into dest on the host, or fast-forward it."""
+    if os.path.isdir(os.path.join(dest, ".git")):
+        cmd = ["git", "-C", dest, "pull", "--ff-only", "-q"]
+    else:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        cmd = ["git", "clone", "--depth", "1", "-q", url, dest]
+    try:
+        subprocess.run(cmd, check=True)
+    except FileNotFoundError:
+        raise WallpaperError("git not found") from None
+    except subprocess.CalledProcessError as e:
+        if os.path.isdir(os.path.join(dest, ".git")):
+            print(f"  WARN: {' '.join(cmd[:4])} failed (exit {e.returncode}); using the old checkout")
+        else:
+            raise WallpaperError(f"cannot clone {url} (exit {e.returncode})") from None
+    return dest
+
+
+def find_sources(paths: Sequence[str], patterns: Sequence[str] = ()) -> List[str]:
+    """Image files under paths (files or directories), filtered by name.
+
+    patterns are fnmatch globs on the file name; none means every image.
+    """
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if not name.lower().endswith(EXTENSIONS):
+                    continue
+                if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+                    continue
+                found.append(os.path.join(root, name))
+    return found
+
+
+def render(data: bytes, size: Tuple[int, int]) -> bytes:
+    """data scaled to cover size, center-cropped, as baseline JPEG."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise WallpaperError("rendering wallpapers needs Pillow (pip install Pillow)") from None
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (0, 0, 0))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        img = ImageOps.fit(img, size, Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=QUALITY, subsampling="4:2:0",
+                 optimize=True, progressive=False)
+    return out.getvalue()
+
+
+def prepare(sources: Sequence[str], size: Tuple[int, int],
+            cache_dir: str = CACHE_DIR, log=print) -> List[Wallpaper]:
+    """Render each distinct source once; cached renders are reused."""
+    out_dir = os.path.join(cache_dir, f"{size[0]}x{size[1]}-v{RENDER_VERSION}")
+    os.makedirs(out_dir, exist_ok=True)
+    wallpapers, seen = [], {}
+    for src in sources:
+        with open(src, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        if digest in seen:
+            log(f"  skip {os.path.basename(src)} (same as {os.path.basename(seen[digest])})")
+            continue
+        seen[digest] = src
+        name = f"{digest}.jpg"
+        cached = os.path.join(out_dir, name)
+        if os.path.exists(cached):
+            with open(cached, "rb") as f:
+                rendered = f.read()
+        else:
+            try:
+                rendered = render(data, size)
+            except OSError as e:
+                log(f"  skip {os.path.basename(src)} ({e})")
+                continue
+            with open(cached + ".tmp", "wb") as f:
+                f.write(rendered)
+            os.replace(cached + ".tmp", cached)
+            log(f"  {os.path.basename(src)}: {len(data)} -> {len(rendered)} bytes")
+        wallpapers.append(Wallpaper(name, src, rendered))
+    return wallpapers
+
+
+def pick_script(guest_dir: str = GUEST_DIR) -> str:
+    """cycle-wp.sh: show one random wallpaper (also the i3bar button)."""
+    return f"""#!/bin/sh
+# Show a random wallpaper.  They are pre-scaled to the screen size on the
+# host (scripts/prepare-wallpapers.py), so feh only has to blit one.
+wp=$(ls {guest_dir}/*.jpg 2>/dev/null | sort -R | head -1)
+[ -n "$wp" ] && exec feh --no-fehbg --bg-center "$wp"
+"""
+
+
+def cycle_script(pick: str, interval: int = DEFAULT_INTERVAL) -> str:
+    """wallpaper-cycle.sh: run from i3, picks a new wallpaper every interval."""
+    return f"""#!/bin/sh
+# Cycle wallpapers every {interval} seconds.
+{pick}
+while sleep {interval}; do
+    {pick}
+done
+"""
+
+
+def entries(wallpapers: Sequence[Wallpaper], home: str, owner: str,
+            interval: int = DEFAULT_INTERVAL, guest_dir: str = GUEST_DIR,
+            cycle: bool = True) -> List[Entry]:
+    """Manifest entries for the wallpapers and the i3 scripts.
+
+    Without cycle only cycle-wp.sh is written, for one pick at login.
+    """
+    pick = f"{home}/.config/i3/cycle-wp.sh"
+    result = [Entry(guest_dir, None, 0o755, "root:wheel")]
+    result += [Entry(f"{guest_dir}/{w.name}", w.data, 0o644, "root:wheel") for w in wallpapers]
+    result.append(Entry(pick, pick_script(guest_dir).encode(), 0o755, owner))
+    if cycle:
+        result.append(Entry(f"{home}/.config/i3/wallpaper-cycle.sh",
+                            cycle_script(pick, interval).encode(), 0o755, owner))
+    return result
+
+
+def stale(listing: Sequence[str], wallpapers: Sequence[Wallpaper]) -> List[str]:
+    """Files in the guest directory that are no longer configured."""
+    keep = {w.name for w in wallpapers}
+    return sorted(n for n in listing if n not in keep)